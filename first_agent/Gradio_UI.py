@@ -15,8 +15,11 @@
 # limitations under the License.
 import mimetypes
 import os
+import queue
 import re
 import shutil
+import threading
+from contextlib import nullcontext
 from typing import Optional
 
 from smolagents.agent_types import AgentAudio, AgentImage, AgentText, handle_agent_output_types
@@ -24,6 +27,17 @@ from smolagents.agents import ActionStep, MultiStepAgent
 from smolagents.memory import MemoryStep
 from smolagents.utils import _is_package_available
 
+from first_agent.context_tools import AgentContext, bind_context
+from first_agent.models import stream_tokens
+from first_agent.sanitize import clean_code, clean_model_output, clean_observations
+from first_agent.usage import step_usage
+
+# older messages are folded into a placeholder, FOLD_BATCH at a time so the rendered list shifts rarely
+MAX_RENDERED_MESSAGES = 200
+FOLD_BATCH = 50
+# nested logs longer than this are sent as a preview, the rest is loaded when the message is clicked
+LOG_PREVIEW_CHARS = 2000
+
 
 def pull_messages_from_step(
     step_log: MemoryStep,
@@ -38,14 +52,8 @@ def pull_messages_from_step(
 
         # First yield the thought/reasoning from the LLM
         if hasattr(step_log, 'model_output') and step_log.model_output is not None:
-            # Clean up the LLM output
-            model_output = step_log.model_output.strip()
-            # Remove any trailing <end_code> and extra backticks, handling multiple possible formats
-            model_output = re.sub(r'```\s*<end_code>', '```', model_output)  # handles ```<end_code>
-            model_output = re.sub(r'<end_code>\s*```', '```', model_output)  # handles <end_code>```
-            model_output = re.sub(r'```\s*\n\s*<end_code>', '```', model_output)  # handles ```\n<end_code>
-            model_output = model_output.strip()
-            yield gr.ChatMessage(role='assistant', content=model_output)
+            # Clean up the LLM output: remove any trailing <end_code> and extra backticks
+            yield gr.ChatMessage(role='assistant', content=clean_model_output(step_log.model_output))
 
         # For tool calls, create a parent message
         if hasattr(step_log, 'tool_calls') and step_log.tool_calls is not None:
@@ -62,12 +70,8 @@ def pull_messages_from_step(
                 content = str(args).strip()
 
             if used_code:
-                # Clean up the content by removing any end code tags
-                content = re.sub(r'```.*?\n', '', content)  # Remove existing code blocks
-                content = re.sub(r'\s*<end_code>\s*', '', content)  # Remove end_code tags
-                content = content.strip()
-                if not content.startswith('```python'):
-                    content = f'```python\n{content}\n```'
+                # Clean up the content by removing any end code tags and existing code blocks
+                content = clean_code(content)
 
             parent_message_tool = gr.ChatMessage(
                 role='assistant',
@@ -81,21 +85,18 @@ def pull_messages_from_step(
             yield parent_message_tool
 
             # Nesting execution logs under the tool call if they exist
-            if hasattr(step_log, 'observations') and (
-                step_log.observations is not None and step_log.observations.strip()
-            ):  # Only yield execution logs if there's actual content
-                log_content = step_log.observations.strip()
-                if log_content:
-                    log_content = re.sub(r'^Execution logs:\s*', '', log_content)
-                    yield gr.ChatMessage(
-                        role='assistant',
-                        content=f'{log_content}',
-                        metadata={
-                            'title': '📝 Execution Logs',
-                            'parent_id': parent_id,
-                            'status': 'done',
-                        },
-                    )
+            observations = getattr(step_log, 'observations', None)
+            # Only yield execution logs if there's actual content, isspace() avoids copying large logs
+            if observations and not observations.isspace():
+                yield gr.ChatMessage(
+                    role='assistant',
+                    content=clean_observations(observations),
+                    metadata={
+                        'title': '📝 Execution Logs',
+                        'parent_id': parent_id,
+                        'status': 'done',
+                    },
+                )
 
             # Nesting any errors under the tool call
             if hasattr(step_log, 'error') and step_log.error is not None:
@@ -140,17 +141,13 @@ def stream_to_gradio(
         )
     import gradio as gr
 
-    total_input_tokens = 0
-    total_output_tokens = 0
-
     for step_log in agent.run(task, stream=True, reset=reset_agent_memory, additional_args=additional_args):
-        # Track tokens if model provides them
-        if hasattr(agent.model, 'last_input_token_count'):
-            total_input_tokens += agent.model.last_input_token_count
-            total_output_tokens += agent.model.last_output_token_count
-            if isinstance(step_log, ActionStep):
-                step_log.input_token_count = agent.model.last_input_token_count
-                step_log.output_token_count = agent.model.last_output_token_count
+        # the tokens of the step's own model call, a UsageMeter may have stored them already
+        if isinstance(step_log, ActionStep) and not hasattr(step_log, 'input_token_count'):
+            usage = step_usage(step_log)
+            if usage is not None:
+                step_log.input_token_count = usage.input_tokens
+                step_log.output_token_count = usage.output_tokens
 
         for message in pull_messages_from_step(
             step_log,
@@ -179,29 +176,124 @@ def stream_to_gradio(
         yield gr.ChatMessage(role='assistant', content=f'**Final answer:** {final_answer!s}')
 
 
+class MessageWindow:
+    """Chat history of a session, of which only the newest messages are rendered"""
+
+    def __init__(
+        self,
+        max_rendered: int = MAX_RENDERED_MESSAGES,
+        fold_batch: int = FOLD_BATCH,
+        preview_chars: int = LOG_PREVIEW_CHARS,
+    ):
+        self.messages: list = []
+        self.max_rendered = max_rendered
+        self.fold_batch = fold_batch
+        self.preview_chars = preview_chars
+        # history index -> content of a log that is shown as a preview
+        self.full_contents: dict[int, str] = {}
+
+    def append(self, message) -> None:
+        content = message.content
+        if isinstance(content, str) and message.metadata.get('parent_id') and len(content) > self.preview_chars:
+            self.full_contents[len(self.messages)] = content
+            rest = len(content) - self.preview_chars
+            message.content = f'{content[: self.preview_chars]}\n\n_... {rest:,} more characters, click to load_'
+        self.messages.append(message)
+
+    def pop(self) -> None:
+        self.full_contents.pop(len(self.messages) - 1, None)
+        self.messages.pop()
+
+    @property
+    def hidden(self) -> int:
+        excess = len(self.messages) - self.max_rendered
+        return 0 if excess <= 0 else -(-excess // self.fold_batch) * self.fold_batch
+
+    def rendered(self) -> list:
+        import gradio as gr
+
+        hidden = self.hidden
+        if not hidden:
+            return list(self.messages)
+        placeholder = gr.ChatMessage(role='assistant', content=f'_{hidden} earlier messages hidden, click to show_')
+        return [placeholder, *self.messages[hidden:]]
+
+    def select(self, index: int) -> None:
+        """Clicked message: the placeholder shows older messages, a log preview loads the full log"""
+        hidden = self.hidden
+        if hidden and index == 0:
+            self.max_rendered += self.fold_batch
+            return
+        history_index = index - 1 + hidden if hidden else index
+        content = self.full_contents.pop(history_index, None)
+        if content is not None:
+            self.messages[history_index].content = content
+
+
 class GradioUI:
     """A one-line interface to launch your agent in Gradio"""
 
-    def __init__(self, agent: MultiStepAgent, file_upload_folder: str | None = None):
+    def __init__(
+        self, agent: MultiStepAgent, file_upload_folder: str | None = None, context: AgentContext | None = None
+    ):
         if not _is_package_available('gradio'):
             raise ModuleNotFoundError(
                 "Please install 'gradio' extra to use the GradioUI: `pip install 'smolagents[gradio]'`"
             )
         self.agent = agent
+        # bound while the agent runs, for its context tools
+        self.context = context
         self.file_upload_folder = file_upload_folder
         if self.file_upload_folder is not None:
             if not os.path.exists(file_upload_folder):
                 os.mkdir(file_upload_folder)
 
-    def interact_with_agent(self, prompt, messages):
+    def _run_agent(self, prompt: str, events: queue.Queue) -> None:
+        bound = bind_context(self.context) if self.context is not None else nullcontext()
+        try:
+            with bound, stream_tokens(self.agent.model, lambda text: events.put(('token', text))):
+                for msg in stream_to_gradio(self.agent, task=prompt, reset_agent_memory=False):
+                    events.put(('message', msg))
+        except Exception as e:
+            events.put(('error', e))
+        finally:
+            events.put(('done', None))
+
+    def interact_with_agent(self, prompt, window: MessageWindow):
+        """Streams the run: model tokens go into a live message that the step's messages then replace"""
         import gradio as gr
 
-        messages.append(gr.ChatMessage(role='user', content=prompt))
-        yield messages
-        for msg in stream_to_gradio(self.agent, task=prompt, reset_agent_memory=False):
-            messages.append(msg)
-            yield messages
-        yield messages
+        window.append(gr.ChatMessage(role='user', content=prompt))
+        yield window.rendered()
+        events: queue.Queue = queue.Queue()
+        threading.Thread(target=self._run_agent, args=(prompt, events), daemon=True).start()
+        live = None
+        done = False
+        while not done:
+            batch = [events.get()]
+            # everything that arrived while the last update was rendered goes out as one update
+            while True:
+                try:
+                    batch.append(events.get_nowait())
+                except queue.Empty:
+                    break
+            for kind, value in batch:
+                if kind == 'token':
+                    if live is None:
+                        live = gr.ChatMessage(role='assistant', content='', metadata={'title': '✍️ Generating'})
+                        window.append(live)
+                    live.content += value
+                    continue
+                if live is not None:
+                    window.pop()
+                    live = None
+                if kind == 'message':
+                    window.append(value)
+                elif kind == 'error':
+                    window.append(gr.ChatMessage(role='assistant', content=f'Error: {value}'))
+                else:
+                    done = True
+            yield window.rendered()
 
     def upload_file(
         self,
@@ -270,6 +362,7 @@ class GradioUI:
 
         with gr.Blocks(fill_height=True) as demo:
             stored_messages = gr.State([])
+            window = gr.State(MessageWindow)
             file_uploads_log = gr.State([])
             chatbot = gr.Chatbot(
                 label='Agent',
@@ -295,7 +388,13 @@ class GradioUI:
                 self.log_user_message,
                 [text_input, file_uploads_log],
                 [stored_messages, text_input],
-            ).then(self.interact_with_agent, [stored_messages, chatbot], [chatbot])
+            ).then(self.interact_with_agent, [stored_messages, window], [chatbot])
+
+            def select_message(window: MessageWindow, evt: gr.SelectData):
+                window.select(evt.index if isinstance(evt.index, int) else evt.index[0])
+                return window.rendered()
+
+            chatbot.select(select_message, [window], [chatbot])
 
         demo.launch(debug=True, share=False, **kwargs)
 
@@ -1,95 +1,139 @@
+import argparse
 import logging
-from pathlib import Path
-
-import yaml
-from smolagents import CodeAgent, DuckDuckGoSearchTool, HfApiModel, OpenAIServerModel, load_tool
-
-from first_agent.context_tools import (
-    get_context_size,
-    get_from_persistent_memory,
-    get_step,
-    list_steps,
-    log_global_memory,
-    modify_step,
-    persist_in_memory,
-    remove_step,
-    set_context_agent,
-)
-from first_agent.Gradio_UI import GradioUI
-from first_agent.tools.final_answer import FinalAnswerTool
-from first_agent.tools.visit_webpage import VisitWebpageTool
-from tools.editor import get_file_contents, list_directory_contents, write_content_to_file
-from tools.testing import run_tests
-
-PROMPTS_FILE = Path(__file__).parent / 'prompts.yaml'
-MODEL_ID = 'Qwen/Qwen2.5-Coder-32B-Instruct'
-# MODEL_ID = 'google/gemma-2-2b-it'
+import time
 
 log = logging.getLogger('first_agent')
 
-FULL_CONTEXT_LOG = Path('full_context_log.txt')
-
-
-final_answer = FinalAnswerTool()
-visit_webpage = VisitWebpageTool()
-model = HfApiModel(
-    max_tokens=2096,
-    temperature=0.5,
-    model_id=MODEL_ID,
-    custom_role_conversions=None,
-)
-
-model = OpenAIServerModel(model_id='gpt-3.5-turbo', api_base='http://localhost:5000/v1', api_key='local_key')
-
-
-# Import tool from Hub
-image_generation_tool = load_tool('agents-course/text-to-image', trust_remote_code=True)
-
-with PROMPTS_FILE.open('r') as stream:
-    prompt_templates = yaml.safe_load(stream)
-
-agent = CodeAgent(
-    model=model,
-    tools=[
-        final_answer,
-        visit_webpage,
-        DuckDuckGoSearchTool(),
-        list_steps,
-        get_step,
-        modify_step,
-        remove_step,
-        get_context_size,
-        persist_in_memory,
-        get_from_persistent_memory,
-        log_global_memory,
-        list_directory_contents,
-        get_file_contents,
-        write_content_to_file,
-        run_tests,
-    ],  # add your tools here (don't remove final_answer)
-    max_steps=20,
-    verbosity_level=1,
-    grammar=None,
-    planning_interval=None,
-    name=None,
-    description=None,
-    prompt_templates=prompt_templates,
-    use_e2b_executor=False,
-    additional_authorized_imports=[
-        'requests',
-        're',
-        'json',
-        'bs4',
-        'pathlib',
-        'os',
-        'typing',
-        'itertools',
-        'pytest',
-        'tools',
-        'yaml',
-    ],
-)
-set_context_agent(agent)
-
-
-GradioUI(agent).launch()
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Run the agent behind the Gradio UI')
+    parser.add_argument('--image-generation', action='store_true', help='give the agent the Hub text-to-image tool')
+    parser.add_argument('--trace', metavar='FILE', help='write a JSONL span per agent step to FILE')
+    parser.add_argument('--otlp-endpoint', metavar='URL', help='export step spans to an OTLP/HTTP collector')
+    parser.add_argument(
+        '--journal', metavar='FILE', help='append the context changes of every step to a rotating JSONL journal'
+    )
+    parser.add_argument(
+        '--llm-cache',
+        choices=['off', 'readwrite', 'replay'],
+        default='off',
+        help='cache completions on disk; replay only serves cached ones and fails on a miss',
+    )
+    parser.add_argument(
+        '--prompt-profile',
+        choices=['full', 'default', 'compact'],
+        default='default',
+        help='system prompt profile: the whole template, only the relevant examples, or a fixed token budget',
+    )
+    parser.add_argument(
+        '--prompt-report', action='store_true', help='log the token count of each system prompt section'
+    )
+    parser.add_argument(
+        '--sandbox-workers',
+        type=int,
+        default=0,
+        metavar='N',
+        help='run generated code in N pre-imported worker processes with resource limits instead of in-process',
+    )
+    parser.add_argument(
+        '--embedding-model',
+        metavar='NAME',
+        help='rank recall results with this sentence-transformers model on top of BM25',
+    )
+    parser.add_argument(
+        '--context-tokens',
+        type=int,
+        metavar='N',
+        help='compact the agent memory over N tokens, 3/4 of the model context window by default',
+    )
+    parser.add_argument(
+        '--memory-db',
+        metavar='FILE',
+        help='SQLite file of the persistent agent memory, agent_memory.sqlite3 by default',
+    )
+    parser.add_argument(
+        '--max-run-tokens', type=int, help='stop a run after the step that takes it over this many tokens'
+    )
+    parser.add_argument('--build-only', action='store_true', help='build the agent and exit without launching the UI')
+    parser.add_argument(
+        '--profile-startup',
+        action='store_true',
+        help='report import and build times of a --build-only run with `python -X importtime`',
+    )
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    args = get_args()
+    if args.profile_startup:
+        from first_agent.startup import profile_startup
+
+        extra = ['--image-generation'] if args.image_generation else []
+        print(profile_startup(['--build-only', *extra]))
+        return
+
+    # heavy imports happen here, after argument parsing, so --help and --profile-startup stay fast
+    start = time.perf_counter()
+    from first_agent.agent import build_model, build_session
+    from first_agent.memory_store import open_memory
+
+    imported = time.perf_counter()
+    # Hub tools are downloaded on first call and read from the local Hub cache afterwards
+    extra_tools = []
+    if args.image_generation:
+        from first_agent.tools.hub import text_to_image_tool
+
+        extra_tools.append(text_to_image_tool())
+    tracer = None
+    if args.trace or args.otlp_endpoint:
+        from first_agent.tracing import make_tracer
+
+        tracer = make_tracer(args.trace, args.otlp_endpoint)
+    sandbox = None
+    if args.sandbox_workers:
+        from first_agent.agent import AUTHORIZED_IMPORTS
+        from first_agent.sandbox import SandboxPool
+
+        sandbox = SandboxPool(args.sandbox_workers, preload=AUTHORIZED_IMPORTS)
+    embedder = None
+    if args.embedding_model:
+        from first_agent.retrieval import sentence_embedder
+
+        embedder = sentence_embedder(args.embedding_model)
+    agent, context = build_session(
+        build_model(args.llm_cache),
+        open_memory(args.memory_db),
+        name='default',
+        embedder=embedder,
+        extra_tools=extra_tools,
+        tracer=tracer,
+        prompt_profile=args.prompt_profile,
+        sandbox=sandbox,
+        context_token_budget=args.context_tokens,
+    )
+    from first_agent.usage import TokenBudget, UsageLedger, UsageMeter
+
+    agent.step_callbacks.append(UsageMeter(UsageLedger(), context.name, budget=TokenBudget(args.max_run_tokens)))
+    if args.prompt_report:
+        compiled = agent.prompt_compiler.compile(agent.tools, agent.managed_agents, str(agent.authorized_imports))
+        log.info(f'system prompt ({args.prompt_profile}):\n{compiled.report()}')
+    if args.journal:
+        from first_agent.context_tools import set_journal
+        from first_agent.journal import ContextJournal
+
+        journal = ContextJournal(args.journal, compress=True)
+        set_journal(journal)
+        journal.attach(agent, context.name)
+    built = time.perf_counter()
+    log.info(f'startup: imports {(imported - start) * 1000:.0f} ms, agent {(built - imported) * 1000:.0f} ms')
+    if args.build_only:
+        return
+
+    from first_agent.Gradio_UI import GradioUI
+
+    GradioUI(agent, context=context).launch()
+
+
+if __name__ == '__main__':
+    main()
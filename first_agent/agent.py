@@ -0,0 +1,197 @@
+from collections.abc import Sequence
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+from smolagents import CodeAgent
+from smolagents.tools import Tool
+
+from first_agent.compaction import ContextCompactor
+from first_agent.context_accounting import ContextAccounting
+from first_agent.context_tools import (
+    AgentContext,
+    create_context,
+    get_context_breakdown,
+    get_context_size,
+    get_from_persistent_memory,
+    get_step,
+    list_steps,
+    log_global_memory,
+    modify_step,
+    persist_in_memory,
+    recall,
+    remove_step,
+)
+from first_agent.memory_store import MemoryStore
+from first_agent.model_cache import OFF, CachingModel
+from first_agent.models import StreamingOpenAIServerModel
+from first_agent.prompt_compiler import DEFAULT, PromptCompiler
+from first_agent.prompting import PrefixStableCodeAgent
+from first_agent.retrieval import Embedder, RetrievalIndex
+from first_agent.sandbox import SandboxPool, use_sandbox
+from first_agent.tools.fetch_cache import FetchCache
+from first_agent.tools.final_answer import FinalAnswerTool
+from first_agent.tools.parallel import ParallelToolsTool, mark_side_effect_free
+from first_agent.tools.visit_webpage import VisitWebpagesTool, VisitWebpageTool
+from first_agent.tools.web_search import DuckDuckGoSearchTool
+from first_agent.tracing import Tracer
+from tools.editor import (
+    apply_patch,
+    get_file_contents,
+    get_file_info,
+    list_directory_contents,
+    write_content_to_file,
+)
+from tools.search import list_files, search_code
+from tools.testing import run_tests
+
+PROMPTS_FILE = Path(__file__).parent / 'prompts.yaml'
+MODEL_ID = 'gpt-3.5-turbo'
+MODEL_API_BASE = 'http://localhost:5000/v1'
+MODEL_API_KEY = 'local_key'
+# context window of the served model
+MODEL_CONTEXT_WINDOW = 32768
+# compaction kicks in between steps when the memory goes over this size; the rest of the window is left to the
+# system prompt and the reply
+CONTEXT_TOKEN_BUDGET = MODEL_CONTEXT_WINDOW * 3 // 4
+FETCH_CACHE_DIR = Path('.cache/visit_webpage')
+SEARCH_CACHE_DIR = Path('.cache/web_search')
+LLM_CACHE_DIR = Path('.cache/llm')
+AUTHORIZED_IMPORTS = [
+    'requests',
+    're',
+    'json',
+    'bs4',
+    'pathlib',
+    'os',
+    'typing',
+    'itertools',
+    'pytest',
+    'tools',
+    'yaml',
+]
+
+
+@lru_cache(maxsize=None)
+def load_prompt_templates(context_token_budget: int = CONTEXT_TOKEN_BUDGET) -> dict:
+    import yaml
+
+    with PROMPTS_FILE.open('r') as stream:
+        templates = yaml.safe_load(stream)
+    # filled in once, the prompt asks the model to keep the context under the budget the compactor enforces
+    templates['system_prompt'] = templates['system_prompt'].replace(
+        '{{context_token_budget}}', str(context_token_budget)
+    )
+    return templates
+
+
+@lru_cache(maxsize=None)
+def prompt_compiler(profile: str = DEFAULT, context_token_budget: int = CONTEXT_TOKEN_BUDGET) -> PromptCompiler:
+    """Compiler shared by the agents of the process, so each tool set is rendered once"""
+    return PromptCompiler(load_prompt_templates(context_token_budget)['system_prompt'], profile=profile)
+
+
+@lru_cache(maxsize=1)
+def build_tools() -> tuple[Tool, ...]:
+    """Tools shared by every agent of the process; the context tools act on the agent bound to the caller"""
+    visit_webpage = VisitWebpageTool(cache=FetchCache(ttl=600, directory=FETCH_CACHE_DIR), streaming=True)
+    tools = [
+        FinalAnswerTool(),
+        visit_webpage,
+        VisitWebpagesTool(visit_webpage),
+        DuckDuckGoSearchTool(cache_dir=SEARCH_CACHE_DIR),
+        list_steps,
+        get_step,
+        modify_step,
+        remove_step,
+        get_context_size,
+        get_context_breakdown,
+        persist_in_memory,
+        get_from_persistent_memory,
+        recall,
+        log_global_memory,
+        list_directory_contents,
+        list_files,
+        search_code,
+        get_file_info,
+        get_file_contents,
+        write_content_to_file,
+        apply_patch,
+        run_tests,
+    ]  # add your tools here (don't remove final_answer)
+    mark_side_effect_free(
+        list_steps,
+        get_step,
+        get_context_size,
+        get_context_breakdown,
+        get_from_persistent_memory,
+        recall,
+        list_directory_contents,
+        list_files,
+        search_code,
+        get_file_info,
+        get_file_contents,
+    )
+    return (*tools, ParallelToolsTool(tools))
+
+
+def build_agent(
+    model,
+    accounting: ContextAccounting | None = None,
+    max_steps: int = 20,
+    extra_tools: Sequence[Tool] = (),
+    tracer: Tracer | None = None,
+    prefix_stable: bool = True,
+    prompt_profile: str = DEFAULT,
+    sandbox: SandboxPool | None = None,
+    context_token_budget: int | None = None,
+) -> CodeAgent:
+    """With `prefix_stable` volatile content goes after the history, so local servers can reuse their prefix cache.
+    `prompt_profile` picks how the system prompt is compiled, see `PromptCompiler`; it needs `prefix_stable`.
+    With a `sandbox` pool the generated code runs in its worker processes instead of the agent process.
+    The memory is compacted over `context_token_budget` tokens, `CONTEXT_TOKEN_BUDGET` by default; the system
+    prompt tells the model the same limit.
+    """
+    accounting = accounting if accounting is not None else ContextAccounting()
+    context_token_budget = context_token_budget or CONTEXT_TOKEN_BUDGET
+    extra = {'prompt_compiler': prompt_compiler(prompt_profile, context_token_budget)} if prefix_stable else {}
+    agent_class = PrefixStableCodeAgent if prefix_stable else CodeAgent
+    agent = agent_class(
+        model=model,
+        tools=[*build_tools(), *extra_tools],
+        max_steps=max_steps,
+        step_callbacks=[ContextCompactor(accounting, budget_tokens=context_token_budget)],
+        verbosity_level=1,
+        grammar=None,
+        planning_interval=None,
+        name=None,
+        description=None,
+        prompt_templates=load_prompt_templates(context_token_budget),
+        use_e2b_executor=False,
+        additional_authorized_imports=AUTHORIZED_IMPORTS,
+        **extra,
+    )
+    if sandbox is not None:
+        use_sandbox(agent, sandbox)
+    if tracer is not None:
+        tracer.instrument(agent)
+    return agent
+
+
+def build_session(
+    model, memory: MemoryStore, name: str | None = None, embedder: Embedder | None = None, **kwargs: Any
+) -> tuple[CodeAgent, AgentContext]:
+    """Agent with the context its tools work on; agents of many sessions can run in one process.
+    With an `embedder` `recall` ranks passages by embedding similarity as well as BM25.
+    """
+    accounting = ContextAccounting()
+    agent = build_agent(model, accounting, **kwargs)
+    return agent, create_context(agent, memory, accounting, name=name, index=RetrievalIndex(embedder))
+
+
+def build_model(cache_mode: str = OFF) -> StreamingOpenAIServerModel | CachingModel:
+    """Model of the agent; with a cache mode other than `off` completions go through the LLM cache"""
+    model = StreamingOpenAIServerModel(model_id=MODEL_ID, api_base=MODEL_API_BASE, api_key=MODEL_API_KEY)
+    if cache_mode == OFF:
+        return model
+    return CachingModel(model, LLM_CACHE_DIR, mode=cache_mode)
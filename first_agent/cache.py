@@ -0,0 +1,135 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+log = logging.getLogger('cache')
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU with optional time to live"""
+
+    def __init__(self, maxsize: int = 256, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            stored_at, value = item
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DiskCache:
+    """Directory of pickled entries bounded by total size.
+
+    Reads bump the file mtime, so the least recently used entries are evicted first.
+    """
+
+    def __init__(self, directory: Path | str, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _path(self, key: str) -> Path:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.directory / digest[:2] / digest
+
+    def _entries(self) -> list[tuple[Path, os.stat_result]]:
+        return [(path, path.stat()) for path in self.directory.glob('*/*') if path.is_file()]
+
+    @property
+    def size(self) -> int:
+        if self._size is None:
+            self._size = sum(stat.st_size for _, stat in self._entries())
+        return self._size
+
+    def get(self, key: str, default: Any = None) -> Any:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return default
+        try:
+            return pickle.loads(data)
+        except Exception as e:
+            log.warning(f'Dropping broken cache entry {path}: {e}')
+            self.pop(key)
+            return default
+
+    def set(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = pickle.dumps(value)
+        with self._lock:
+            size = self.size - (path.stat().st_size if path.exists() else 0)
+            fd, tmp_name = tempfile.mkstemp(dir=path.parent)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_name, path)
+            self._size = size + len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def pop(self, key: str) -> None:
+        path = self._path(key)
+        with self._lock:
+            try:
+                size = path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:
+                return
+            if self._size is not None:
+                self._size -= size
+
+    def _evict(self) -> None:
+        # evict down to 90% so that we don't rescan the directory on every write
+        target = self.max_bytes * 0.9
+        for path, stat in sorted(self._entries(), key=lambda entry: entry[1].st_mtime):
+            if self._size <= target:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= stat.st_size
+
+    def clear(self) -> None:
+        with self._lock:
+            for path, _ in self._entries():
+                path.unlink(missing_ok=True)
+            self._size = 0
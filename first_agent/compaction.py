@@ -0,0 +1,148 @@
+import dataclasses
+import hashlib
+import logging
+from collections.abc import Sequence
+from typing import Protocol
+
+from smolagents.memory import ActionStep, MemoryStep
+
+from first_agent.context_accounting import ContextAccounting
+from first_agent.context_tools import SummarizedStep, remember_step
+
+log = logging.getLogger('compaction')
+
+TRUNCATED_MARKER = '\n...[truncated]...\n'
+
+
+class CompactionPolicy(Protocol):
+    def apply(self, compactor: 'ContextCompactor', steps: list[MemoryStep], candidates: Sequence[int]) -> None: ...
+
+
+def _first_line(text: str | None, limit: int = 160) -> str:
+    for line in (text or '').splitlines():
+        line = line.strip()
+        if line and line != 'Execution logs:':
+            return line[:limit]
+    return ''
+
+
+def summarize_step(step: ActionStep) -> str:
+    """Cheap extractive one-liner for a step: first line of the thought and of the outcome"""
+    thought = _first_line(step.model_output).removeprefix('Thought:').strip()
+    if step.error is not None:
+        outcome = f'error: {_first_line(str(step.error))}'
+    else:
+        outcome = _first_line(step.observations)
+    return f'step {step.step_number}: {thought} -> {outcome}'
+
+
+class DropDuplicateOutputs:
+    """Replace observations identical to an earlier step output with a reference to that step"""
+
+    def apply(self, compactor, steps, candidates):
+        seen = {}
+        candidates = set(candidates)
+        for idx, step in enumerate(steps):
+            if not isinstance(step, ActionStep) or not step.observations:
+                continue
+            digest = hashlib.sha1(step.observations.encode()).digest()
+            if digest not in seen:
+                seen[digest] = step.step_number
+                continue
+            if idx in candidates:
+                observations = f'[same output as step {seen[digest]}]'
+                compactor.replace(steps, idx, dataclasses.replace(step, observations=observations))
+
+
+class TruncateObservations:
+    """Keep head and tail of long observations"""
+
+    def __init__(self, max_chars: int = 1000):
+        self.max_chars = max_chars
+
+    def apply(self, compactor, steps, candidates):
+        half = self.max_chars // 2
+        for idx in candidates:
+            step = steps[idx]
+            if step.observations is None or len(step.observations) <= self.max_chars:
+                continue
+            observations = step.observations[:half] + TRUNCATED_MARKER + step.observations[-half:]
+            compactor.replace(steps, idx, dataclasses.replace(step, observations=observations))
+            if compactor.within_budget():
+                return
+
+
+class SummarizeSteps:
+    """Collapse the oldest run of consecutive candidate steps into a single SummarizedStep"""
+
+    def apply(self, compactor, steps, candidates):
+        collapsed = []
+        lines = []
+        saved = 0
+        for idx in candidates:
+            if collapsed and idx != collapsed[-1] + 1:
+                break
+            collapsed.append(idx)
+            lines.append(summarize_step(steps[idx]))
+            saved += compactor.accounting.count(steps[idx]) - compactor.accounting.tokenizer(lines[-1])
+            if compactor.accounting.total - saved <= compactor.budget_tokens:
+                break
+        if not collapsed:
+            return
+        summary = SummarizedStep(summarized='\n'.join(lines))
+        compactor.replace(steps, collapsed[0], summary)
+        for idx in reversed(collapsed[1:]):
+            compactor.remove(steps, idx)
+
+
+DEFAULT_POLICIES = (DropDuplicateOutputs(), TruncateObservations(), SummarizeSteps())
+
+
+class ContextCompactor:
+    """Step callback that compacts old ActionSteps when the context goes over a token budget.
+
+    Policies are applied from the cheapest to the most lossy one, until the context fits.
+    The last `keep_recent` steps are never touched.
+    """
+
+    def __init__(
+        self,
+        accounting: ContextAccounting,
+        budget_tokens: int,
+        keep_recent: int = 2,
+        policies: Sequence[CompactionPolicy] = DEFAULT_POLICIES,
+    ):
+        self.accounting = accounting
+        self.budget_tokens = budget_tokens
+        self.keep_recent = keep_recent
+        self.policies = policies
+
+    def __call__(self, memory_step: MemoryStep, agent) -> None:
+        self.compact(agent.memory.steps)
+
+    def within_budget(self) -> bool:
+        return self.accounting.total <= self.budget_tokens
+
+    def candidates(self, steps: list[MemoryStep]) -> list[int]:
+        last = len(steps) - self.keep_recent
+        return [idx for idx, step in enumerate(steps[:last]) if isinstance(step, ActionStep)]
+
+    def replace(self, steps: list[MemoryStep], idx: int, new: MemoryStep) -> None:
+        # the complete step stays reachable through `recall`
+        remember_step(steps[idx])
+        self.accounting.replace(steps[idx], new)
+        steps[idx] = new
+
+    def remove(self, steps: list[MemoryStep], idx: int) -> None:
+        remember_step(steps[idx])
+        self.accounting.forget(steps.pop(idx))
+
+    def compact(self, steps: list[MemoryStep]) -> int:
+        before = self.accounting.sync(steps)
+        for policy in self.policies:
+            if self.within_budget():
+                break
+            policy.apply(self, steps, self.candidates(steps))
+        if self.accounting.total != before:
+            log.info(f'Compacted context: {before} -> {self.accounting.total} tokens')
+        return self.accounting.total
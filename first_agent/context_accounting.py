@@ -0,0 +1,131 @@
+import logging
+import re
+import threading
+from collections.abc import Callable, Iterable
+
+from smolagents.memory import MemoryStep
+
+log = logging.getLogger('context_accounting')
+
+Tokenizer = Callable[[str], int]
+
+_WORD_RE = re.compile(r'\w+|[^\w\s]')
+# average length of a BPE piece for english text and code
+_CHARS_PER_PIECE = 4
+
+
+def approximate_token_count(text: str) -> int:
+    """Fast local tokenizer fallback.
+
+    Every punctuation char is a token and words are split into pieces of ~4 chars,
+    which is close enough to BPE tokenizers for budgeting.
+    """
+    count = 0
+    for match in _WORD_RE.finditer(text):
+        count += (match.end() - match.start() + _CHARS_PER_PIECE - 1) // _CHARS_PER_PIECE
+    return count
+
+
+def hf_tokenizer(model_id: str) -> Tokenizer:
+    """Exact token counter backed by the `tokenizers` package"""
+    try:
+        from tokenizers import Tokenizer as HfTokenizer
+    except ImportError as e:
+        raise ImportError(
+            'You must install package `tokenizers` to count tokens with a model tokenizer: '
+            'for instance run `pip install tokenizers`.'
+        ) from e
+    tokenizer = HfTokenizer.from_pretrained(model_id)
+
+    def count(text: str) -> int:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+    return count
+
+
+def step_to_text(step: MemoryStep) -> str:
+    """Text parts of the messages the model will see for this step"""
+    parts = []
+    for message in step.to_messages():
+        content = message['content']
+        if isinstance(content, str):
+            parts.append(content)
+            continue
+        parts.extend(item['text'] for item in content if item.get('type') == 'text')
+    return '\n'.join(parts)
+
+
+class ContextAccounting:
+    """Caches token count per memory step and keeps a running total.
+
+    Steps are tracked by identity: agent memory steps are not mutated after they are
+    appended, replacing or removing one goes through `replace`/`forget`. Context tools run in parallel,
+    every update holds a lock.
+    """
+
+    def __init__(self, tokenizer: Tokenizer | None = None):
+        self.tokenizer = tokenizer or approximate_token_count
+        self.total = 0
+        self._counts: dict[int, tuple[MemoryStep, int]] = {}
+        self._lock = threading.RLock()
+
+    def set_tokenizer(self, tokenizer: Tokenizer) -> None:
+        with self._lock:
+            self.tokenizer = tokenizer
+            self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.total = 0
+            self._counts.clear()
+
+    def count(self, step: MemoryStep) -> int:
+        with self._lock:
+            cached = self._counts.get(id(step))
+            if cached is not None and cached[0] is step:
+                return cached[1]
+            tokens = self.tokenizer(step_to_text(step))
+            if cached is not None:
+                # a freed step whose id was reused
+                self.total -= cached[1]
+            self._counts[id(step)] = (step, tokens)
+            self.total += tokens
+            return tokens
+
+    def forget(self, step: MemoryStep) -> None:
+        with self._lock:
+            cached = self._counts.pop(id(step), None)
+            if cached is not None:
+                self.total -= cached[1]
+
+    def replace(self, old: MemoryStep, new: MemoryStep) -> None:
+        with self._lock:
+            self.forget(old)
+            self.count(new)
+
+    def refresh(self, step: MemoryStep) -> int:
+        """Recount a step that was changed in place"""
+        with self._lock:
+            self.forget(step)
+            return self.count(step)
+
+    def sync(self, steps: Iterable[MemoryStep]) -> int:
+        """Align cache with the current steps, only unseen steps are tokenized"""
+        steps = list(steps)
+        live = {id(step) for step in steps}
+        with self._lock:
+            for key in [key for key in self._counts if key not in live]:
+                self.total -= self._counts.pop(key)[1]
+            for step in steps:
+                self.count(step)
+            return self.total
+
+    def per_step(self, steps: Iterable[MemoryStep]) -> list[int]:
+        steps = list(steps)
+        with self._lock:
+            self.sync(steps)
+            return [self._counts[id(step)][1] for step in steps]
+
+    def on_step(self, step: MemoryStep) -> None:
+        """Step callback: count a new step as soon as the agent finalizes it"""
+        self.count(step)
@@ -1,22 +1,120 @@
 import datetime
 import logging
-from dataclasses import dataclass
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any
 
-import pytz
 from smolagents import tool
 from smolagents.memory import MemoryStep, Message, MessageRole
 
-AGENT = None
-GLOBAL_MEMORY = {}
-FULL_CONTEXT_LOG = Path('full_context_log.txt')
+from first_agent.context_accounting import ContextAccounting, step_to_text
+from first_agent.journal import ContextJournal
+from first_agent.memory_store import MemoryDigest, MemoryStore
+from first_agent.retrieval import RetrievalIndex
+
+CONTEXT_JOURNAL = Path('context_journal.jsonl')
+JOURNAL: ContextJournal | None = None
 log = logging.getLogger('context_tools')
 
 
-def set_context_agent(agent):
-    global AGENT
-    AGENT = agent
+def get_journal() -> ContextJournal:
+    global JOURNAL
+    if JOURNAL is None:
+        JOURNAL = ContextJournal(CONTEXT_JOURNAL)
+    return JOURNAL
+
+
+def set_journal(journal: ContextJournal):
+    global JOURNAL
+    JOURNAL = journal
+
+
+@dataclass
+class AgentContext:
+    """State the context tools work on, one per agent"""
+
+    agent: Any
+    accounting: ContextAccounting
+    memory: MemoryStore
+    digest: MemoryDigest
+    # stream of the context journal
+    name: str = 'default'
+    # steps evicted from the context and memory values, searched by `recall`
+    index: RetrievalIndex = field(default_factory=RetrievalIndex)
+    # steps remembered without a start time, they get a number of their own
+    remembered: int = 0
+
+
+# set while a session's agent runs; context variables follow threads started with `contextvars.copy_context()`
+# and asyncio tasks, so agents of many sessions share the process and the tools without locks
+_CURRENT: ContextVar[AgentContext | None] = ContextVar('agent_context', default=None)
+
+
+def create_context(
+    agent,
+    memory: MemoryStore,
+    accounting: ContextAccounting | None = None,
+    name: str | None = None,
+    index: RetrievalIndex | None = None,
+) -> AgentContext:
+    """Context of its own for an agent, bound with `bind_context` while the agent runs"""
+    accounting = accounting if accounting is not None else ContextAccounting()
+    agent.step_callbacks.append(accounting.on_step)
+    digest = MemoryDigest()
+    digest.reset(memory.recent(digest.max_entries))
+    index = index if index is not None else RetrievalIndex()
+    for key, value in memory.items():
+        index.add(f'memory:{key}', f'{key}: {value}', source=f'memory {key}')
+    if hasattr(agent.memory, 'reset'):
+        reset = agent.memory.reset
+
+        def reset_memory():
+            # a new task starts from a clean context, memory values stay recallable
+            reset()
+            index.clear('step:')
+
+        agent.memory.reset = reset_memory
+    return AgentContext(agent, accounting, memory, digest, name or memory.namespace, index)
+
+
+@contextmanager
+def bind_context(context: AgentContext) -> Iterator[AgentContext]:
+    token = _CURRENT.set(context)
+    try:
+        yield context
+    finally:
+        _CURRENT.reset(token)
+
+
+def bound_context() -> AgentContext | None:
+    return _CURRENT.get()
+
+
+def current_context() -> AgentContext:
+    context = _CURRENT.get()
+    if context is None:
+        raise LookupError('No agent context is bound, run the agent inside `bind_context(create_context(agent, ...))`')
+    return context
+
+
+def remember_step(step: MemoryStep) -> None:
+    """Indexes a step leaving the context for `recall`; the first version of a step, the complete one, is kept"""
+    context = _CURRENT.get()
+    if context is None or isinstance(step, SummarizedStep):
+        return
+    number = getattr(step, 'step_number', None)
+    start_time = getattr(step, 'start_time', None)
+    if number is not None and start_time is not None:
+        # step numbers start over with every run; compacted copies of a step keep its start time
+        doc_id = f'step:{number}:{start_time}'
+    else:
+        context.remembered += 1
+        doc_id = f'step:{type(step).__name__}:{context.remembered}'
+    label = f'step {number}' if number is not None else type(step).__name__
+    context.index.add(doc_id, step_to_text(step), source=label, replace=False)
 
 
 @dataclass
@@ -39,7 +137,7 @@ def list_steps() -> dict[int, str]:
         step_number: step_metadata
     """
     output = {}
-    for idx, memory_step in enumerate(AGENT.memory.steps):
+    for idx, memory_step in enumerate(current_context().agent.memory.steps):
         output[idx] = getattr(memory_step, 'metadata', None)
     return output
 
@@ -54,7 +152,8 @@ def get_step(num: int) -> (str, dict):
         str: step repsentation as string
         dict: step metadata if exists
     """
-    return str(AGENT.memory.steps[num]), getattr(AGENT.memory.steps[num], 'metadata', None)
+    steps = current_context().agent.memory.steps
+    return str(steps[num]), getattr(steps[num], 'metadata', None)
 
 
 @tool
@@ -65,7 +164,11 @@ def modify_step(step_num: int, summarized: str) -> None:
         step_num: The index of the step to replace.
         summarized: A summarized version of the step
     """
-    AGENT.memory.steps[step_num] = SummarizedStep(summarized=summarized)
+    context = current_context()
+    summarized_step = SummarizedStep(summarized=summarized)
+    remember_step(context.agent.memory.steps[step_num])
+    context.accounting.replace(context.agent.memory.steps[step_num], summarized_step)
+    context.agent.memory.steps[step_num] = summarized_step
 
 
 @tool
@@ -75,14 +178,27 @@ def remove_step(step_num: int) -> None:
     Args:
         step_num: The index of the step to remove.
     """
-    AGENT.memory.steps.pop(step_num)
+    context = current_context()
+    step = context.agent.memory.steps.pop(step_num)
+    remember_step(step)
+    context.accounting.forget(step)
 
 
 @tool
 def get_context_size() -> int:
-    """Tool for monitoring context size."""
-    context_as_text = ''.join([str(step.to_messages()) for step in AGENT.memory.steps])
-    return len(context_as_text)
+    """Tool for monitoring context size. Returns the total number of tokens in the context."""
+    context = current_context()
+    return context.accounting.sync(context.agent.memory.steps)
+
+
+@tool
+def get_context_breakdown() -> dict[int, int]:
+    """Tool that returns the context size of every step.
+    Ouptut:
+        step_number: number of tokens
+    """
+    context = current_context()
+    return dict(enumerate(context.accounting.per_step(context.agent.memory.steps)))
 
 
 @tool
@@ -92,6 +208,8 @@ def get_current_time_in_timezone(timezone: str) -> str:
         timezone: A string representing a valid timezone (e.g., 'America/New_York').
     """
     try:
+        import pytz
+
         # Create timezone object
         tz = pytz.timezone(timezone)
         # Get current time in that timezone
@@ -102,16 +220,25 @@ def get_current_time_in_timezone(timezone: str) -> str:
 
 
 @tool
-def persist_in_memory(key: str, value: Any) -> None:
-    """Tool that stores a value in memory with a given key.
+def persist_in_memory(key: str, value: Any, ttl_seconds: float | None = None) -> None:
+    """Tool that stores a value in memory with a given key. Memory survives restarts.
 
     Args:
         key: The key to store the value under.
         value: The value to store.
+        ttl_seconds: (optional) Forget the value after this many seconds.
     """
-    global GLOBAL_MEMORY
-    GLOBAL_MEMORY[key] = value
-    modify_step(0, f'PERSISTENT MEMORY:\n{GLOBAL_MEMORY}')
+    context = current_context()
+    context.memory.set(key, value, ttl=ttl_seconds)
+    context.digest.update(key, value)
+    context.index.add(f'memory:{key}', f'{key}: {value}', source=f'memory {key}')
+    digest = f'PERSISTENT MEMORY:\n{context.digest.render()}'
+    tail = getattr(context.agent, 'prompt_tail', None)
+    if tail is not None:
+        # rendered after the last step, the prompt prefix stays the same
+        tail.set('memory', digest)
+    else:
+        modify_step(0, digest)
 
 
 @tool
@@ -121,14 +248,28 @@ def get_from_persistent_memory(key: str) -> Any:
     Args:
         key: The key to retrieve the value for.
     """
-    global GLOBAL_MEMORY
-    return GLOBAL_MEMORY.get(key, None)
+    return current_context().memory.get(key)
+
+
+@tool
+def recall(query: str, k: int = 3) -> list[dict]:
+    """Tool that searches the steps removed or summarized from the context and the values in persistent memory.
+    Use it to get back details of earlier observations instead of repeating the work.
+
+    Args:
+        query: Words to look for, like a search engine query.
+        k: (optional) The number of passages to return.
+    """
+    hits = current_context().index.search(query, k)
+    return [{'source': hit.source, 'text': hit.text, 'score': round(hit.score, 3)} for hit in hits]
 
 
 @tool
 def log_global_memory() -> None:
     """Tool that logs the current global memory."""
-    log.info(f'GLOBAL MEMORY: {GLOBAL_MEMORY}')
-    print(f'GLOBAL MEMORY: {GLOBAL_MEMORY}')
-    context_as_string = ''.join([str(step.to_messages()) for step in AGENT.memory.steps])
-    FULL_CONTEXT_LOG.write_text(context_as_string)
+    context = current_context()
+    global_memory = dict(context.memory.items())
+    log.info(f'GLOBAL MEMORY: {global_memory}')
+    print(f'GLOBAL MEMORY: {global_memory}')
+    # only the steps changed since the last record are written, by the journal thread
+    get_journal().record(context.name, context.agent.memory.steps)
@@ -0,0 +1,252 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from collections.abc import Iterator, Sequence
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Any
+
+from smolagents.memory import MemoryStep
+
+log = logging.getLogger('journal')
+
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+DEFAULT_MAX_QUEUE = 1024
+
+# Each record holds the edit from the previous context of its stream to the current one, as a list of ops:
+#   ['k', n]      keep the next n steps
+#   ['d', n]      drop the next n steps
+#   ['a', steps]  insert serialized steps
+#   ['r']         clear the context (first op of a snapshot)
+KEEP, DROP, ADD, RESET = 'k', 'd', 'a', 'r'
+
+_SEQ_RE = re.compile(rb'\{"seq": (\d+)')
+
+
+def serialize_step(step: MemoryStep) -> dict:
+    """The messages the model sees for a step, as JSON-ready dicts"""
+    messages = []
+    for message in step.to_messages():
+        content = message['content']
+        if not isinstance(content, str):
+            content = '\n'.join(item['text'] for item in content if item.get('type') == 'text')
+        messages.append({'role': str(getattr(message['role'], 'value', message['role'])), 'content': content})
+    return {'type': type(step).__name__, 'step': getattr(step, 'step_number', None), 'messages': messages}
+
+
+def diff_ops(previous: Sequence[MemoryStep], current: Sequence[MemoryStep]) -> list[list]:
+    """Ops turning the steps `previous` into `current`; steps are compared by identity.
+
+    `previous` must still be referenced by the caller, the id of a freed step can be reused by a new one.
+    """
+    ops: list[list] = []
+    matcher = SequenceMatcher(None, [id(step) for step in previous], [id(step) for step in current], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([KEEP, i2 - i1])
+            continue
+        if i2 > i1:
+            ops.append([DROP, i2 - i1])
+        if j2 > j1:
+            ops.append([ADD, current[j1:j2]])
+    return ops
+
+
+def apply_ops(steps: list[dict], ops: list[list]) -> list[dict]:
+    result: list[dict] = []
+    position = 0
+    for op in ops:
+        if op[0] == RESET:
+            steps, position = [], 0
+        elif op[0] == KEEP:
+            result.extend(steps[position : position + op[1]])
+            position += op[1]
+        elif op[0] == DROP:
+            position += op[1]
+        elif op[0] == ADD:
+            result.extend(op[1])
+    # steps after the last op are kept
+    result.extend(steps[position:])
+    return result
+
+
+class ContextJournal:
+    """Append-only, rotating JSONL journal of agent contexts.
+
+    `record` only diffs step identities against the last record of the stream and queues the result; steps are
+    serialized and written by a background thread. When the queue is full the record is dropped and the next one
+    of that stream is written as a full snapshot. Rotated files start with a snapshot of every stream and are
+    gzipped when `compress` is set.
+    """
+
+    def __init__(
+        self,
+        path: Path | str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        backups: int = DEFAULT_BACKUPS,
+        compress: bool = False,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+    ):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+        self.dropped = 0
+        self._queue: queue.Queue[tuple | None] = queue.Queue(maxsize=max_queue)
+        # steps of the last queued record per stream, kept alive so that their ids stay unique
+        self._last: dict[str, list[MemoryStep]] = {}
+        self._lock = threading.Lock()
+        # writer side: serialized context per stream, used to write snapshots after rotation
+        self._contexts: dict[str, list[dict]] = {}
+        self._seq = last_seq(self.path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open('a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._write_loop, name='context-journal', daemon=True)
+        self._thread.start()
+
+    def record(self, stream: str, steps: Sequence[MemoryStep], **fields: Any) -> None:
+        steps = list(steps)
+        with self._lock:
+            previous = self._last.get(stream)
+            ops = [[RESET], [ADD, steps]] if previous is None else diff_ops(previous, steps)
+            try:
+                self._queue.put_nowait((stream, time.time(), ops, fields))
+            except queue.Full:
+                self.dropped += 1
+                self._last.pop(stream, None)
+                return
+            self._last[stream] = steps
+
+    def attach(self, agent, stream: str) -> None:
+        """Record the agent context after every step"""
+        agent.step_callbacks.append(lambda step: self.record(stream, agent.memory.steps, step=step.step_number))
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception:
+                log.exception(f'Could not write to context journal {self.path}')
+            finally:
+                self._queue.task_done()
+
+    def _write(self, stream: str, timestamp: float, ops: list[list], fields: dict) -> None:
+        ops = [[op[0], [serialize_step(step) for step in op[1]]] if op[0] == ADD else op for op in ops]
+        self._contexts[stream] = apply_ops(self._contexts.get(stream, []), ops)
+        self._write_record({'stream': stream, 'time': timestamp, **fields, 'ops': ops})
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _write_record(self, record: dict) -> None:
+        self._seq += 1
+        self._file.write(json.dumps({'seq': self._seq, **record}, default=str) + '\n')
+        self._file.flush()
+
+    def _rotate(self) -> None:
+        self._file.close()
+        suffix = '.gz' if self.compress else ''
+        for idx in range(self.backups - 1, 0, -1):
+            source = rotated_path(self.path, idx, suffix)
+            if source.exists():
+                os.replace(source, rotated_path(self.path, idx + 1, suffix))
+        if self.backups:
+            target = rotated_path(self.path, 1, suffix)
+            if self.compress:
+                with self.path.open('rb') as src, gzip.open(target, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                self.path.unlink()
+            else:
+                os.replace(self.path, target)
+        self._file = self.path.open('w', encoding='utf-8')
+        # every file can be replayed on its own
+        for stream, steps in self._contexts.items():
+            self._write_record(
+                {'stream': stream, 'time': time.time(), 'snapshot': True, 'ops': [[RESET], [ADD, steps]]}
+            )
+
+    def flush(self) -> None:
+        """Wait until every queued record is written"""
+        self._queue.join()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+
+def last_seq(path: Path) -> int:
+    """Sequence number of the last record of a journal file, read from its end"""
+    if not path.exists() or not path.stat().st_size:
+        return 0
+    with path.open('rb') as stream:
+        end = stream.seek(0, os.SEEK_END)
+        position = end
+        # the last line may be a large snapshot, look for the newline before it block by block
+        while position > 0:
+            position = max(0, position - 64 * 1024)
+            stream.seek(position)
+            newline = stream.read(end - 1 - position).rfind(b'\n')
+            if newline >= 0:
+                position += newline + 1
+                break
+        stream.seek(position)
+        match = _SEQ_RE.match(stream.read(64))
+    return int(match.group(1)) if match else 0
+
+
+def rotated_path(path: Path, idx: int, suffix: str = '') -> Path:
+    return path.with_name(f'{path.stem}.{idx}{path.suffix}{suffix}')
+
+
+def journal_files(path: Path | str) -> list[Path]:
+    """Journal files from the oldest to the current one"""
+    path = Path(path)
+    rotated = []
+    for candidate in path.parent.glob(f'{path.stem}.*{path.suffix}*'):
+        idx = candidate.name[len(path.stem) + 1 :].split('.', 1)[0]
+        if idx.isdigit():
+            rotated.append((int(idx), candidate))
+    files = [candidate for _, candidate in sorted(rotated, reverse=True)]
+    return [*files, path] if path.exists() else files
+
+
+def read_records(path: Path | str) -> Iterator[dict]:
+    for file in journal_files(path):
+        opener = gzip.open if file.suffix == '.gz' else open
+        with opener(file, 'rt', encoding='utf-8') as stream:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def replay(path: Path | str, stream: str = 'default', seq: int | None = None, step: int | None = None) -> list[dict]:
+    """Context of `stream` as of record `seq`, or as of the record made after agent step `step`, the last one by
+    default"""
+    context: list[dict] = []
+    for record in read_records(path):
+        if seq is not None and record['seq'] > seq:
+            break
+        if record['stream'] != stream:
+            continue
+        context = apply_ops(context, record['ops'])
+        if step is not None and record.get('step') == step:
+            break
+    return context
+
+
+def render_context(steps: list[dict]) -> str:
+    parts = []
+    for step in steps:
+        for message in step['messages']:
+            parts.append(f'[{message["role"]}]\n{message["content"]}')
+    return '\n\n'.join(parts)
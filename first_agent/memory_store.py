@@ -0,0 +1,198 @@
+import atexit
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
+log = logging.getLogger('memory_store')
+
+MEMORY_DB = Path('agent_memory.sqlite3')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS memory (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    updated_at REAL NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+)
+"""
+
+
+class _SqliteBackend:
+    """Shared connection that commits in batches: every `sync_every` writes or `sync_interval` seconds"""
+
+    def __init__(self, path: Path | str, sync_every: int = 32, sync_interval: float = 1.0):
+        self.path = str(path)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.lock = threading.RLock()
+        self._conn = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self.last_eviction: float | None = None
+        # commits writes left pending when no other write follows
+        self._timer: threading.Timer | None = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(SCHEMA)
+            self._conn.commit()
+            atexit.register(self.close)
+        return self._conn
+
+    def write(self, sql: str, params: tuple) -> None:
+        with self.lock:
+            self.conn.execute(sql, params)
+            self._pending += 1
+            if self._pending >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.sync_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def read(self, sql: str, params: tuple) -> list[tuple]:
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def flush(self) -> None:
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._conn is not None and self._pending:
+                self._conn.commit()
+            self._pending = 0
+            self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        with self.lock:
+            if self._conn is None:
+                return
+            self.flush()
+            self._conn.close()
+            self._conn = None
+
+
+class MemoryStore:
+    """Persistent key/value store for agent memory.
+
+    Values are pickled into SQLite, keys live in a namespace (one per session) and may expire.
+    `session` returns a store for another namespace sharing the same database.
+    """
+
+    def __init__(
+        self,
+        path: Path | str = ':memory:',
+        namespace: str = 'default',
+        default_ttl: float | None = None,
+        sync_every: int = 32,
+        backend: _SqliteBackend | None = None,
+    ):
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.backend = backend or _SqliteBackend(path, sync_every=sync_every)
+
+    def session(self, namespace: str) -> 'MemoryStore':
+        return MemoryStore(namespace=namespace, default_ttl=self.default_ttl, backend=self.backend)
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        now = time.time()
+        ttl = ttl if ttl is not None else self.default_ttl
+        expires_at = now + ttl if ttl is not None else None
+        self.backend.write(
+            'INSERT OR REPLACE INTO memory (namespace, key, value, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)',
+            (self.namespace, key, pickle.dumps(value), now, expires_at),
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        rows = self.backend.read(
+            'SELECT value FROM memory WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (self.namespace, key, time.time()),
+        )
+        return pickle.loads(rows[0][0]) if rows else default
+
+    def delete(self, key: str) -> None:
+        self.backend.write('DELETE FROM memory WHERE namespace = ? AND key = ?', (self.namespace, key))
+
+    def recent(self, limit: int | None = None) -> list[tuple[str, Any]]:
+        """Live items, most recently updated last"""
+        rows = self.backend.read(
+            'SELECT key, value FROM memory WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?) '
+            'ORDER BY updated_at DESC LIMIT ?',
+            (self.namespace, time.time(), -1 if limit is None else limit),
+        )
+        return [(key, pickle.loads(value)) for key, value in reversed(rows)]
+
+    def items(self) -> Iterator[tuple[str, Any]]:
+        return iter(self.recent())
+
+    def evict_expired(self, every: float = 0.0) -> None:
+        """Deletes expired keys of every namespace, at most once per `every` seconds"""
+        backend = self.backend
+        with backend.lock:
+            if backend.last_eviction is not None and time.monotonic() - backend.last_eviction < every:
+                return
+            backend.last_eviction = time.monotonic()
+            backend.write('DELETE FROM memory WHERE expires_at IS NOT NULL AND expires_at <= ?', (time.time(),))
+            backend.flush()
+
+    def flush(self) -> None:
+        self.backend.flush()
+
+    def close(self) -> None:
+        self.backend.close()
+
+
+def open_memory(path: Path | str | None = None) -> MemoryStore:
+    """Store shared by the sessions of an entry point, expired keys are dropped when it is opened"""
+    memory = MemoryStore(path if path is not None else MEMORY_DB)
+    memory.evict_expired()
+    return memory
+
+
+class MemoryDigest:
+    """Bounded preview of the persistent memory rendered into the context.
+
+    Keeps at most `max_entries` most recently written keys with truncated values,
+    so the cost of an update does not depend on how much is stored.
+    """
+
+    def __init__(self, max_entries: int = 32, max_value_chars: int = 120):
+        self.max_entries = max_entries
+        self.max_value_chars = max_value_chars
+        self._lines: OrderedDict[str, str] = OrderedDict()
+        self.truncated = False
+
+    def reset(self, items: Iterable[tuple[str, Any]] = ()) -> None:
+        self._lines.clear()
+        self.truncated = False
+        for key, value in items:
+            self.update(key, value)
+
+    def update(self, key: str, value: Any) -> None:
+        preview = repr(value)
+        if len(preview) > self.max_value_chars:
+            preview = preview[: self.max_value_chars] + '...'
+        self._lines[key] = f'{key}: {preview}'
+        self._lines.move_to_end(key)
+        if len(self._lines) > self.max_entries:
+            self._lines.popitem(last=False)
+            self.truncated = True
+
+    def render(self) -> str:
+        lines = list(self._lines.values())
+        if self.truncated:
+            lines.append('(older keys are not shown, use get_from_persistent_memory)')
+        return '\n'.join(lines)
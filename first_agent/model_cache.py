@@ -0,0 +1,128 @@
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Any
+
+from smolagents.models import ChatMessage
+
+from first_agent.cache import DiskCache
+from first_agent.models import Usage, message_usage
+
+log = logging.getLogger('model_cache')
+
+OFF, READWRITE, REPLAY = 'off', 'readwrite', 'replay'
+CACHE_MODES = (OFF, READWRITE, REPLAY)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class CacheMiss(LookupError):
+    """No cached completion for a prompt in replay mode"""
+
+
+def completion_key(model, messages: list[dict], **params: Any) -> str:
+    """Hash of everything that decides the completion: model, endpoint, prompt and sampling parameters"""
+    tools = params.pop('tools_to_call_from', None)
+    if tools:
+        params['tools'] = [(tool.name, tool.inputs, tool.output_type) for tool in tools]
+    payload = {
+        'model': getattr(model, 'model_id', None) or type(model).__name__,
+        'api_base': getattr(model, 'api_base', None),
+        # parameters given to the model at construction, like temperature or max_tokens
+        'model_kwargs': getattr(model, 'kwargs', None),
+        'messages': messages,
+        'params': {key: value for key, value in params.items() if value is not None},
+    }
+    data = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class CachingModel:
+    """Model wrapper serving completions of identical prompts from a disk cache.
+
+    Modes: `off` calls the model, `readwrite` serves hits and stores misses, `replay` serves hits and raises
+    `CacheMiss` otherwise, so recorded runs can be replayed without a model server.
+    """
+
+    def __init__(
+        self,
+        model,
+        directory: Path | str,
+        mode: str = READWRITE,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f'Unknown cache mode {mode!r}, expected one of {CACHE_MODES}')
+        self.model = model
+        self.mode = mode
+        self.cache = DiskCache(directory, max_bytes=max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.last_input_token_count = 0
+        self.last_output_token_count = 0
+        self.last_cached_token_count = 0
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.model, name)
+
+    def __call__(self, messages, stop_sequences=None, grammar=None, tools_to_call_from=None, **kwargs) -> ChatMessage:
+        if self.mode == OFF:
+            return self._call_model(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+        key = completion_key(
+            self.model,
+            messages,
+            stop_sequences=stop_sequences,
+            grammar=grammar,
+            tools_to_call_from=tools_to_call_from,
+            **kwargs,
+        )
+        entry = self.cache.get(key)
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            message = ChatMessage.from_dict(entry['message'])
+            message.usage = Usage(entry['input_tokens'], entry['output_tokens'], entry.get('cached_tokens', 0))
+            self._set_counts(message.usage)
+            # listeners of a streaming model still get the text, in one piece
+            for listener in list(getattr(self.model, 'listeners', None) or []):
+                listener(message.content or '')
+            return message
+        with self._lock:
+            self.misses += 1
+        if self.mode == REPLAY:
+            raise CacheMiss(f'No cached completion for prompt {key[:12]} in replay mode')
+        message = self._call_model(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+        self.cache.set(
+            key,
+            {
+                'message': json.loads(message.model_dump_json()),
+                'input_tokens': message.usage.input_tokens,
+                'output_tokens': message.usage.output_tokens,
+                'cached_tokens': message.usage.cached_tokens,
+            },
+        )
+        return message
+
+    def _call_model(self, messages, stop_sequences, grammar, tools_to_call_from, **kwargs) -> ChatMessage:
+        message = self.model(
+            messages, stop_sequences=stop_sequences, grammar=grammar, tools_to_call_from=tools_to_call_from, **kwargs
+        )
+        usage = message_usage(message)
+        if usage is None:
+            # models reporting usage through their attributes only
+            usage = Usage(
+                getattr(self.model, 'last_input_token_count', None) or 0,
+                getattr(self.model, 'last_output_token_count', None) or 0,
+                getattr(self.model, 'last_cached_token_count', None) or 0,
+            )
+        message.usage = usage
+        self._set_counts(usage)
+        return message
+
+    def _set_counts(self, usage: Usage) -> None:
+        """Counters of the last call, for smolagents' monitor"""
+        self.last_input_token_count = usage.input_tokens
+        self.last_output_token_count = usage.output_tokens
+        self.last_cached_token_count = usage.cached_tokens
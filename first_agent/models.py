@@ -0,0 +1,112 @@
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import dataclass
+
+from smolagents import OpenAIServerModel
+from smolagents.models import ChatMessage
+
+
+def cached_tokens(usage) -> int:
+    """Prompt tokens served from the server prefix cache, as reported by OpenAI-compatible servers"""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return getattr(details, 'cached_tokens', None) or 0
+
+
+@dataclass(frozen=True)
+class Usage:
+    """Tokens of one model call"""
+
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+
+    @classmethod
+    def from_openai(cls, usage) -> 'Usage':
+        if usage is None:
+            return cls()
+        return cls(usage.prompt_tokens or 0, usage.completion_tokens or 0, cached_tokens(usage))
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+
+def message_usage(message: ChatMessage | None) -> Usage | None:
+    """Usage of the call that returned `message`: set by the models of this package, or read from the raw response.
+
+    Unlike the `last_input_token_count` attributes of a model, it stays right when calls of one model overlap.
+    """
+    usage = getattr(message, 'usage', None)
+    if usage is not None:
+        return usage
+    raw_usage = getattr(getattr(message, 'raw', None), 'usage', None)
+    return Usage.from_openai(raw_usage) if raw_usage is not None else None
+
+
+class StreamingOpenAIServerModel(OpenAIServerModel):
+    """OpenAIServerModel that passes completion tokens to listeners as they arrive.
+
+    Without listeners, or when native tool calling is used, it behaves like the parent class.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.listeners: list[Callable[[str], None]] = []
+        # prompt tokens the server served from its prefix cache, when it reports them
+        self.last_cached_token_count = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def streaming_to(self, listener: Callable[[str], None]) -> Iterator[None]:
+        with self._lock:
+            self.listeners.append(listener)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.listeners.remove(listener)
+
+    def __call__(self, messages, stop_sequences=None, grammar=None, tools_to_call_from=None, **kwargs) -> ChatMessage:
+        if not self.listeners or tools_to_call_from is not None:
+            message = super().__call__(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+            message.usage = Usage.from_openai(getattr(message.raw, 'usage', None))
+            self.last_cached_token_count = message.usage.cached_tokens
+            return message
+        completion_kwargs = self._prepare_completion_kwargs(
+            messages=messages,
+            stop_sequences=stop_sequences,
+            grammar=grammar,
+            model=self.model_id,
+            custom_role_conversions=self.custom_role_conversions,
+            convert_images_to_image_urls=True,
+            **kwargs,
+        )
+        stream = self.client.chat.completions.create(
+            **completion_kwargs, stream=True, stream_options={'include_usage': True}
+        )
+        parts = []
+        chunk = None
+        usage = None
+        for chunk in stream:
+            usage = getattr(chunk, 'usage', None) or usage
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            text = chunk.choices[0].delta.content
+            parts.append(text)
+            for listener in list(self.listeners):
+                listener(text)
+        self.last_input_token_count = usage.prompt_tokens if usage else 0
+        self.last_output_token_count = usage.completion_tokens if usage else 0
+        self.last_cached_token_count = cached_tokens(usage)
+        message = ChatMessage(role='assistant', content=''.join(parts))
+        # the last chunk carries the usage, as the full response does for non-streaming calls
+        message.raw = chunk
+        message.usage = Usage.from_openai(usage)
+        return message
+
+
+def stream_tokens(model, listener: Callable[[str], None]) -> AbstractContextManager:
+    """Passes completion tokens to `listener` while the block runs, when the model can stream them"""
+    streaming_to = getattr(model, 'streaming_to', None)
+    return streaming_to(listener) if streaming_to is not None else nullcontext()
@@ -0,0 +1,214 @@
+import builtins
+import logging
+import re
+import threading
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+from smolagents.agents import populate_template
+
+from first_agent.context_accounting import Tokenizer, approximate_token_count
+
+log = logging.getLogger('prompt_compiler')
+
+FULL, DEFAULT, COMPACT = 'full', 'default', 'compact'
+PROFILES = (FULL, DEFAULT, COMPACT)
+COMPACT_TOKEN_BUDGET = 1500
+
+# markers of the system prompt in prompts.yaml
+EXAMPLES_START = 'Here are a few examples using notional tools:\n---\n'
+TOOLS_START = 'Above example were using notional tools'
+RULES_START = 'Here are the rules you should always follow'
+EXAMPLE_SEPARATOR = '\n---\n'
+
+COMPACT_TOOLS_TEMPLATE = (
+    'You only have access to these tools, on top of plain Python:\n'
+    '{%- for tool in tools.values() %}\n'
+    '- {{ tool.name }}('
+    "{% for name, spec in tool.inputs.items() %}{{ name }}: {{ spec.type }}{{ ', ' if not loop.last }}{% endfor %}"
+    ') -> {{ tool.output_type }}'
+    "{{ ': ' + tool.description if tool.description }}\n"
+    '{%- endfor %}\n'
+)
+
+_CALL_RE = re.compile(r'(?<![.\w])([A-Za-z_]\w*)\(')
+_WORD_RE = re.compile(r'[a-z0-9]{3,}')
+_BUILTINS = frozenset(dir(builtins))
+
+
+def first_sentence(text: str) -> str:
+    line = text.strip().split('\n', 1)[0]
+    match = re.search(r'(?<=[.!?])\s', line)
+    return line[: match.start()] if match else line
+
+
+@dataclass(frozen=True)
+class Example:
+    text: str
+    task: str
+    # functions the example calls that are not Python builtins
+    tools: frozenset[str]
+
+    @classmethod
+    def parse(cls, text: str) -> 'Example':
+        task = text.split('\n\nThought:', 1)[0]
+        code = '\n'.join(re.findall(r'```py\n(.*?)```', text, re.DOTALL))
+        return cls(text, task, frozenset(name for name in _CALL_RE.findall(code) if name not in _BUILTINS))
+
+
+@dataclass(frozen=True)
+class PromptSections:
+    intro: str
+    examples: tuple[Example, ...]
+    tools: str
+    rules: str
+
+    @classmethod
+    def parse(cls, template: str) -> 'PromptSections':
+        intro, rest = template.split(EXAMPLES_START, 1)
+        examples, rest = rest.split(TOOLS_START, 1)
+        tools, rules = rest.split(RULES_START, 1)
+        return cls(
+            intro=intro,
+            examples=tuple(Example.parse(text.strip()) for text in examples.split(EXAMPLE_SEPARATOR) if text.strip()),
+            tools=TOOLS_START + tools,
+            rules=RULES_START + rules,
+        )
+
+
+@dataclass
+class CompiledPrompt:
+    text: str
+    # (section name, tokens) in prompt order
+    sections: list[tuple[str, int]]
+
+    @property
+    def tokens(self) -> int:
+        return sum(tokens for _, tokens in self.sections)
+
+    def report(self) -> str:
+        lines = [f'{tokens:6d}  {name}' for name, tokens in self.sections]
+        return '\n'.join([*lines, f'{self.tokens:6d}  total'])
+
+
+def _words(text: str) -> set[str]:
+    return set(_WORD_RE.findall(text.lower()))
+
+
+class PromptCompiler:
+    """Renders the system prompt once per tool set and profile.
+
+    Profiles:
+      full     the template as it is
+      default  only the examples that call tools the agent has, the ones whose task shares most words first
+      compact  one line per tool, and examples only while the prompt fits in `token_budget`
+    """
+
+    def __init__(
+        self,
+        template: str,
+        profile: str = DEFAULT,
+        token_budget: int = COMPACT_TOKEN_BUDGET,
+        max_examples: int = 3,
+        tokenizer: Tokenizer | None = None,
+    ):
+        if profile not in PROFILES:
+            raise ValueError(f'Unknown prompt profile {profile!r}, expected one of {PROFILES}')
+        self.template = template
+        self.sections = PromptSections.parse(template)
+        self.profile = profile
+        self.token_budget = token_budget
+        self.max_examples = max_examples
+        self.tokenizer = tokenizer or approximate_token_count
+        self._cache: dict[tuple, CompiledPrompt] = {}
+        self._lock = threading.Lock()
+
+    def select_examples(self, tool_names: set[str], task: str | None = None) -> list[Example]:
+        available = [example for example in self.sections.examples if example.tools <= tool_names]
+        if task:
+            words = _words(task)
+            available.sort(key=lambda example: len(words & _words(example.task)), reverse=True)
+        return available[: self.max_examples]
+
+    def compile(
+        self,
+        tools: Mapping,
+        managed_agents: Mapping | None = None,
+        authorized_imports: str = '',
+        task: str | None = None,
+    ) -> CompiledPrompt:
+        tool_names = set(tools) | set(managed_agents or ())
+        examples = () if self.profile == FULL else tuple(self.select_examples(tool_names, task))
+        key = (
+            self.profile,
+            tuple((tool.name, tool.description, repr(tool.inputs), tool.output_type) for tool in tools.values()),
+            tuple((agent.name, agent.description) for agent in (managed_agents or {}).values()),
+            authorized_imports,
+            examples,
+        )
+        with self._lock:
+            compiled = self._cache.get(key)
+        if compiled is None:
+            compiled = self._compile(tools, managed_agents or {}, authorized_imports, examples)
+            with self._lock:
+                self._cache[key] = compiled
+        return compiled
+
+    def _compile(self, tools, managed_agents, authorized_imports, examples) -> CompiledPrompt:
+        variables = {'tools': tools, 'managed_agents': managed_agents, 'authorized_imports': authorized_imports}
+        if self.profile == FULL:
+            text = populate_template(self.template, variables)
+            return CompiledPrompt(text, [('system_prompt', self.tokenizer(text))])
+
+        intro = self.sections.intro
+        rules = populate_template(self.sections.rules, variables)
+        if self.profile == COMPACT:
+            # first sentence of each tool description, or only the signatures when that does not fit the budget
+            for describe in (first_sentence, lambda description: ''):
+                compact_tools = {name: _CompactTool(tool, describe(tool.description)) for name, tool in tools.items()}
+                tools_text = populate_template(COMPACT_TOOLS_TEMPLATE, {'tools': compact_tools})
+                tools_text += populate_template(self._managed_agents_and_imports(), variables)
+                used = sum(self.tokenizer(text) for text in (intro, tools_text, rules))
+                if used <= self.token_budget:
+                    break
+        else:
+            # the examples left only use real tools
+            tools_text = populate_template(self.sections.tools.split('. ', 1)[1], variables)
+            used = sum(self.tokenizer(text) for text in (intro, tools_text, rules))
+
+        chosen = []
+        for example in examples:
+            tokens = self.tokenizer(example.text)
+            if self.profile == COMPACT and used + tokens > self.token_budget:
+                continue
+            chosen.append(example)
+            used += tokens
+        if self.profile == COMPACT and used > self.token_budget:
+            log.warning(f'Compact system prompt takes {used} tokens, over its budget of {self.token_budget}')
+
+        parts = [('intro', intro)]
+        if chosen:
+            parts.append(('examples header', EXAMPLES_START))
+            for idx, example in enumerate(chosen):
+                separator = EXAMPLE_SEPARATOR if idx else ''
+                parts.append((f'example: {example.task[:60]}', separator + example.text))
+            parts.append(('examples footer', EXAMPLE_SEPARATOR.rstrip() + '\n\n'))
+        parts += [('tools', tools_text), ('rules', '\n' + rules)]
+        text = ''.join(part for _, part in parts)
+        return CompiledPrompt(text, [(name, self.tokenizer(part)) for name, part in parts])
+
+    def _managed_agents_and_imports(self) -> str:
+        """Team members part of the tool section, without the full tool listing"""
+        tools = self.sections.tools
+        start = tools.find('{%- if managed_agents')
+        return tools[start:] if start >= 0 else ''
+
+
+class _CompactTool:
+    """Tool view for the compact listing, with a shortened description"""
+
+    def __init__(self, tool, description: str):
+        self.name = tool.name
+        self.inputs = tool.inputs
+        self.output_type = tool.output_type
+        self.description = description
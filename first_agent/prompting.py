@@ -0,0 +1,175 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from smolagents import CodeAgent
+from smolagents.memory import MemoryStep
+from smolagents.models import MessageRole
+
+from first_agent.models import message_usage
+from first_agent.prompt_compiler import PromptCompiler
+
+log = logging.getLogger('prompting')
+
+_PREFIX_COUNTERS = ('calls', 'prompt_chars', 'reused_chars', 'prompt_tokens', 'cached_tokens')
+
+
+class PromptTail:
+    """Volatile prompt sections (memory digest, notes) rendered after the last step instead of inside the history"""
+
+    def __init__(self):
+        self._sections: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set(self, name: str, text: str) -> None:
+        with self._lock:
+            self._sections[name] = text
+
+    def clear(self, name: str) -> None:
+        with self._lock:
+            self._sections.pop(name, None)
+
+    def render(self) -> str:
+        with self._lock:
+            return '\n\n'.join(text for text in self._sections.values() if text)
+
+
+def _message_text(message: dict) -> str:
+    content = message['content']
+    if not isinstance(content, str):
+        content = ''.join(item.get('text', '') for item in content)
+    return f'{message["role"]}\x00{content}\x00'
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    """Binary search on slice equality, the comparisons run in C"""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class PrefixStats:
+    """Prefix reuse between consecutive prompts of an agent.
+
+    `reused_chars` is measured on the client: the part of a prompt equal to the start of the previous one, which a
+    server prefix cache can serve. `cached_tokens` is what the server reports it actually served from its cache.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_chars = 0
+        self.reused_chars = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self._previous: list[str] = []
+        # counters when the current run started
+        self._run_start = self._counts()
+
+    def observe(self, messages: list[dict]) -> int:
+        """Records a prompt and returns the length of the prefix it shares with the previous one"""
+        texts = [_message_text(message) for message in messages]
+        reused = 0
+        for previous, text in zip(self._previous, texts):
+            if previous == text:
+                reused += len(text)
+                continue
+            reused += _common_prefix_length(previous, text)
+            break
+        self.calls += 1
+        self.prompt_chars += sum(len(text) for text in texts)
+        self.reused_chars += reused
+        self._previous = texts
+        return reused
+
+    def on_step(self, step: MemoryStep, agent=None) -> None:
+        usage = message_usage(getattr(step, 'model_output_message', None))
+        if usage is None:
+            return
+        self.prompt_tokens += usage.input_tokens
+        self.cached_tokens += usage.cached_tokens
+        log.debug(f'Prefix reuse: {self.report()}')
+
+    @property
+    def hit_ratio(self) -> float:
+        return self.reused_chars / self.prompt_chars if self.prompt_chars else 0.0
+
+    @property
+    def server_hit_ratio(self) -> float | None:
+        return self.cached_tokens / self.prompt_tokens if self.cached_tokens and self.prompt_tokens else None
+
+    def _counts(self) -> dict[str, int]:
+        return {name: getattr(self, name) for name in _PREFIX_COUNTERS}
+
+    def report(self, since: dict[str, int] | None = None) -> dict:
+        """Counters and hit ratios of every call, or of the calls made after the `since` counters"""
+        counts = self._counts()
+        if since is not None:
+            counts = {name: value - since[name] for name, value in counts.items()}
+        server_hit_ratio = None
+        if counts['cached_tokens'] and counts['prompt_tokens']:
+            server_hit_ratio = round(counts['cached_tokens'] / counts['prompt_tokens'], 4)
+        return {
+            **counts,
+            'hit_ratio': round(counts['reused_chars'] / counts['prompt_chars'], 4) if counts['prompt_chars'] else 0.0,
+            'server_hit_ratio': server_hit_ratio,
+        }
+
+    def end_run(self) -> dict:
+        """Logs and returns the report of the run that just ended"""
+        report = self.report(since=self._run_start)
+        self._run_start = self._counts()
+        if report['calls']:
+            log.info(
+                f'Prefix reuse: {report["hit_ratio"]:.0%} of {report["prompt_chars"]} prompt chars over '
+                f'{report["calls"]} calls, server cache hit ratio {report["server_hit_ratio"]}'
+            )
+        return report
+
+
+class PrefixStableCodeAgent(CodeAgent):
+    """CodeAgent whose prompt only grows at the end between calls.
+
+    The system prompt and the history are never rewritten for volatile content: the memory digest and other
+    notes go to `prompt_tail`, rendered as a last user message, so a server prefix cache can reuse everything
+    before it. With a `prompt_compiler` the system prompt is rendered by it, once per tool set.
+    """
+
+    def __init__(self, *args, prompt_compiler: PromptCompiler | None = None, **kwargs):
+        self.prompt_compiler = prompt_compiler
+        super().__init__(*args, **kwargs)
+        self.prompt_tail = PromptTail()
+        self.prefix_stats = PrefixStats()
+        self.step_callbacks.append(self.prefix_stats.on_step)
+
+    def _run(self, *args, **kwargs):
+        try:
+            yield from super()._run(*args, **kwargs)
+        finally:
+            self.prefix_stats.end_run()
+
+    def initialize_system_prompt(self) -> str:
+        if self.prompt_compiler is None:
+            return super().initialize_system_prompt()
+        compiled = self.prompt_compiler.compile(
+            self.tools,
+            self.managed_agents,
+            'You can import from any package you want.'
+            if '*' in self.authorized_imports
+            else str(self.authorized_imports),
+            task=getattr(self, 'task', None),
+        )
+        return compiled.text
+
+    def write_memory_to_messages(self, summary_mode: bool | None = False) -> list[dict]:
+        messages = super().write_memory_to_messages(summary_mode=summary_mode)
+        tail = self.prompt_tail.render()
+        if tail:
+            messages.append({'role': MessageRole.USER, 'content': [{'type': 'text', 'text': tail}]})
+        if not summary_mode:
+            self.prefix_stats.observe(messages)
+        return messages
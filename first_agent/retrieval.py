@@ -0,0 +1,213 @@
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+
+log = logging.getLogger('retrieval')
+
+DEFAULT_CHUNK_CHARS = 800
+DEFAULT_EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+# reciprocal rank fusion constant of the hybrid ranking
+RRF_K = 60
+
+_TERM_RE = re.compile(r'\w{2,}')
+
+# texts -> (len(texts), dim) array of normalized vectors
+Embedder = Callable[[Sequence[str]], np.ndarray]
+
+
+def terms(text: str) -> list[str]:
+    return _TERM_RE.findall(text.lower())
+
+
+def chunk(text: str, max_chars: int = DEFAULT_CHUNK_CHARS) -> list[str]:
+    """Passages of at most `max_chars`, cut on line boundaries when possible"""
+    chunks: list[str] = []
+    current = ''
+    for line in text.splitlines(keepends=True):
+        while len(line) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        if len(current) + len(line) > max_chars:
+            chunks.append(current)
+            current = ''
+        current += line
+    if current.strip():
+        chunks.append(current)
+    return [text.strip() for text in chunks if text.strip()]
+
+
+@lru_cache(maxsize=2)
+def sentence_embedder(model_name: str = DEFAULT_EMBEDDING_MODEL) -> Embedder:
+    """Small CPU embedding model shared by every index of the process"""
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        raise ImportError(
+            'You must install package `sentence-transformers` to rank by embeddings: '
+            'run `pip install sentence-transformers`.'
+        ) from None
+    model = SentenceTransformer(model_name, device='cpu')
+    return lambda texts: model.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True)
+
+
+@dataclass(frozen=True)
+class Hit:
+    doc_id: str
+    source: str
+    text: str
+    score: float
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the `k` best positive scores, best first"""
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+class RetrievalIndex:
+    """In-memory BM25 index of text passages, with an optional embedding ranking fused in.
+
+    Documents are split into passages; each passage gets a slot, and the postings of a term map slots to term
+    frequencies. A search scores every slot holding a query term with NumPy, one vector operation per term.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder | None = None,
+        chunk_chars: int = DEFAULT_CHUNK_CHARS,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.embedder = embedder
+        self.chunk_chars = chunk_chars
+        self.k1 = k1
+        self.b = b
+        self._docs: dict[str, list[int]] = {}
+        self._ids: list[str | None] = []
+        self._sources: list[str] = []
+        self._texts: list[str] = []
+        self._lengths: list[int] = []
+        self._free: list[int] = []
+        self._postings: dict[str, dict[int, int]] = {}
+        self._vectors: np.ndarray | None = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._docs
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, doc_id: str, text: str, source: str = '', replace: bool = True) -> bool:
+        """Indexes a document; with `replace` unset an already indexed document is kept as it is"""
+        passages = chunk(text, self.chunk_chars)
+        vectors = self.embedder(passages) if self.embedder is not None and passages else None
+        with self._lock:
+            if doc_id in self._docs:
+                if not replace:
+                    return False
+                self._remove(doc_id)
+            slots = []
+            for idx, passage in enumerate(passages):
+                slot = self._free.pop() if self._free else self._new_slot()
+                counts = Counter(terms(passage))
+                self._ids[slot] = doc_id
+                self._sources[slot] = source
+                self._texts[slot] = passage
+                self._lengths[slot] = sum(counts.values())
+                for term, count in counts.items():
+                    self._postings.setdefault(term, {})[slot] = count
+                if vectors is not None:
+                    self._set_vector(slot, vectors[idx])
+                slots.append(slot)
+            self._docs[doc_id] = slots
+        return True
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            if doc_id in self._docs:
+                self._remove(doc_id)
+
+    def clear(self, prefix: str = '') -> None:
+        """Removes the documents whose id starts with `prefix`"""
+        with self._lock:
+            for doc_id in [doc_id for doc_id in self._docs if doc_id.startswith(prefix)]:
+                self._remove(doc_id)
+
+    def _new_slot(self) -> int:
+        self._ids.append(None)
+        self._sources.append('')
+        self._texts.append('')
+        self._lengths.append(0)
+        return len(self._ids) - 1
+
+    def _set_vector(self, slot: int, vector: np.ndarray) -> None:
+        if self._vectors is None:
+            self._vectors = np.zeros((0, len(vector)), dtype=np.float32)
+        if slot >= len(self._vectors):
+            grown = np.zeros((max(slot + 1, 2 * len(self._vectors)), self._vectors.shape[1]), dtype=np.float32)
+            grown[: len(self._vectors)] = self._vectors
+            self._vectors = grown
+        self._vectors[slot] = vector
+
+    def _remove(self, doc_id: str) -> None:
+        for slot in self._docs.pop(doc_id):
+            for term in set(terms(self._texts[slot])):
+                postings = self._postings[term]
+                del postings[slot]
+                if not postings:
+                    del self._postings[term]
+            self._ids[slot] = None
+            self._texts[slot] = ''
+            self._lengths[slot] = 0
+            if self._vectors is not None and slot < len(self._vectors):
+                self._vectors[slot] = 0
+            self._free.append(slot)
+
+    def bm25(self, query: str) -> np.ndarray:
+        """BM25 score of every slot for the query"""
+        scores = np.zeros(len(self._ids))
+        lengths = np.asarray(self._lengths, dtype=float)
+        alive = len(self._ids) - len(self._free)
+        if not alive:
+            return scores
+        norm = self.k1 * (1 - self.b + self.b * lengths / (lengths.sum() / alive or 1))
+        for term in set(terms(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            slots = np.fromiter(postings.keys(), dtype=np.intp, count=len(postings))
+            tf = np.fromiter(postings.values(), dtype=float, count=len(postings))
+            idf = math.log1p((alive - len(postings) + 0.5) / (len(postings) + 0.5))
+            scores[slots] += idf * tf * (self.k1 + 1) / (tf + norm[slots])
+        return scores
+
+    def search(self, query: str, k: int = 5) -> list[Hit]:
+        query_vector = self.embedder([query])[0] if self.embedder is not None else None
+        with self._lock:
+            scores = self.bm25(query)
+            best = _top_k(scores, k)
+            if query_vector is not None and self._vectors is not None:
+                # the embedding ranking catches passages that share no word with the query
+                similarities = np.zeros(len(self._ids))
+                similarities[: len(self._vectors)] = self._vectors @ query_vector
+                fused: dict[int, float] = {}
+                for ranking in (_top_k(scores, 4 * k), _top_k(similarities, 4 * k)):
+                    for rank, slot in enumerate(ranking):
+                        fused[slot] = fused.get(slot, 0.0) + 1 / (RRF_K + rank + 1)
+                best = sorted(fused, key=fused.__getitem__, reverse=True)[:k]
+                scores = np.zeros(len(self._ids))
+                scores[best] = [fused[slot] for slot in best]
+            return [Hit(self._ids[slot], self._sources[slot], self._texts[slot], float(scores[slot])) for slot in best]
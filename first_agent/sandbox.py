@@ -0,0 +1,404 @@
+import ast
+import base64
+import importlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import pickle
+import queue
+import resource
+import signal
+import threading
+import time
+import types
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+from smolagents.local_python_executor import (
+    BASE_BUILTIN_MODULES,
+    BASE_PYTHON_TOOLS,
+    DEFAULT_MAX_LEN_OUTPUT,
+    InterpreterError,
+    evaluate_python_code,
+)
+
+log = logging.getLogger('sandbox')
+
+DEFAULT_MAX_RUNS = 50
+# interpreter entries that are rebuilt on every execution
+_INTERNAL_NAMES = frozenset({'_print_outputs', '_operations_count'})
+
+
+class SandboxError(InterpreterError):
+    """A worker went over its wall-clock limit or died while running code"""
+
+
+@dataclass(frozen=True)
+class SandboxLimits:
+    # per execution; time spent in tools, which run in the parent process, does not count
+    cpu_seconds: int = 30
+    wall_seconds: float = 60.0
+    # address space of the worker process, imported modules included
+    memory_bytes: int = 2 * 1024**3
+
+
+# Protocol between the parent and a worker. The parent sends pickled requests and tool results; the worker answers
+# with JSON only, so nothing the generated code produces is ever unpickled outside the sandbox. Variables are kept
+# by the parent as opaque pickles made and read by workers.
+#   parent -> worker  {'code', 'variables', 'definitions', 'tools', 'authorized_imports', 'max_print_outputs_length'}
+#   worker -> parent  {'op': 'call', 'tool', 'args', 'kwargs'}, answered with ('result', value, ref) or ('error', msg)
+#   worker -> parent  {'op': 'done', 'output', 'is_final_answer', 'logs', 'error', 'variables', 'definitions', ...}
+
+
+class _LimitExceeded(Exception):
+    pass
+
+
+def _cpu_exceeded(signum, frame):
+    raise _LimitExceeded('CPU time limit exceeded')
+
+
+def _set_cpu_limit(seconds: int) -> None:
+    """RLIMIT_CPU counts the whole life of the process: the soft limit is moved to `seconds` past the current usage"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (math.ceil(usage.ru_utime + usage.ru_stime) + seconds, hard))
+
+
+def _encode(value: Any, refs: dict[int, int]) -> dict:
+    """JSON form of a value sent to the parent; tool results go back as references to the parent's own object"""
+    if id(value) in refs:
+        return {'ref': refs[id(value)]}
+    try:
+        return {'value': json.loads(json.dumps(value))}
+    except (TypeError, ValueError):
+        return {'repr': str(value)}
+
+
+def _dump_variables(state: dict, skip: set[str]) -> tuple[dict, list[str]]:
+    variables, dropped = {}, []
+    for name, value in state.items():
+        if name in _INTERNAL_NAMES or name in skip:
+            continue
+        if isinstance(value, types.ModuleType):
+            variables[name] = {'module': value.__name__}
+            continue
+        try:
+            variables[name] = {'pickle': base64.b64encode(pickle.dumps(value)).decode()}
+        except Exception:
+            dropped.append(name)
+    return variables, dropped
+
+
+def _load_variables(variables: dict) -> dict:
+    state = {}
+    for name, value in variables.items():
+        if 'module' in value:
+            state[name] = importlib.import_module(value['module'])
+        else:
+            state[name] = pickle.loads(base64.b64decode(value['pickle']))
+    return state
+
+
+def _execute(conn, request: dict) -> dict:
+    refs: dict[int, int] = {}
+    # tool results are kept alive so their ids stay unique during the execution
+    results: list[Any] = []
+
+    def remote_tool(name: str) -> Callable:
+        def call(*args, **kwargs):
+            message = {
+                'op': 'call',
+                'tool': name,
+                'args': [_encode(arg, refs) for arg in args],
+                'kwargs': {key: _encode(value, refs) for key, value in kwargs.items()},
+            }
+            conn.send_bytes(json.dumps(message).encode())
+            reply = conn.recv()
+            if reply[0] == 'error':
+                raise RuntimeError(reply[1])
+            _, value, ref = reply
+            results.append(value)
+            refs[id(value)] = ref
+            return value
+
+        call.__name__ = name
+        return call
+
+    static_tools = {**{name: remote_tool(name) for name in request['tools']}, **BASE_PYTHON_TOOLS}
+    custom_tools: dict[str, Callable] = {}
+    state: dict[str, Any] = {}
+    definitions = dict(request['definitions'])
+    output, is_final_answer, error, limit = None, False, None, None
+    evaluate = {
+        'static_tools': static_tools,
+        'custom_tools': custom_tools,
+        'state': state,
+        'authorized_imports': request['authorized_imports'],
+        'max_print_outputs_length': request['max_print_outputs_length'],
+    }
+    try:
+        state.update(_load_variables(request['variables']))
+        # functions and classes cannot be pickled, their source is evaluated again
+        for source in definitions.values():
+            evaluate_python_code(source, **evaluate)
+        output, is_final_answer = evaluate_python_code(request['code'], **evaluate)
+    except Exception as e:
+        error = str(e)
+        if 'CPU time limit exceeded' in error:
+            limit = 'cpu'
+        elif 'MemoryError' in error:
+            limit = 'memory'
+    try:
+        tree = ast.parse(request['code'])
+    except SyntaxError:
+        tree = ast.Module(body=[], type_ignores=[])
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef | ast.AsyncFunctionDef | ast.ClassDef):
+            if node.name in custom_tools or node.name in state:
+                definitions[node.name] = ast.unparse(node)
+    variables, dropped = _dump_variables(state, set(definitions))
+    return {
+        'op': 'done',
+        'output': _encode(output, refs),
+        'is_final_answer': is_final_answer,
+        'logs': str(state.get('_print_outputs', '')),
+        'error': error,
+        'variables': variables,
+        'definitions': definitions,
+        'dropped': dropped,
+        'limit': limit,
+    }
+
+
+def _worker_main(conn, limits: SandboxLimits, preload: Sequence[str]) -> None:
+    # no-ops when the fork server already imported them
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    resource.setrlimit(resource.RLIMIT_AS, (limits.memory_bytes, limits.memory_bytes))
+    signal.signal(signal.SIGXCPU, _cpu_exceeded)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        _set_cpu_limit(limits.cpu_seconds)
+        response = _execute(conn, request)
+        conn.send_bytes(json.dumps(response).encode())
+
+
+class _Worker:
+    def __init__(self, context, limits: SandboxLimits, preload: Sequence[str]):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, limits, tuple(preload)), name='sandbox-worker', daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.runs = 0
+
+    def execute(self, request: dict, call_tool: Callable[[dict], tuple], wall_seconds: float) -> dict:
+        self.conn.send(request)
+        remaining = wall_seconds
+        while True:
+            start = time.monotonic()
+            if not self.conn.poll(max(remaining, 0)):
+                raise SandboxError(f'Code execution took over {wall_seconds}s and was stopped')
+            try:
+                message = json.loads(self.conn.recv_bytes())
+            except (EOFError, OSError):
+                self.process.join(1)
+                raise SandboxError(f'Sandbox worker died with exit code {self.process.exitcode}') from None
+            remaining -= time.monotonic() - start
+            if message['op'] == 'done':
+                return message
+            self.conn.send(call_tool(message))
+
+    def close(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class SandboxPool:
+    """Pool of Python worker processes running generated code.
+
+    Workers are forked from a fork server that imported `preload` once, so a new worker starts with the authorized
+    modules loaded. Every execution runs under CPU time and address space limits; a worker going over the wall-clock
+    limit is killed, and workers are replaced after `max_runs` executions or when they hit a limit.
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        limits: SandboxLimits | None = None,
+        max_runs: int = DEFAULT_MAX_RUNS,
+        preload: Sequence[str] = (),
+    ):
+        self.size = workers or os.cpu_count() or 1
+        self.limits = limits or SandboxLimits()
+        self.max_runs = max_runs
+        self.preload = tuple(preload)
+        self.context = multiprocessing.get_context('forkserver')
+        # the fork server is shared by the process and starts with the first worker, later preloads are ignored
+        self.context.set_forkserver_preload([__name__, *self.preload])
+        self.executions = 0
+        self.recycled = 0
+        # workers killed on a timeout or found dead
+        self.failures = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._idle: queue.LifoQueue[_Worker] = queue.LifoQueue()
+        for _ in range(self.size):
+            self._idle.put(self._start_worker())
+
+    def _start_worker(self) -> _Worker:
+        return _Worker(self.context, self.limits, self.preload)
+
+    def execute(self, request: dict, call_tool: Callable[[dict], tuple]) -> dict:
+        """Runs a request on an idle worker, waiting for one when all are busy"""
+        if self._closed:
+            raise SandboxError('Sandbox pool is closed')
+        worker = self._idle.get()
+        healthy = False
+        try:
+            response = worker.execute(request, call_tool, self.limits.wall_seconds)
+            worker.runs += 1
+            healthy = worker.runs < self.max_runs and not response['limit']
+            return response
+        except SandboxError:
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            with self._lock:
+                self.executions += 1
+            if not healthy:
+                with self._lock:
+                    self.recycled += 1
+                worker.kill()
+                if not self._closed:
+                    worker = self._start_worker()
+            if not self._closed:
+                self._idle.put(worker)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'workers': self.size,
+                'idle': self._idle.qsize(),
+                'executions': self.executions,
+                'recycled': self.recycled,
+                'failures': self.failures,
+            }
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class SandboxExecutor:
+    """Python executor of a CodeAgent running the code in a `SandboxPool` worker.
+
+    Tools run in the calling process, so they keep the bound agent context; the code only sees proxies. Variables
+    that can be pickled and top-level functions and classes are kept between steps like in the local interpreter;
+    modules are imported again.
+    """
+
+    def __init__(
+        self,
+        pool: SandboxPool,
+        additional_authorized_imports: Sequence[str],
+        tools: dict,
+        max_print_outputs_length: int | None = None,
+    ):
+        self.pool = pool
+        self.tools = tools
+        self.authorized_imports = sorted(set(BASE_BUILTIN_MODULES) | set(additional_authorized_imports))
+        self.max_print_outputs_length = max_print_outputs_length or DEFAULT_MAX_LEN_OUTPUT
+        # read by CodeAgent for the print outputs of failed code
+        self.state: dict[str, Any] = {}
+        self.variables: dict[str, dict] = {}
+        self.definitions: dict[str, str] = {}
+
+    def __call__(self, code_action: str, additional_variables: dict) -> tuple[Any, str, bool]:
+        for name, value in additional_variables.items():
+            try:
+                self.variables[name] = {'pickle': base64.b64encode(pickle.dumps(value)).decode()}
+            except Exception:
+                log.warning(f'Variable {name!r} cannot be sent to the sandbox')
+        results: list[Any] = []
+        request = {
+            'code': code_action,
+            'variables': self.variables,
+            'definitions': self.definitions,
+            'tools': list(self.tools),
+            'authorized_imports': self.authorized_imports,
+            'max_print_outputs_length': self.max_print_outputs_length,
+        }
+        self.state['_print_outputs'] = ''
+        response = self.pool.execute(request, lambda message: self._call_tool(message, results))
+        self.variables = response['variables']
+        self.definitions = response['definitions']
+        logs = response['logs']
+        if response['dropped']:
+            logs += f'\nNote: {", ".join(response["dropped"])} cannot be kept for the next steps.'
+        self.state['_print_outputs'] = logs
+        if response['error']:
+            raise InterpreterError(response['error'])
+        return self._decode(response['output'], results), logs, response['is_final_answer']
+
+    def _call_tool(self, message: dict, results: list[Any]) -> tuple:
+        try:
+            tool = self.tools[message['tool']]
+            args = [self._decode(arg, results) for arg in message['args']]
+            kwargs = {key: self._decode(value, results) for key, value in message['kwargs'].items()}
+            result = tool(*args, **kwargs)
+        except Exception as e:
+            return ('error', f'{type(e).__name__}: {e}')
+        results.append(result)
+        try:
+            pickle.dumps(result)
+        except Exception:
+            result = str(result)
+        return ('result', result, len(results) - 1)
+
+    @staticmethod
+    def _decode(value: dict, results: list[Any]) -> Any:
+        if 'ref' in value:
+            return results[value['ref']]
+        return value['value'] if 'value' in value else value['repr']
+
+
+def use_sandbox(agent, pool: SandboxPool) -> None:
+    """Runs the code of `agent` in `pool` instead of the in-process interpreter"""
+    agent.python_executor = SandboxExecutor(
+        pool,
+        agent.additional_authorized_imports,
+        {**agent.tools, **agent.managed_agents},
+        max_print_outputs_length=agent.max_print_outputs_length,
+    )
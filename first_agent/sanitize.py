@@ -0,0 +1,49 @@
+import re
+
+# Cleanup of step output for display, shared by the Gradio UI and other consumers. Each function looks for its
+# markers with a substring search first: most step logs have none, so the text is scanned once, not once per pattern.
+
+END_CODE = '<end_code>'
+FENCE = '```'
+
+_FENCE_END_CODE_RE = re.compile(r'```\s*<end_code>')
+_END_CODE_FENCE_RE = re.compile(r'<end_code>\s*```')
+# only matches again when the previous substitution produced a new fence
+_FENCE_NEWLINE_END_CODE_RE = re.compile(r'```\s*\n\s*<end_code>')
+_FENCE_LINE_RE = re.compile(r'```.*?\n')
+_END_CODE_RE = re.compile(r'\s*<end_code>\s*')
+# leading whitespace and header in one match, so a large log is copied once
+_EXECUTION_LOGS_RE = re.compile(r'\s*(?:Execution logs:\s*)?')
+
+
+def clean_model_output(text: str) -> str:
+    """Model output without <end_code> markers next to code fences"""
+    text = text.strip()
+    if END_CODE not in text or FENCE not in text:
+        return text
+    for pattern in (_FENCE_END_CODE_RE, _END_CODE_FENCE_RE, _FENCE_NEWLINE_END_CODE_RE):
+        text = pattern.sub(FENCE, text)
+        if END_CODE not in text:
+            break
+    return text.strip()
+
+
+def clean_code(code: str) -> str:
+    """Code of a python_interpreter call as a single ```python block"""
+    if FENCE in code:
+        code = _FENCE_LINE_RE.sub('', code)
+    if END_CODE in code:
+        code = _END_CODE_RE.sub('', code)
+    code = code.strip()
+    if not code.startswith('```python'):
+        code = f'```python\n{code}\n```'
+    return code
+
+
+def clean_observations(text: str) -> str:
+    """Observations without the leading 'Execution logs:' header"""
+    start = _EXECUTION_LOGS_RE.match(text).end()
+    end = len(text)
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return text[start:end]
@@ -0,0 +1,416 @@
+import argparse
+import functools
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from smolagents.memory import ActionStep, MemoryStep, PlanningStep
+
+from first_agent.context_tools import AgentContext, bind_context
+from first_agent.memory_store import MemoryStore, open_memory
+from first_agent.models import stream_tokens
+from first_agent.sanitize import clean_code, clean_model_output, clean_observations
+from first_agent.usage import BudgetExceeded, TokenBudget, UsageLedger, UsageMeter
+
+log = logging.getLogger('server')
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_QUEUE = 16
+DEFAULT_MAX_SESSIONS = 64
+# sessions without a run for this long are closed
+SESSION_IDLE_TTL = 30 * 60
+# expired memory keys are deleted when a session is created, at most this often
+MEMORY_EVICT_INTERVAL = 10 * 60
+
+
+class Busy(Exception):
+    """No capacity left, the client should retry later"""
+
+
+class Conflict(Exception):
+    """The session already has a run in progress"""
+
+
+class WorkerPool:
+    """Runs agents on a fixed number of threads, with a bounded number of runs waiting for one"""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_queue: int = DEFAULT_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='agent-run')
+        self.queued = 0
+        self.running = 0
+        self.rejected = 0
+        self.completed = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args) -> None:
+        with self._lock:
+            if self.queued + self.running >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise Busy(f'{self.running} runs in progress and {self.queued} waiting')
+            self.queued += 1
+        self.executor.submit(self._run, fn, *args)
+
+    def _run(self, fn: Callable, *args) -> None:
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class Run:
+    def __init__(self, task: str):
+        self.task = task
+        # events for the client, None marks the end
+        self.events: queue.Queue[dict | None] = queue.Queue()
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+
+
+@dataclass
+class Session:
+    id: str
+    user: str | None
+    agent: Any
+    context: AgentContext
+    last_used: float = field(default_factory=time.monotonic)
+    run: Run | None = None
+    # held while a run is checked for and started, one agent must not run on two threads
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def busy(self) -> bool:
+        return self.run is not None and not self.run.done.is_set()
+
+
+# builds an agent with its own context on the given memory namespace
+SessionFactory = Callable[[MemoryStore], tuple[Any, AgentContext]]
+
+
+def default_session_factory(memory: MemoryStore, **kwargs: Any) -> tuple[Any, AgentContext]:
+    """Agent of a new session, keyword arguments go to `build_session`: with a `sandbox` pool the code of every
+    session runs in its worker processes"""
+    from first_agent.agent import build_model, build_session
+
+    return build_session(build_model(), memory, **kwargs)
+
+
+class SessionPool:
+    def __init__(
+        self,
+        factory: SessionFactory,
+        memory: MemoryStore,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        idle_ttl: float = SESSION_IDLE_TTL,
+        usage: UsageLedger | None = None,
+        budget: TokenBudget | None = None,
+    ):
+        self.factory = factory
+        self.memory = memory
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.usage = usage if usage is not None else UsageLedger()
+        self.budget = budget
+        self.sessions: dict[str, Session] = {}
+        self._lock = threading.Lock()
+
+    def create(self, user: str | None = None) -> Session:
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._evict_idle()
+            self.memory.evict_expired(every=MEMORY_EVICT_INTERVAL)
+            if len(self.sessions) >= self.max_sessions:
+                idle = [session for session in self.sessions.values() if not session.busy]
+                if not idle:
+                    raise Busy(f'All {self.max_sessions} sessions are running')
+                self._drop(min(idle, key=lambda session: session.last_used).id)
+            # a user keeps its memory across sessions
+            namespace = f'user:{user}' if user else f'session:{session_id}'
+            agent, context = self.factory(self.memory.session(namespace))
+            context.name = f'session:{session_id}'
+            agent.step_callbacks.append(UsageMeter(self.usage, session_id, user, self.budget))
+            session = self.sessions[session_id] = Session(session_id, user, agent, context)
+            return session
+
+    def _drop(self, session_id: str) -> Session | None:
+        self.usage.drop_session(session_id)
+        return self.sessions.pop(session_id, None)
+
+    def _evict_idle(self) -> None:
+        deadline = time.monotonic() - self.idle_ttl
+        for session in list(self.sessions.values()):
+            if not session.busy and session.last_used < deadline:
+                self._drop(session.id)
+
+    def get(self, session_id: str) -> Session | None:
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+            return session
+
+    def close(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._drop(session_id)
+        if session is not None and session.run is not None:
+            session.run.cancelled.set()
+        return session is not None
+
+
+def step_event(step: Any) -> dict:
+    if isinstance(step, ActionStep):
+        code = None
+        if step.tool_calls and step.tool_calls[0].name == 'python_interpreter':
+            code = clean_code(str(step.tool_calls[0].arguments))
+        return {
+            'type': 'step',
+            'step': step.step_number,
+            'model_output': clean_model_output(step.model_output) if step.model_output else None,
+            'code': code,
+            'observations': clean_observations(step.observations) if step.observations else None,
+            'error': str(step.error) if step.error is not None else None,
+            'duration': step.duration,
+        }
+    if isinstance(step, PlanningStep):
+        return {'type': 'planning', 'plan': step.plan}
+    if isinstance(step, MemoryStep):
+        return {'type': type(step).__name__}
+    # the last item of a run is its final answer
+    return {'type': 'final_answer', 'answer': str(step)}
+
+
+class AgentServer:
+    def __init__(
+        self,
+        factory: SessionFactory = default_session_factory,
+        memory: MemoryStore | None = None,
+        workers: int = DEFAULT_WORKERS,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        budget: TokenBudget | None = None,
+    ):
+        if memory is None:
+            memory = open_memory()
+        self.usage = UsageLedger()
+        self.sessions = SessionPool(factory, memory, max_sessions=max_sessions, usage=self.usage, budget=budget)
+        self.pool = WorkerPool(workers, max_queue)
+
+    def start_run(self, session: Session, task: str, reset: bool = False) -> Run:
+        with session.lock:
+            if session.busy:
+                raise Conflict(f'Session {session.id} is already running a task')
+            run = Run(task)
+            self.pool.submit(self._execute, session, run, reset)
+            session.run = run
+        return run
+
+    def _execute(self, session: Session, run: Run, reset: bool) -> None:
+        streaming = stream_tokens(
+            getattr(session.agent, 'model', None), lambda text: run.events.put({'type': 'token', 'text': text})
+        )
+        try:
+            with bind_context(session.context), streaming:
+                steps = session.agent.run(run.task, stream=True, reset=reset)
+                for step in steps:
+                    if run.cancelled.is_set():
+                        steps.close()
+                        run.events.put({'type': 'cancelled'})
+                        break
+                    run.events.put(step_event(step))
+        except BudgetExceeded as e:
+            run.events.put({'type': 'budget_exceeded', 'error': str(e)})
+        except Exception as e:
+            log.exception(f'Run failed in session {session.id}')
+            run.events.put({'type': 'error', 'error': f'{type(e).__name__}: {e}'})
+        finally:
+            session.last_used = time.monotonic()
+            run.events.put(None)
+            run.done.set()
+
+    def metrics(self) -> str:
+        """Prometheus text format"""
+        pool = self.pool
+        values = [
+            ('agent_server_sessions', 'gauge', len(self.sessions.sessions)),
+            ('agent_server_workers', 'gauge', pool.workers),
+            ('agent_server_runs_running', 'gauge', pool.running),
+            ('agent_server_runs_queued', 'gauge', pool.queued),
+            ('agent_server_runs_rejected_total', 'counter', pool.rejected),
+            ('agent_server_runs_completed_total', 'counter', pool.completed),
+        ]
+        lines = []
+        for name, kind, value in values:
+            lines += [f'# TYPE {name} {kind}', f'{name} {value}']
+        return '\n'.join(lines) + '\n' + self.usage.metrics()
+
+
+def _make_handler(server: AgentServer) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send(self, status: int, body: bytes, content_type: str, headers: dict | None = None) -> None:
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, status: int, data: Any, headers: dict | None = None) -> None:
+            self._send(status, json.dumps(data, default=str).encode(), 'application/json', headers)
+
+        def _error(self, status: int, message: str, headers: dict | None = None) -> None:
+            self._json(status, {'error': message}, headers)
+
+        def _body(self) -> dict:
+            length = int(self.headers.get('Content-Length') or 0)
+            if not length:
+                return {}
+            return json.loads(self.rfile.read(length))
+
+        def _session(self, session_id: str) -> Session | None:
+            session = server.sessions.get(session_id)
+            if session is None:
+                self._error(404, f'Unknown session {session_id}')
+            return session
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._json(200, {'status': 'ok'})
+            elif self.path == '/metrics':
+                self._send(200, server.metrics().encode(), 'text/plain; version=0.0.4')
+            else:
+                self._error(404, f'Unknown path {self.path}')
+
+        def do_DELETE(self):
+            parts = self.path.strip('/').split('/')
+            if len(parts) == 2 and parts[0] == 'sessions' and server.sessions.close(parts[1]):
+                self._send(204, b'', 'application/json')
+            else:
+                self._error(404, f'Unknown path {self.path}')
+
+        def do_POST(self):
+            parts = self.path.strip('/').split('/')
+            try:
+                body = self._body()
+            except ValueError as e:
+                return self._error(400, f'Invalid JSON: {e}')
+            try:
+                if parts == ['sessions']:
+                    session = server.sessions.create(body.get('user'))
+                    return self._json(201, {'session_id': session.id})
+                if len(parts) == 3 and parts[0] == 'sessions' and parts[2] == 'runs':
+                    return self._post_run(parts[1], body)
+            except Busy as e:
+                return self._error(429, str(e), {'Retry-After': '1'})
+            except Conflict as e:
+                return self._error(409, str(e))
+            self._error(404, f'Unknown path {self.path}')
+
+        def _post_run(self, session_id: str, body: dict) -> None:
+            session = self._session(session_id)
+            if session is None:
+                return
+            if not body.get('task'):
+                return self._error(400, 'task is required')
+            run = server.start_run(session, body['task'], reset=bool(body.get('reset', False)))
+            if not body.get('stream', True):
+                events = list(iter(run.events.get, None))
+                answers = [event['answer'] for event in events if event['type'] == 'final_answer']
+                return self._json(200, {'answer': answers[-1] if answers else None, 'events': events})
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            try:
+                for event in iter(run.events.get, None):
+                    self.wfile.write(f'event: {event["type"]}\ndata: {json.dumps(event, default=str)}\n\n'.encode())
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # nobody is listening anymore, stop the run at the next step
+                run.cancelled.set()
+
+        def log_message(self, format, *args):
+            log.debug(format, *args)
+
+    return Handler
+
+
+def make_server(agent_server: AgentServer, host: str = '127.0.0.1', port: int = 8000) -> ThreadingHTTPServer:
+    httpd = ThreadingHTTPServer((host, port), _make_handler(agent_server))
+    httpd.daemon_threads = True
+    return httpd
+
+
+def get_args(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description='Serve agent sessions over HTTP/JSON with SSE streaming')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='runs executed at the same time')
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE, help='runs waiting for a worker')
+    parser.add_argument('--max-sessions', type=int, default=DEFAULT_MAX_SESSIONS)
+    parser.add_argument(
+        '--sandbox-workers', type=int, default=0, help='processes running generated code, 0 runs it in the server'
+    )
+    parser.add_argument(
+        '--context-tokens',
+        type=int,
+        help='compact the memory of an agent over this many tokens, 3/4 of the model context window by default',
+    )
+    parser.add_argument('--memory-db', metavar='FILE', help='SQLite file of the persistent agent memory')
+    parser.add_argument('--max-run-tokens', type=int, help='stop a run after the step that goes over this many tokens')
+    parser.add_argument('--max-session-tokens', type=int, help='stop runs of a session over this many tokens')
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    args = get_args(argv)
+    sandbox = None
+    if args.sandbox_workers:
+        from first_agent.agent import AUTHORIZED_IMPORTS
+        from first_agent.sandbox import SandboxPool
+
+        sandbox = SandboxPool(args.sandbox_workers, preload=AUTHORIZED_IMPORTS)
+    factory = functools.partial(default_session_factory, sandbox=sandbox, context_token_budget=args.context_tokens)
+    agent_server = AgentServer(
+        factory,
+        open_memory(args.memory_db),
+        workers=args.workers,
+        max_queue=args.max_queue,
+        max_sessions=args.max_sessions,
+        budget=TokenBudget(args.max_run_tokens, args.max_session_tokens),
+    )
+    httpd = make_server(agent_server, args.host, args.port)
+    log.info(f'Serving on http://{args.host}:{args.port}')
+    try:
+        httpd.serve_forever()
+    finally:
+        agent_server.pool.shutdown()
+        if sandbox is not None:
+            sandbox.close()
+
+
+if __name__ == '__main__':
+    main()
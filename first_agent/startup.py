@@ -0,0 +1,61 @@
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+
+# `import time:      1080 |      78534 |         httpx._main`
+_IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+@dataclass
+class ImportTiming:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(text: str) -> list[ImportTiming]:
+    """Timings from the stderr of `python -X importtime`"""
+    timings = []
+    for line in text.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            timings.append(ImportTiming(module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return timings
+
+
+def top_level(timings: list[ImportTiming]) -> dict[str, int]:
+    """Cumulative import time per top-level package, in microseconds"""
+    totals: dict[str, int] = defaultdict(int)
+    for timing in timings:
+        if timing.depth == 0:
+            totals[timing.module.partition('.')[0]] += timing.cumulative_us
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def format_report(timings: list[ImportTiming], limit: int = 15) -> str:
+    total = sum(timing.cumulative_us for timing in timings if timing.depth == 0)
+    lines = [f'Imported {len(timings)} modules in {total / 1000:.0f} ms', '', 'By top-level package:']
+    for package, cumulative_us in list(top_level(timings).items())[:limit]:
+        lines.append(f'{cumulative_us / 1000:10.1f} ms  {package}')
+    lines += ['', 'Slowest modules (self time):']
+    for timing in sorted(timings, key=lambda timing: timing.self_us, reverse=True)[:limit]:
+        lines.append(f'{timing.self_us / 1000:10.1f} ms  {timing.module}')
+    return '\n'.join(lines)
+
+
+def profile_startup(args: list[str], limit: int = 15) -> str:
+    """Runs `python -X importtime -m first_agent <args>` and reports where the import time went"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'first_agent', *args],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    report = format_report(parse_importtime(result.stderr), limit)
+    # the child logs its own phase timings to stderr too
+    phases = [line for line in result.stderr.splitlines() if 'startup:' in line]
+    return '\n'.join([report, '', *phases]) if phases else report
@@ -0,0 +1,64 @@
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from first_agent.cache import DiskCache, LRUCache
+
+
+@dataclass
+class CachedPage:
+    url: str
+    markdown: str
+    etag: str | None = None
+    last_modified: str | None = None
+    fetched_at: float = 0.0
+
+
+class FetchCache:
+    """Converted pages keyed by url: in-memory LRU in front of an optional size-bounded disk tier.
+
+    Pages older than `ttl` are not dropped, they are revalidated with ETag/Last-Modified.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        maxsize: int = 128,
+        directory: Path | str | None = None,
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.ttl = ttl
+        self.memory = LRUCache(maxsize=maxsize)
+        self.disk = DiskCache(directory, max_bytes=max_bytes) if directory is not None else None
+
+    def get(self, url: str) -> CachedPage | None:
+        page = self.memory.get(url)
+        if page is None and self.disk is not None:
+            page = self.disk.get(url)
+            if page is not None:
+                self.memory.set(url, page)
+        return page
+
+    def put(self, page: CachedPage) -> None:
+        self.memory.set(page.url, page)
+        if self.disk is not None:
+            self.disk.set(page.url, page)
+
+    def is_fresh(self, page: CachedPage) -> bool:
+        return time.time() - page.fetched_at < self.ttl
+
+    def revalidated(self, page: CachedPage) -> None:
+        """Server answered 304 Not Modified"""
+        page.fetched_at = time.time()
+        self.put(page)
+
+    @staticmethod
+    def conditional_headers(page: CachedPage | None) -> dict[str, str]:
+        headers = {}
+        if page is None:
+            return headers
+        if page.etag:
+            headers['If-None-Match'] = page.etag
+        if page.last_modified:
+            headers['If-Modified-Since'] = page.last_modified
+        return headers
@@ -0,0 +1,143 @@
+import codecs
+import re
+from html.parser import HTMLParser
+
+# content of these tags is dropped as soon as the tag is seen
+SKIP_TAGS = frozenset(
+    {'script', 'style', 'noscript', 'template', 'svg', 'canvas', 'iframe', 'nav', 'header', 'footer', 'aside', 'form'}
+)
+VOID_TAGS = frozenset({'br', 'hr', 'img', 'input', 'meta', 'link', 'area', 'base', 'col', 'source', 'wbr'})
+BLOCK_TAGS = frozenset(
+    {'p', 'div', 'section', 'article', 'main', 'table', 'tr', 'ul', 'ol', 'dl', 'dt', 'dd', 'blockquote', 'figure'}
+)
+HEADINGS = {'h1': '# ', 'h2': '## ', 'h3': '### ', 'h4': '#### ', 'h5': '##### ', 'h6': '###### '}
+INLINE_MARKS = {'strong': '**', 'b': '**', 'em': '*', 'i': '*', 'code': '`'}
+
+CHUNK_SIZE = 16 * 1024
+MAX_BYTES = 2 * 1024 * 1024
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+
+class StreamingMarkdownConverter(HTMLParser):
+    """Incremental HTML to markdown converter with an output budget.
+
+    Feed it chunks as they arrive; boilerplate tags are skipped without being converted
+    and `done` is set once `max_chars` of markdown were produced.
+    """
+
+    def __init__(self, max_chars: int):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.size = 0
+        self.done = False
+        self._parts: list[str] = []
+        self._skip_depth = 0
+        self._pre_depth = 0
+        self._link: tuple[str, list[str]] | None = None
+
+    def _emit(self, text: str) -> None:
+        if self.done or not text:
+            return
+        if self._link is not None:
+            self._link[1].append(text)
+            return
+        self._parts.append(text)
+        self.size += len(text)
+        if self.size >= self.max_chars:
+            self.done = True
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        if self._skip_depth:
+            return
+        if tag in HEADINGS:
+            self._emit('\n\n' + HEADINGS[tag])
+        elif tag in BLOCK_TAGS:
+            self._emit('\n\n')
+        elif tag == 'li':
+            self._emit('\n- ')
+        elif tag == 'br':
+            self._emit('\n')
+        elif tag in ('td', 'th'):
+            self._emit(' | ')
+        elif tag == 'pre':
+            self._pre_depth += 1
+            self._emit('\n\n```\n')
+        elif tag in INLINE_MARKS and not self._pre_depth:
+            self._emit(INLINE_MARKS[tag])
+        elif tag == 'a' and self._link is None:
+            href = dict(attrs).get('href')
+            if href and not href.startswith(('#', 'javascript:')):
+                self._link = (href, [])
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+            return
+        if self._skip_depth:
+            return
+        if tag in HEADINGS or tag in BLOCK_TAGS:
+            self._emit('\n\n')
+        elif tag == 'pre':
+            self._pre_depth = max(self._pre_depth - 1, 0)
+            self._emit('\n```\n\n')
+        elif tag in INLINE_MARKS and not self._pre_depth:
+            self._emit(INLINE_MARKS[tag])
+        elif tag == 'a' and self._link is not None:
+            href, parts = self._link
+            self._link = None
+            text = ''.join(parts).strip()
+            if text:
+                self._emit(f'[{text}]({href})')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag not in VOID_TAGS:
+            self.handle_starttag(tag, attrs)
+            self.handle_endtag(tag)
+        elif not self._skip_depth and tag == 'br':
+            self._emit('\n')
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if not self._pre_depth:
+            data = _WHITESPACE_RE.sub(' ', data)
+            last = self._link[1] if self._link is not None else self._parts
+            if not last or last[-1].endswith(('\n', ' ')):
+                data = data.lstrip()
+        self._emit(data)
+
+    def markdown(self) -> str:
+        text = ''.join(self._parts)[: self.max_chars]
+        return _BLANK_LINES_RE.sub('\n\n', text).strip()
+
+
+def stream_markdown(response, max_chars: int, max_bytes: int = MAX_BYTES) -> str:
+    """Convert a streamed `requests` response, reading at most `max_bytes` of the body"""
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+    content_type = response.headers.get('Content-Type', 'text/html')
+    converter = StreamingMarkdownConverter(max_chars) if 'html' in content_type else None
+    parts = []
+    size = 0
+    read = 0
+    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+        read += len(chunk)
+        text = decoder.decode(chunk, final=read >= max_bytes)
+        if converter is not None:
+            converter.feed(text)
+            if converter.done:
+                break
+        else:
+            parts.append(text)
+            size += len(text)
+            if size >= max_chars:
+                break
+        if read >= max_bytes:
+            break
+    if converter is None:
+        return ''.join(parts)[:max_chars].strip()
+    converter.close()
+    return converter.markdown()
@@ -0,0 +1,34 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = 20
+# number of hosts to keep pools for and connections kept alive per host
+POOL_HOSTS = 32
+POOL_CONNECTIONS_PER_HOST = 4
+
+_session = None
+_lock = threading.Lock()
+
+
+def make_session(
+    pool_hosts: int = POOL_HOSTS,
+    connections_per_host: int = POOL_CONNECTIONS_PER_HOST,
+) -> requests.Session:
+    """Session with keep-alive pools; requests over the per-host limit wait for a free connection"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=connections_per_host, pool_block=True)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Process-wide pooled session shared by the web tools"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = make_session()
+    return _session
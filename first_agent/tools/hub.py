@@ -0,0 +1,73 @@
+import logging
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+from smolagents.tools import Tool
+
+log = logging.getLogger('hub_tools')
+
+TEXT_TO_IMAGE_REPO = 'agents-course/text-to-image'
+
+
+@lru_cache(maxsize=None)
+def load_hub_tool(repo_id: str) -> Tool:
+    """Tool from a Hub space, read from the local Hub cache when it was downloaded before"""
+    try:
+        from huggingface_hub import hf_hub_download
+        from huggingface_hub.errors import LocalEntryNotFoundError
+    except ImportError as e:
+        raise ImportError(
+            'You must install package `huggingface_hub` to load tools from the Hub: '
+            'for instance run `pip install huggingface_hub`.'
+        ) from e
+    try:
+        tool_file = hf_hub_download(repo_id, 'tool.py', repo_type='space', local_files_only=True)
+    except LocalEntryNotFoundError:
+        log.info(f'Downloading tool {repo_id}')
+        tool_file = hf_hub_download(repo_id, 'tool.py', repo_type='space')
+    return Tool.from_code(Path(tool_file).read_text())
+
+
+class LazyHubTool(Tool):
+    """Hub tool that is loaded the first time the agent calls it, not when the agent is built"""
+
+    skip_forward_signature_validation = True
+
+    def __init__(self, repo_id: str, name: str, description: str, inputs: dict, output_type: str):
+        self.repo_id = repo_id
+        self.name = name
+        self.description = description
+        self.inputs = inputs
+        self.output_type = output_type
+        super().__init__()
+        self.tool: Tool | None = None
+        self._lock = threading.Lock()
+
+    def setup(self):
+        with self._lock:
+            if self.tool is None:
+                self.tool = load_hub_tool(self.repo_id)
+        self.is_initialized = True
+
+    def forward(self, *args, **kwargs) -> Any:
+        return self.tool(*args, **kwargs)
+
+
+def text_to_image_tool() -> LazyHubTool:
+    return LazyHubTool(
+        TEXT_TO_IMAGE_REPO,
+        name='image_generator',
+        description='This tool creates an image according to a prompt, which is a text description.',
+        inputs={
+            'prompt': {
+                'type': 'string',
+                'description': (
+                    "The image generator prompt. Don't hesitate to add details in the prompt to make the image "
+                    "look better, like 'high-res, photorealistic', etc."
+                ),
+            }
+        },
+        output_type='image',
+    )
@@ -0,0 +1,75 @@
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, ClassVar
+
+from smolagents.tools import Tool
+
+
+def mark_side_effect_free(*tools: Tool) -> None:
+    """Allow `run_parallel` to dispatch these tools concurrently"""
+    for tool in tools:
+        tool.side_effect_free = True
+
+
+def is_side_effect_free(tool: Tool) -> bool:
+    return getattr(tool, 'side_effect_free', False)
+
+
+class ParallelToolsTool(Tool):
+    name = 'run_parallel'
+    description = (
+        'Runs several tool calls in one go and returns their results as a list, in the same order. '
+        'Read-only tools (web_search, visit_webpage, get_file_contents...) run concurrently, '
+        'tools that modify something run one after another in the given order. '
+        "Example: run_parallel(calls=[{'tool': 'visit_webpage', 'args': {'url': url}} for url in urls])"
+    )
+    inputs: ClassVar[dict] = {
+        'calls': {
+            'type': 'array',
+            'description': "List of calls, each a dict {'tool': tool name, 'args': dict of tool arguments}.",
+        },
+    }
+    output_type = 'array'
+
+    def forward(self, calls: list[dict]) -> list[Any]:
+        results: list[Any] = [None] * len(calls)
+        pending: list[tuple[int, Future]] = []
+        for idx, call in enumerate(calls):
+            tool_name = call.get('tool')
+            tool = self.tools.get(tool_name)
+            if tool is None:
+                results[idx] = f'Error: unknown tool {tool_name!r}, should be one of {sorted(self.tools)}'
+                continue
+            args = call.get('args') or {}
+            if is_side_effect_free(tool):
+                # tools may depend on context variables of the calling thread, e.g. the bound agent context
+                context = contextvars.copy_context()
+                pending.append((idx, self.executor.submit(context.run, self._call, tool, args)))
+                continue
+            # a write call is a barrier: reads before it finish first, reads after it see its effect
+            self._collect(pending, results)
+            results[idx] = self._call(tool, args)
+        self._collect(pending, results)
+        return results
+
+    @staticmethod
+    def _call(tool: Tool, args: dict) -> Any:
+        try:
+            return tool(**args, sanitize_inputs_outputs=True)
+        except Exception as e:
+            return f'Error in {tool.name}: {type(e).__name__}: {e}'
+
+    @staticmethod
+    def _collect(pending: list[tuple[int, Future]], results: list[Any]) -> None:
+        for idx, future in pending:
+            results[idx] = future.result()
+        pending.clear()
+
+    def setup(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='run_parallel')
+        self.is_initialized = True
+
+    def __init__(self, tools: list[Tool], max_workers: int = 8):
+        self.is_initialized = False
+        self.tools = {tool.name: tool for tool in tools if tool.name not in ('final_answer', self.name)}
+        self.max_workers = max_workers
@@ -1,8 +1,17 @@
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import ClassVar
 
 from smolagents.tools import Tool
 
+from first_agent.tools.fetch_cache import CachedPage, FetchCache
+from first_agent.tools.html_stream import MAX_BYTES, stream_markdown
+
+MAX_PAGE_CHARS = 10000
+# less of a page than this says little, urls past the budget are not visited
+MIN_PAGE_CHARS = MAX_PAGE_CHARS // 5
+
 
 class VisitWebpageTool(Tool):
     name = 'visit_webpage'
@@ -11,30 +20,58 @@ class VisitWebpageTool(Tool):
     )
     inputs: ClassVar[dict] = {'url': {'type': 'string', 'description': 'The url of the webpage to visit.'}}
     output_type = 'string'
+    side_effect_free = True
 
     def forward(self, url: str) -> str:
+        return self.visit(url, MAX_PAGE_CHARS)
+
+    def visit(self, url: str, max_chars: int) -> str:
         try:
             import requests
             from markdownify import markdownify
             from requests.exceptions import RequestException
             from smolagents.utils import truncate_content
+
+            from first_agent.tools.http import get_session
         except ImportError as e:
             raise ImportError(
                 'You must install packages `markdownify` and `requests` to run this tool: '
                 'for instance run `pip install markdownify requests`.'
             ) from e
+        page = self.cache.get(url)
+        if page is not None and self.cache.is_fresh(page):
+            return truncate_content(page.markdown, max_chars)
         try:
-            # Send a GET request to the URL with a 20-second timeout
-            response = requests.get(url, timeout=20)
-            response.raise_for_status()  # Raise an exception for bad status codes
+            # Send a GET request through the pooled session, revalidating the cached page if any
+            session = self.session or get_session()
+            headers = self.cache.conditional_headers(page)
+            with session.get(url, timeout=self.timeout, headers=headers, stream=True) as response:
+                if page is not None and response.status_code == 304:
+                    self.cache.revalidated(page)
+                    return truncate_content(page.markdown, max_chars)
+                response.raise_for_status()  # Raise an exception for bad status codes
 
-            # Convert the HTML content to Markdown
-            markdown_content = markdownify(response.text).strip()
+                if self.streaming:
+                    # Convert while reading, stop at the byte cap or once the page budget is filled
+                    markdown_content = stream_markdown(response, MAX_PAGE_CHARS, max_bytes=self.max_bytes)
+                else:
+                    # Convert the HTML content to Markdown
+                    markdown_content = markdownify(response.text).strip()
 
-            # Remove multiple line breaks
-            markdown_content = re.sub(r'\n{3,}', '\n\n', markdown_content)
+                    # Remove multiple line breaks
+                    markdown_content = re.sub(r'\n{3,}', '\n\n', markdown_content)
 
-            return truncate_content(markdown_content, 10000)
+            if 'no-store' not in response.headers.get('Cache-Control', ''):
+                self.cache.put(
+                    CachedPage(
+                        url=url,
+                        markdown=markdown_content,
+                        etag=response.headers.get('ETag'),
+                        last_modified=response.headers.get('Last-Modified'),
+                        fetched_at=time.time(),
+                    )
+                )
+            return truncate_content(markdown_content, max_chars)
 
         except requests.exceptions.Timeout:
             return 'The request timed out. Please try again later or check the URL.'
@@ -43,5 +80,61 @@ class VisitWebpageTool(Tool):
         except Exception as e:
             return f'An unexpected error occurred: {e!s}'
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        cache: FetchCache | None = None,
+        session=None,
+        timeout: float = 20,
+        streaming: bool = False,
+        max_bytes: int = MAX_BYTES,
+        **kwargs,
+    ):
+        self.is_initialized = False
+        self.cache = cache if cache is not None else FetchCache()
+        self.session = session
+        self.timeout = timeout
+        self.streaming = streaming
+        self.max_bytes = max_bytes
+
+
+class VisitWebpagesTool(Tool):
+    name = 'visit_webpages'
+    description = (
+        'Visits several webpages concurrently and reads their content as markdown. '
+        'Use this instead of calling visit_webpage in a loop, e.g. to open the top search results.'
+    )
+    inputs: ClassVar[dict] = {
+        'urls': {'type': 'array', 'description': 'The urls of the webpages to visit.'},
+    }
+    output_type = 'string'
+    side_effect_free = True
+
+    def forward(self, urls: list[str]) -> str:
+        if not urls:
+            return 'No urls given.'
+        # pages share the output budget so the observation stays bounded
+        max_urls = max(self.total_chars // MIN_PAGE_CHARS, 1)
+        urls, skipped = urls[:max_urls], urls[max_urls:]
+        max_chars = self.total_chars // len(urls)
+        executor = ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(urls)))
+        futures = [executor.submit(self.page_tool.visit, url, max_chars) for url in urls]
+        # requests timeout is per socket operation, this bounds the whole batch; stragglers are abandoned
+        wait(futures, timeout=self.page_tool.timeout * 2)
+        executor.shutdown(wait=False, cancel_futures=True)
+        sections = []
+        for url, future in zip(urls, futures, strict=True):
+            if future.done() and not future.cancelled():
+                content = future.result()
+            else:
+                content = 'The request timed out. Please try again later or check the URL.'
+            sections.append(f'## {url}\n\n{content}')
+        if skipped:
+            sections.append(f'Not visited, over the output budget of {max_urls} pages: {", ".join(skipped)}')
+        return '\n\n'.join(sections)
+
+    def __init__(self, page_tool: VisitWebpageTool, max_concurrency: int = 5, total_chars: int = 20000):
         self.is_initialized = False
+        self.page_tool = page_tool
+        self.max_concurrency = max_concurrency
+        self.total_chars = total_chars
@@ -1,7 +1,43 @@
+import logging
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future
+from pathlib import Path
 from typing import ClassVar
 
 from smolagents.tools import Tool
 
+from first_agent.cache import DiskCache, LRUCache
+
+log = logging.getLogger('web_search')
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_query(query: str) -> str:
+    """Queries differing only in case or spacing share a cache entry; quotes and operators like `site:` change
+    the results and stay in the key"""
+    query = unicodedata.normalize('NFKC', query).casefold()
+    return _WHITESPACE_RE.sub(' ', query).strip()
+
+
+class RateLimiter:
+    """Keeps at least `min_interval` seconds between upstream calls"""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._last = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            delay = self._last + self.min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._last = time.monotonic()
+
 
 class DuckDuckGoSearchTool(Tool):
     name = 'web_search'
@@ -11,22 +47,109 @@ class DuckDuckGoSearchTool(Tool):
     )
     inputs: ClassVar[dict] = {'query': {'type': 'string', 'description': 'The search query to perform.'}}
     output_type = 'string'
+    side_effect_free = True
 
-    def __init__(self, max_results=10, **kwargs):
+    def __init__(
+        self,
+        max_results=10,
+        cache_ttl: float = 600,
+        cache_dir: Path | str | None = None,
+        min_interval: float = 1.0,
+        max_retries: int = 3,
+        backoff: float = 2.0,
+        client=None,
+        **kwargs,
+    ):
         super().__init__()
         self.max_results = max_results
+        # the client is created on first use, importing duckduckgo_search is slow
+        self.ddgs = client
+        self.client_kwargs = kwargs
+        self.ratelimit_exception: type[Exception] = Exception
+        self.cache_ttl = cache_ttl
+        self.cache = LRUCache(maxsize=256, ttl=cache_ttl)
+        self.disk = DiskCache(cache_dir, max_bytes=32 * 1024 * 1024) if cache_dir is not None else None
+        self.rate_limiter = RateLimiter(min_interval)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def setup(self):
         try:
             from duckduckgo_search import DDGS
+            from duckduckgo_search.exceptions import RatelimitException
         except ImportError as e:
             raise ImportError(
                 'You must install package `duckduckgo_search` to run this tool: for '
                 'instance run `pip install duckduckgo-search`.'
             ) from e
-        self.ddgs = DDGS(**kwargs)
+        if self.ddgs is None:
+            self.ddgs = DDGS(**self.client_kwargs)
+        self.ratelimit_exception = RatelimitException
+        self.is_initialized = True
 
     def forward(self, query: str) -> str:
-        results = self.ddgs.text(query, max_results=self.max_results)
+        results = self.search(query)
         if len(results) == 0:
             raise Exception('No results found! Try a less restrictive/shorter query.')
         postprocessed_results = [f"[{result['title']}]({result['href']})\n{result['body']}" for result in results]
         return '## Search Results\n\n' + '\n\n'.join(postprocessed_results)
+
+    def search(self, query: str) -> list[dict]:
+        key = normalize_query(query)
+        results = self._cached(key)
+        if results is not None:
+            return results
+
+        # concurrent identical queries wait for the first one instead of hitting the provider
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            results = self._fetch(query)
+            if results:
+                self._store(key, results)
+            future.set_result(results)
+            return results
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _cached(self, key: str) -> list[dict] | None:
+        results = self.cache.get(key)
+        if results is None and self.disk is not None:
+            stored = self.disk.get(key)
+            if stored is not None and time.time() - stored[0] < self.cache_ttl:
+                results = stored[1]
+                self.cache.set(key, results)
+        return results
+
+    def _store(self, key: str, results: list[dict]) -> None:
+        self.cache.set(key, results)
+        if self.disk is not None:
+            self.disk.set(key, (time.time(), results))
+
+    def _fetch(self, query: str) -> list[dict]:
+        if not self.is_initialized:
+            with self._lock:
+                if not self.is_initialized:
+                    self.setup()
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait()
+            try:
+                return self.ddgs.text(query, max_results=self.max_results)
+            except self.ratelimit_exception:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff * 2**attempt
+                log.warning(f'Search rate limited, retrying in {delay}s')
+                time.sleep(delay)
@@ -0,0 +1,535 @@
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from collections.abc import Iterable
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Protocol
+
+from smolagents.memory import ActionStep
+from smolagents.tools import Tool
+
+from first_agent.context_accounting import ContextAccounting
+from first_agent.context_tools import bound_context
+from first_agent.models import Usage, message_usage
+
+log = logging.getLogger('tracing')
+
+# calls of the step being executed, set by the traced executor so tool calls made by the code end up in its step
+_CALLS: ContextVar['CallLog | None'] = ContextVar('trace_calls', default=None)
+
+
+@dataclass
+class CallRecord:
+    kind: str  # 'llm', 'tool' or 'code'
+    name: str
+    start: float
+    duration: float
+    ttft: float | None = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    error: str | None = None
+
+
+class CallLog:
+    def __init__(self):
+        self.calls: list[CallRecord] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: CallRecord) -> None:
+        with self._lock:
+            self.calls.append(record)
+
+    def drain(self) -> list[CallRecord]:
+        with self._lock:
+            calls, self.calls = self.calls, []
+        return calls
+
+
+class AgentTrace:
+    """Calls of the step being executed and the current run of one instrumented agent"""
+
+    def __init__(self):
+        self.calls = CallLog()
+        self.run_id = uuid.uuid4().hex
+
+
+@dataclass
+class StepSpan:
+    run_id: str
+    step: int
+    start: float
+    duration: float
+    llm_calls: int = 0
+    llm_time: float = 0.0
+    ttft: float | None = None
+    tool_calls: int = 0
+    tool_time: dict[str, float] = field(default_factory=dict)
+    code_time: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    context_tokens: int = 0
+    error: str | None = None
+    calls: list[CallRecord] = field(default_factory=list)
+
+    @classmethod
+    def from_calls(cls, run_id: str, step: ActionStep, calls: list[CallRecord], context_tokens: int) -> 'StepSpan':
+        span = cls(
+            run_id=run_id,
+            step=step.step_number,
+            start=step.start_time or (calls[0].start if calls else time.time()),
+            duration=step.duration or 0.0,
+            error=str(step.error) if step.error is not None else None,
+            calls=calls,
+        )
+        tool_time: dict[str, float] = defaultdict(float)
+        for call in calls:
+            if call.kind == 'llm':
+                span.llm_calls += 1
+                span.llm_time += call.duration
+                span.prompt_tokens += call.prompt_tokens
+                span.completion_tokens += call.completion_tokens
+                span.cached_tokens += call.cached_tokens
+                if span.ttft is None:
+                    span.ttft = call.ttft
+                # the prompt of the last call is the context the step ended with
+                context_tokens = call.prompt_tokens or context_tokens
+            elif call.kind == 'tool':
+                span.tool_calls += 1
+                tool_time[call.name] += call.duration
+            elif call.kind == 'code':
+                span.code_time += call.duration
+        span.tool_time = dict(tool_time)
+        span.context_tokens = context_tokens
+        return span
+
+
+class SpanSink(Protocol):
+    def emit(self, span: StepSpan) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class JsonlSink:
+    """Appends one JSON line per step span"""
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open('a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def emit(self, span: StepSpan) -> None:
+        line = json.dumps(asdict(span), default=str)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class RingBufferSink:
+    """Keeps the last `maxlen` spans in memory"""
+
+    def __init__(self, maxlen: int = 1000):
+        self._spans: deque[StepSpan] = deque(maxlen=maxlen)
+
+    def emit(self, span: StepSpan) -> None:
+        self._spans.append(span)
+
+    def spans(self, run_id: str | None = None) -> list[StepSpan]:
+        return [span for span in list(self._spans) if run_id is None or span.run_id == run_id]
+
+    def close(self) -> None:
+        pass
+
+
+def _otlp_attributes(values: dict[str, Any]) -> list[dict]:
+    attributes = []
+    for key, value in values.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            attributes.append({'key': key, 'value': {'boolValue': value}})
+        elif isinstance(value, int):
+            attributes.append({'key': key, 'value': {'intValue': str(value)}})
+        elif isinstance(value, float):
+            attributes.append({'key': key, 'value': {'doubleValue': value}})
+        else:
+            attributes.append({'key': key, 'value': {'stringValue': str(value)}})
+    return attributes
+
+
+def _otlp_span(trace_id: str, name: str, start: float, duration: float, attributes: dict, **ids) -> dict:
+    span = {
+        'traceId': trace_id,
+        'spanId': ids['span_id'],
+        'name': name,
+        'kind': 1,
+        'startTimeUnixNano': str(int(start * 1e9)),
+        'endTimeUnixNano': str(int((start + duration) * 1e9)),
+        'attributes': _otlp_attributes(attributes),
+    }
+    if ids.get('parent_id'):
+        span['parentSpanId'] = ids['parent_id']
+    if attributes.get('error'):
+        span['status'] = {'code': 2, 'message': attributes['error']}
+    return span
+
+
+def otlp_payload(spans: Iterable[StepSpan], service_name: str = 'first_agent') -> dict:
+    """OTLP/HTTP JSON export request: a span per step with a child span per model, tool and code call"""
+    otlp_spans = []
+    for span in spans:
+        trace_id = span.run_id
+        step_id = os.urandom(8).hex()
+        attributes = {key: value for key, value in asdict(span).items() if key not in ('calls', 'tool_time', 'start')}
+        attributes.update({f'tool_time.{name}': value for name, value in span.tool_time.items()})
+        otlp_spans.append(
+            _otlp_span(trace_id, f'agent.step {span.step}', span.start, span.duration, attributes, span_id=step_id)
+        )
+        for call in span.calls:
+            attributes = {key: value for key, value in asdict(call).items() if key not in ('start', 'duration')}
+            otlp_spans.append(
+                _otlp_span(
+                    trace_id,
+                    f'{call.kind} {call.name}',
+                    call.start,
+                    call.duration,
+                    attributes,
+                    span_id=os.urandom(8).hex(),
+                    parent_id=step_id,
+                )
+            )
+    resource = {'attributes': _otlp_attributes({'service.name': service_name})}
+    return {
+        'resourceSpans': [
+            {'resource': resource, 'scopeSpans': [{'scope': {'name': 'first_agent'}, 'spans': otlp_spans}]}
+        ]
+    }
+
+
+class OtlpSink:
+    """Exports spans to an OpenTelemetry collector over OTLP/HTTP JSON from a background thread"""
+
+    def __init__(
+        self,
+        endpoint: str = 'http://localhost:4318/v1/traces',
+        service_name: str = 'first_agent',
+        timeout: float = 5.0,
+        max_queue: int = 1000,
+    ):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        # spans are dropped rather than slowing the agent down when the collector is behind
+        self._queue: queue.Queue[StepSpan | None] = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._export_loop, name='otlp-export', daemon=True)
+        self._thread.start()
+
+    def emit(self, span: StepSpan) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _export_loop(self) -> None:
+        from first_agent.tools.http import get_session
+
+        while True:
+            span = self._queue.get()
+            if span is None:
+                return
+            batch = [span]
+            while not self._queue.empty() and len(batch) < 100:
+                span = self._queue.get_nowait()
+                if span is None:
+                    self._export(get_session(), batch)
+                    return
+                batch.append(span)
+            self._export(get_session(), batch)
+
+    def _export(self, session, batch: list[StepSpan]) -> None:
+        try:
+            response = session.post(self.endpoint, json=otlp_payload(batch, self.service_name), timeout=self.timeout)
+            response.raise_for_status()
+        except Exception as e:
+            log.warning(f'Could not export {len(batch)} spans to {self.endpoint}: {e}')
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(self.timeout)
+
+
+class TracedModel:
+    """Model wrapper that records latency, time to first token and token counts of every call"""
+
+    def __init__(self, model, trace: AgentTrace):
+        self.model = model
+        self.trace = trace
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.model, name)
+
+    def __call__(self, *args, **kwargs):
+        start = time.time()
+        first_token: list[float] = []
+
+        def on_token(_text: str) -> None:
+            if not first_token:
+                first_token.append(time.time())
+
+        streaming_to = getattr(self.model, 'streaming_to', None)
+        error = None
+        message = None
+        try:
+            if streaming_to is None:
+                message = self.model(*args, **kwargs)
+            else:
+                with streaming_to(on_token):
+                    message = self.model(*args, **kwargs)
+            return message
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            usage = message_usage(message) or Usage()
+            self.trace.calls.add(
+                CallRecord(
+                    kind='llm',
+                    name=getattr(self.model, 'model_id', None) or type(self.model).__name__,
+                    start=start,
+                    duration=time.time() - start,
+                    ttft=first_token[0] - start if first_token else None,
+                    prompt_tokens=usage.input_tokens,
+                    completion_tokens=usage.output_tokens,
+                    cached_tokens=usage.cached_tokens,
+                    error=error,
+                )
+            )
+
+
+class TracedExecutor:
+    """Python executor wrapper timing code execution; tools called by the code are recorded on the same step"""
+
+    def __init__(self, executor, trace: AgentTrace):
+        self.executor = executor
+        self.trace = trace
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.executor, name)
+
+    def __call__(self, *args, **kwargs):
+        token = _CALLS.set(self.trace.calls)
+        start = time.time()
+        error = None
+        try:
+            return self.executor(*args, **kwargs)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            _CALLS.reset(token)
+            self.trace.calls.add(
+                CallRecord(kind='code', name='python', start=start, duration=time.time() - start, error=error)
+            )
+
+
+def trace_tool(tool: Tool) -> Tool:
+    """Records calls of the tool on the step that makes them; tools are shared, so this wraps each one once"""
+    if getattr(tool, 'traced', False):
+        return tool
+    forward = tool.forward
+
+    @functools.wraps(forward)
+    def traced_forward(*args, **kwargs):
+        calls = _CALLS.get()
+        if calls is None:
+            return forward(*args, **kwargs)
+        start = time.time()
+        error = None
+        try:
+            return forward(*args, **kwargs)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            calls.add(CallRecord(kind='tool', name=tool.name, start=start, duration=time.time() - start, error=error))
+
+    tool.forward = traced_forward
+    tool.traced = True
+    return tool
+
+
+class Tracer:
+    """Records a span per agent step and sends it to the sinks.
+
+    `instrument(agent)` wraps the agent's model and python executor and registers a step callback. Agents of
+    different sessions can share a tracer: each one records its calls and runs in an `AgentTrace` of its own.
+    """
+
+    def __init__(self, *sinks: SpanSink, accounting: ContextAccounting | None = None, keep_runs: int = 16):
+        self.sinks = list(sinks)
+        self.accounting = accounting
+        # run last started by any of the agents
+        self.run_id = uuid.uuid4().hex
+        self.runs: dict[str, list[StepSpan]] = {}
+        self.keep_runs = keep_runs
+        self._lock = threading.Lock()
+
+    def instrument(self, agent) -> Any:
+        if isinstance(agent.model, TracedModel):
+            return agent
+        trace = AgentTrace()
+        agent.model = TracedModel(agent.model, trace)
+        agent.python_executor = TracedExecutor(agent.python_executor, trace)
+        for tool in agent.tools.values():
+            trace_tool(tool)
+        agent.step_callbacks.append(functools.partial(self.on_step, trace))
+        return agent
+
+    def on_step(self, trace: AgentTrace, step) -> None:
+        if not isinstance(step, ActionStep):
+            return
+        if step.step_number == 1:
+            trace.run_id = self.run_id = uuid.uuid4().hex
+        accounting = self.accounting
+        if accounting is None:
+            # each step is counted on the context of its own session
+            context = bound_context()
+            accounting = context.accounting if context is not None else None
+        context_tokens = accounting.total if accounting is not None else 0
+        span = StepSpan.from_calls(trace.run_id, step, trace.calls.drain(), context_tokens)
+        with self._lock:
+            self.runs.setdefault(trace.run_id, []).append(span)
+            while len(self.runs) > self.keep_runs:
+                del self.runs[next(iter(self.runs))]
+        for sink in self.sinks:
+            try:
+                sink.emit(span)
+            except Exception:
+                log.exception(f'Span sink {type(sink).__name__} failed')
+
+    def report(self, run_id: str | None = None) -> 'RunReport':
+        """Report of the given run, the last one by default"""
+        with self._lock:
+            return RunReport.from_spans(self.runs.get(run_id or self.run_id, []))
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+
+@dataclass
+class RunReport:
+    run_id: str | None
+    steps: int
+    duration: float
+    llm_calls: int
+    llm_time: float
+    ttft_avg: float | None
+    ttft_max: float | None
+    code_time: float
+    tool_calls: int
+    tool_time: dict[str, float]
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int
+    max_context_tokens: int
+    errors: int
+
+    @classmethod
+    def from_spans(cls, spans: list[StepSpan]) -> 'RunReport':
+        ttfts = [span.ttft for span in spans if span.ttft is not None]
+        tool_time: dict[str, float] = defaultdict(float)
+        for span in spans:
+            for name, duration in span.tool_time.items():
+                tool_time[name] += duration
+        return cls(
+            run_id=spans[0].run_id if spans else None,
+            steps=len(spans),
+            duration=sum(span.duration for span in spans),
+            llm_calls=sum(span.llm_calls for span in spans),
+            llm_time=sum(span.llm_time for span in spans),
+            ttft_avg=sum(ttfts) / len(ttfts) if ttfts else None,
+            ttft_max=max(ttfts) if ttfts else None,
+            code_time=sum(span.code_time for span in spans),
+            tool_calls=sum(span.tool_calls for span in spans),
+            tool_time=dict(sorted(tool_time.items(), key=lambda item: item[1], reverse=True)),
+            prompt_tokens=sum(span.prompt_tokens for span in spans),
+            completion_tokens=sum(span.completion_tokens for span in spans),
+            cached_tokens=sum(span.cached_tokens for span in spans),
+            max_context_tokens=max((span.context_tokens for span in spans), default=0),
+            errors=sum(1 for span in spans if span.error),
+        )
+
+    @property
+    def other_time(self) -> float:
+        """Time spent neither in the model nor in code: parsing, callbacks, compaction"""
+        return max(0.0, self.duration - self.llm_time - self.code_time)
+
+    def format(self) -> str:
+        def share(value: float) -> str:
+            return f'{value:8.2f}s {value / self.duration:6.1%}' if self.duration else f'{value:8.2f}s'
+
+        lines = [
+            f'Run {self.run_id}: {self.steps} steps in {self.duration:.2f}s, {self.errors} errors',
+            f'  model  {share(self.llm_time)}  {self.llm_calls} calls',
+            f'  code   {share(self.code_time)}',
+            f'  other  {share(self.other_time)}',
+        ]
+        if self.ttft_avg is not None:
+            lines.append(f'  time to first token: avg {self.ttft_avg:.2f}s, max {self.ttft_max:.2f}s')
+        lines.append(
+            f'  tokens: {self.prompt_tokens} prompt, {self.completion_tokens} completion, '
+            f'max context {self.max_context_tokens}'
+        )
+        if self.cached_tokens and self.prompt_tokens:
+            lines.append(
+                f'  prefix cache: {self.cached_tokens} prompt tokens served from cache '
+                f'({self.cached_tokens / self.prompt_tokens:.1%})'
+            )
+        for name, duration in self.tool_time.items():
+            lines.append(f'  tool {name}: {duration:.2f}s')
+        return '\n'.join(lines)
+
+
+def load_spans(path: Path | str) -> list[StepSpan]:
+    """Spans written by a JsonlSink"""
+    spans = []
+    with Path(path).open(encoding='utf-8') as stream:
+        for line in stream:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            data['calls'] = [CallRecord(**call) for call in data.get('calls', [])]
+            spans.append(StepSpan(**data))
+    return spans
+
+
+def make_tracer(
+    trace_file: Path | str | None = None,
+    otlp_endpoint: str | None = None,
+    ring_size: int = 0,
+    accounting: ContextAccounting | None = None,
+) -> Tracer:
+    sinks: list[SpanSink] = []
+    if trace_file is not None:
+        sinks.append(JsonlSink(trace_file))
+    if otlp_endpoint is not None:
+        sinks.append(OtlpSink(otlp_endpoint))
+    if ring_size:
+        sinks.append(RingBufferSink(ring_size))
+    return Tracer(*sinks, accounting=accounting)
@@ -0,0 +1,191 @@
+import ast
+import logging
+import threading
+from collections import defaultdict
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from smolagents.memory import ActionStep
+
+from first_agent.models import Usage, message_usage
+
+log = logging.getLogger('usage')
+
+ANONYMOUS = 'anonymous'
+
+
+class BudgetExceeded(RuntimeError):
+    """A run or a session used more tokens than its budget; raised from the step callback to stop the run"""
+
+
+@dataclass(frozen=True)
+class TokenBudget:
+    # input and output tokens together, None for no limit
+    max_run_tokens: int | None = None
+    max_session_tokens: int | None = None
+
+
+@dataclass
+class UsageTotals:
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    steps: int = 0
+    seconds: float = 0.0
+
+    def add(self, usage: Usage | None, seconds: float = 0.0) -> None:
+        self.steps += 1
+        self.seconds += seconds
+        if usage is None:
+            return
+        self.calls += 1
+        self.input_tokens += usage.input_tokens
+        self.output_tokens += usage.output_tokens
+        self.cached_tokens += usage.cached_tokens
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+
+def step_usage(step: ActionStep) -> Usage | None:
+    """Usage of the model call of a step: stored on the step by `UsageMeter`, or read from its model output"""
+    usage = getattr(step, 'usage', None)
+    return usage if usage is not None else message_usage(step.model_output_message)
+
+
+def called_tools(step: ActionStep, tool_names: Iterable[str]) -> list[str]:
+    """Tools called by the code of a step, in order of first call"""
+    if not step.tool_calls or step.tool_calls[0].name != 'python_interpreter':
+        return []
+    try:
+        tree = ast.parse(str(step.tool_calls[0].arguments))
+    except SyntaxError:
+        return []
+    names = set(tool_names)
+    called = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in names:
+            called.setdefault(node.func.id, None)
+    return list(called)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class UsageLedger:
+    """Token usage aggregated per session, per user and per tool called by a step, exported in Prometheus format.
+
+    The tokens of a step count for every tool its code calls: they are what the model spent to decide the call.
+    """
+
+    def __init__(self):
+        self.sessions: dict[str, UsageTotals] = defaultdict(UsageTotals)
+        self.users: dict[str, UsageTotals] = defaultdict(UsageTotals)
+        self.tools: dict[str, UsageTotals] = defaultdict(UsageTotals)
+        self.runs: dict[str, int] = defaultdict(int)
+        self.stopped: dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def run_started(self, user: str | None) -> None:
+        with self._lock:
+            self.runs[user or ANONYMOUS] += 1
+
+    def run_stopped(self, user: str | None) -> None:
+        with self._lock:
+            self.stopped[user or ANONYMOUS] += 1
+
+    def record(
+        self, session: str, user: str | None, usage: Usage | None, tools: Iterable[str] = (), seconds: float = 0.0
+    ) -> None:
+        with self._lock:
+            self.sessions[session].add(usage, seconds)
+            self.users[user or ANONYMOUS].add(usage, seconds)
+            for tool in tools:
+                self.tools[tool].add(usage, seconds)
+
+    def session(self, session: str) -> UsageTotals:
+        with self._lock:
+            return self.sessions.get(session) or UsageTotals()
+
+    def drop_session(self, session: str) -> None:
+        """Sessions come and go; users and tools keep their totals"""
+        with self._lock:
+            self.sessions.pop(session, None)
+
+    def metrics(self) -> str:
+        """Prometheus text format"""
+        lines: list[str] = []
+        with self._lock:
+            for group, label, totals in (
+                ('session', 'session', self.sessions),
+                ('user', 'user', self.users),
+                ('tool_step', 'tool', self.tools),
+            ):
+                for suffix, kind, value in (
+                    ('tokens_total', 'counter', None),
+                    ('calls_total', 'counter', 'calls'),
+                    ('steps_total', 'counter', 'steps'),
+                    ('step_seconds_total', 'counter', 'seconds'),
+                ):
+                    name = f'agent_{group}_{suffix}'
+                    lines.append(f'# TYPE {name} {kind}')
+                    for key, total in sorted(totals.items()):
+                        labels = f'{label}="{_escape(key)}"'
+                        if value is not None:
+                            lines.append(f'{name}{{{labels}}} {getattr(total, value)}')
+                            continue
+                        for token_kind in ('input', 'output', 'cached'):
+                            count = getattr(total, f'{token_kind}_tokens')
+                            lines.append(f'{name}{{{labels},kind="{token_kind}"}} {count}')
+            for name, counts in (('agent_user_runs_total', self.runs), ('agent_user_runs_stopped_total', self.stopped)):
+                lines.append(f'# TYPE {name} counter')
+                lines += [f'{name}{{user="{_escape(user)}"}} {count}' for user, count in sorted(counts.items())]
+        return '\n'.join(lines) + '\n'
+
+
+class UsageMeter:
+    """Step callback storing the usage of each model call on its step and recording it in a ledger.
+
+    Steps get `usage`, `input_token_count` and `output_token_count`. A run going over the budget is stopped with
+    `BudgetExceeded` after the step that crossed it.
+    """
+
+    def __init__(self, ledger: UsageLedger, session: str, user: str | None = None, budget: TokenBudget | None = None):
+        self.ledger = ledger
+        self.session = session
+        self.user = user
+        self.budget = budget or TokenBudget()
+        self.run = UsageTotals()
+
+    def __call__(self, step, agent=None) -> None:
+        if not isinstance(step, ActionStep):
+            return
+        if step.step_number == 1:
+            self.run = UsageTotals()
+            self.ledger.run_started(self.user)
+        usage = step_usage(step)
+        if usage is not None:
+            step.usage = usage
+            step.input_token_count = usage.input_tokens
+            step.output_token_count = usage.output_tokens
+        tools = called_tools(step, getattr(agent, 'tools', None) or ())
+        self.run.add(usage, step.duration or 0.0)
+        self.ledger.record(self.session, self.user, usage, tools, step.duration or 0.0)
+        self.check()
+
+    def check(self) -> None:
+        budget = self.budget
+        reason = None
+        if budget.max_run_tokens is not None and self.run.total_tokens > budget.max_run_tokens:
+            reason = f'run used {self.run.total_tokens} tokens, over its budget of {budget.max_run_tokens}'
+        elif budget.max_session_tokens is not None:
+            used = self.ledger.session(self.session).total_tokens
+            if used > budget.max_session_tokens:
+                reason = f'session used {used} tokens, over its budget of {budget.max_session_tokens}'
+        if reason is not None:
+            self.ledger.run_stopped(self.user)
+            log.warning(f'Stopping run of session {self.session}: {reason}')
+            raise BudgetExceeded(reason)
@@ -0,0 +1,67 @@
+import argparse
+import logging
+import re
+import timeit
+
+from first_agent.sanitize import clean_code, clean_model_output, clean_observations
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+log = logging.getLogger(__name__)
+
+CODE = """for idx, url in enumerate(urls):
+    page = visit_webpage(url)
+    print(f"{idx}: {page[:200]}")
+"""
+
+
+def legacy_step(model_output: str, code: str, observations: str) -> tuple[str, str, str]:
+    """pull_messages_from_step cleanup before first_agent.sanitize"""
+    model_output = model_output.strip()
+    model_output = re.sub(r'```\s*<end_code>', '```', model_output)
+    model_output = re.sub(r'<end_code>\s*```', '```', model_output)
+    model_output = re.sub(r'```\s*\n\s*<end_code>', '```', model_output)
+    model_output = model_output.strip()
+    code = re.sub(r'```.*?\n', '', code)
+    code = re.sub(r'\s*<end_code>\s*', '', code)
+    code = code.strip()
+    if not code.startswith('```python'):
+        code = f'```python\n{code}\n```'
+    observations = re.sub(r'^Execution logs:\s*', '', observations.strip())
+    return model_output, code, observations
+
+
+def sanitized_step(model_output: str, code: str, observations: str) -> tuple[str, str, str]:
+    return clean_model_output(model_output), clean_code(code), clean_observations(observations)
+
+
+def make_step(size_kb: int) -> tuple[str, str, str]:
+    """A step as the agent logs it: thought and code, the code of the call and a large execution log"""
+    code = CODE * max(1, size_kb // 8)
+    model_output = f'Thought: I will read every page.\nCode:\n```py\n{code}```<end_code>\n'
+    line = 'https://example.com/some/page: Lorem ipsum dolor sit amet, consectetur adipiscing elit\n'
+    observations = 'Execution logs:\n' + line * (size_kb * 1024 // len(line))
+    return model_output, code, observations
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Benchmark step output cleanup')
+    parser.add_argument('--size-kb', type=int, nargs='+', default=[16, 256, 1024, 4096])
+    parser.add_argument('--number', type=int, default=20)
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    for size_kb in args.size_kb:
+        step = make_step(size_kb)
+        assert legacy_step(*step) == sanitized_step(*step)
+        legacy = min(timeit.repeat(lambda: legacy_step(*step), number=args.number, repeat=3)) / args.number
+        sanitized = min(timeit.repeat(lambda: sanitized_step(*step), number=args.number, repeat=3)) / args.number
+        log.info(
+            f'{size_kb:>6} KB step: legacy {legacy * 1000:8.3f} ms, sanitize {sanitized * 1000:8.3f} ms, '
+            f'x{legacy / sanitized:.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
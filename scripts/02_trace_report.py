@@ -0,0 +1,29 @@
+import argparse
+import logging
+
+from first_agent.tracing import RunReport, load_spans
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+log = logging.getLogger(__name__)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Per-run reports from a step trace written with --trace')
+    parser.add_argument('trace_file')
+    parser.add_argument('--run', help='only report this run id')
+    parser.add_argument('--last', type=int, default=5, help='number of most recent runs to report')
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    runs: dict[str, list] = {}
+    for span in load_spans(args.trace_file):
+        runs.setdefault(span.run_id, []).append(span)
+    run_ids = [args.run] if args.run else list(runs)[-args.last :]
+    for run_id in run_ids:
+        log.info(f'\n{RunReport.from_spans(runs.get(run_id, [])).format()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+import argparse
+import logging
+from collections import Counter
+
+from first_agent.journal import read_records, render_context, replay
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+log = logging.getLogger(__name__)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Rebuild an agent context from a context journal')
+    parser.add_argument('journal', help='current journal file, rotated files next to it are read too')
+    parser.add_argument('--stream', default='default')
+    parser.add_argument('--seq', type=int, help='context as of this record')
+    parser.add_argument('--step', type=int, help='context after this agent step')
+    parser.add_argument('--list', action='store_true', help='list the streams and their record counts')
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    if args.list:
+        for stream, count in Counter(record['stream'] for record in read_records(args.journal)).most_common():
+            log.info(f'{stream}: {count} records')
+        return
+    print(render_context(replay(args.journal, args.stream, seq=args.seq, step=args.step)))
+
+
+if __name__ == '__main__':
+    main()
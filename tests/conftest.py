@@ -1 +1,80 @@
+import threading
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
+import pytest
+
+
+@dataclass
+class Route:
+    body: str
+    status: int = 200
+    headers: dict[str, str] = field(default_factory=dict)
+    delay: float = 0.0
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients that stop reading a streamed body reset the connection
+        pass
+
+
+class LocalServer:
+    def __init__(self, server: ThreadingHTTPServer):
+        self.server = server
+        self.routes: dict[str, Route] = {}
+        self.requests: list[tuple[str, dict[str, str]]] = []
+
+    def url(self, path: str) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}{path}'
+
+    def hits(self, path: str) -> int:
+        return sum(1 for requested, _ in self.requests if requested == path)
+
+
+def _make_handler(local: LocalServer) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            local.requests.append((self.path, dict(self.headers)))
+            route = local.routes.get(self.path)
+            if route is None:
+                route = Route('not found', status=404)
+            if route.delay:
+                threading.Event().wait(route.delay)
+            etag = route.headers.get('ETag')
+            if etag is not None and self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = route.body.encode()
+            self.send_response(route.status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in route.headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+@pytest.fixture()
+def http_server() -> Iterator[LocalServer]:
+    server = _QuietServer(('127.0.0.1', 0), BaseHTTPRequestHandler)
+    local = LocalServer(server)
+    server.RequestHandlerClass = _make_handler(local)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield local
+    server.shutdown()
+    server.server_close()
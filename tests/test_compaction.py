@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+from smolagents.memory import ActionStep, TaskStep, ToolCall
+
+from first_agent.compaction import TRUNCATED_MARKER, ContextCompactor, DropDuplicateOutputs, TruncateObservations
+from first_agent.context_accounting import ContextAccounting
+from first_agent.context_tools import SummarizedStep
+
+
+def make_step(number: int, observations: str) -> ActionStep:
+    return ActionStep(
+        step_number=number,
+        model_output=f'Thought: step {number}\nCode:\n```py\nprint({number})\n```',
+        tool_calls=[ToolCall(name='python_interpreter', arguments=f'print({number})', id=f'call_{number}')],
+        observations=observations,
+    )
+
+
+def make_steps(*observations: str) -> list:
+    return [TaskStep(task='task')] + [make_step(idx, obs) for idx, obs in enumerate(observations, start=1)]
+
+
+def test_under_budget_is_noop() -> None:
+    steps = make_steps('a', 'b', 'c')
+    original = list(steps)
+    compactor = ContextCompactor(ContextAccounting(), budget_tokens=10_000)
+    compactor(steps[-1], agent=SimpleNamespace(memory=SimpleNamespace(steps=steps)))
+    assert steps == original
+
+
+def test_duplicates_are_dropped_first() -> None:
+    page = 'page content ' * 200
+    steps = make_steps(page, page, 'tail', 'tail2')
+    accounting = ContextAccounting()
+    budget = accounting.sync(steps) - 100
+    compactor = ContextCompactor(accounting, budget_tokens=budget, policies=[DropDuplicateOutputs()])
+    compactor.compact(steps)
+    assert steps[1].observations == page
+    assert steps[2].observations == '[same output as step 1]'
+    assert accounting.total == ContextAccounting().sync(steps)
+
+
+def test_truncate_keeps_recent_steps() -> None:
+    long = 'x ' * 5000
+    steps = make_steps(long, long + 'y', long + 'z')
+    accounting = ContextAccounting()
+    compactor = ContextCompactor(accounting, budget_tokens=100, keep_recent=1, policies=[TruncateObservations(200)])
+    compactor.compact(steps)
+    assert TRUNCATED_MARKER in steps[1].observations
+    assert TRUNCATED_MARKER in steps[2].observations
+    assert steps[3].observations == long + 'z'
+
+
+def test_summarize_collapses_old_steps() -> None:
+    steps = make_steps(*[f'result {idx} ' * 100 for idx in range(6)])
+    accounting = ContextAccounting()
+    compactor = ContextCompactor(accounting, budget_tokens=1100, keep_recent=2)
+    total = compactor.compact(steps)
+    assert total <= 1100
+    assert isinstance(steps[0], TaskStep)
+    assert isinstance(steps[1], SummarizedStep)
+    assert 'step 1: step 1 -> result 0' in steps[1].summarized
+    assert [step.step_number for step in steps[-2:]] == [5, 6]
+    assert total == ContextAccounting().sync(steps)
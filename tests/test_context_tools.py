@@ -0,0 +1,220 @@
+import asyncio
+import pathlib
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import pytest
+from smolagents.memory import ActionStep, TaskStep, ToolCall
+
+from first_agent import context_tools
+from first_agent.context_accounting import ContextAccounting, approximate_token_count, step_to_text
+from first_agent.context_tools import AgentContext, SummarizedStep, bind_context, create_context
+from first_agent.memory_store import MemoryDigest, MemoryStore, open_memory
+
+
+def make_agent() -> SimpleNamespace:
+    steps = [
+        TaskStep(task='Find the population of Shanghai'),
+        ActionStep(
+            step_number=1,
+            model_output='Thought: search it',
+            tool_calls=[ToolCall(name='python_interpreter', arguments='web_search("shanghai")', id='call_1')],
+            observations='Shanghai has 26 million inhabitants',
+        ),
+    ]
+    return SimpleNamespace(memory=SimpleNamespace(steps=steps), step_callbacks=[])
+
+
+@pytest.fixture()
+def context():
+    with bind_context(create_context(make_agent(), MemoryStore())) as context:
+        yield context
+
+
+def test_approximate_token_count() -> None:
+    assert approximate_token_count('') == 0
+    assert approximate_token_count('hello, world') == 5
+    assert approximate_token_count('a b c') == 3
+
+
+def test_accounting_counts_each_step_once() -> None:
+    calls = []
+
+    def tokenizer(text: str) -> int:
+        calls.append(text)
+        return len(text)
+
+    accounting = ContextAccounting(tokenizer)
+    steps = [TaskStep(task='one'), TaskStep(task='two')]
+    total = accounting.sync(steps)
+    assert total == sum(len(step_to_text(step)) for step in steps)
+    assert accounting.sync(steps) == total
+    assert len(calls) == 2
+
+    accounting.sync(steps[1:])
+    assert accounting.total == len(step_to_text(steps[1]))
+
+
+def test_accounting_is_safe_from_parallel_tools() -> None:
+    def tokenizer(text: str) -> int:
+        # let the other threads run while a step is tokenized
+        threading.Event().wait(0.0001)
+        return len(text)
+
+    accounting = ContextAccounting(tokenizer)
+    steps = [TaskStep(task=f'task {idx}') for idx in range(50)]
+    errors = []
+
+    def sync(offset: int) -> None:
+        try:
+            for idx in range(20):
+                accounting.sync(steps[(offset + idx) % 10 :])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=sync, args=(offset,)) for offset in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert accounting.sync(steps) == sum(len(step_to_text(step)) for step in steps)
+
+
+def test_get_context_size_tracks_modifications(context: AgentContext) -> None:
+    initial = context_tools.get_context_size()
+    breakdown = context_tools.get_context_breakdown()
+    assert sum(breakdown.values()) == initial
+    assert list(breakdown) == [0, 1]
+
+    context_tools.modify_step(1, 'searched')
+    summarized = context.accounting.total
+    assert summarized < initial
+    assert context_tools.get_context_size() == summarized
+
+    context_tools.remove_step(1)
+    assert context_tools.get_context_size() == breakdown[0]
+
+
+def test_new_steps_are_counted_by_callback(context: AgentContext) -> None:
+    context_tools.get_context_size()
+    step = ActionStep(step_number=2, model_output='Thought: done')
+    context.agent.memory.steps.append(step)
+    for callback in context.agent.step_callbacks:
+        callback(step)
+    assert context.accounting.total == context_tools.get_context_size()
+
+
+def test_memory_store_survives_reopen(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / 'memory.sqlite3'
+    store = MemoryStore(path, sync_every=100)
+    store.set('answer', {'value': 42})
+    store.session('other').set('answer', 'other session')
+    store.close()
+
+    reopened = MemoryStore(path)
+    assert reopened.get('answer') == {'value': 42}
+    assert reopened.session('other').get('answer') == 'other session'
+    assert reopened.get('missing', 'default') == 'default'
+
+
+def test_memory_store_commits_idle_writes(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / 'memory.sqlite3'
+    store = MemoryStore(path, sync_every=100)
+    store.backend.sync_interval = 0.05
+    store.set('answer', 42)
+    reader = sqlite3.connect(path)
+    assert reader.execute('SELECT count(*) FROM memory').fetchall() == [(0,)]
+    threading.Event().wait(0.3)
+    assert reader.execute('SELECT count(*) FROM memory').fetchall() == [(1,)]
+    reader.close()
+    store.close()
+
+
+def test_memory_store_ttl() -> None:
+    store = MemoryStore()
+    store.set('short', 1, ttl=-1)
+    store.set('long', 2, ttl=60)
+    assert store.get('short') is None
+    assert store.recent() == [('long', 2)]
+    store.evict_expired()
+    assert store.backend.read('SELECT count(*) FROM memory', ()) == [(1,)]
+    store.set('short', 1, ttl=-1)
+    store.evict_expired(every=60)
+    assert store.backend.read('SELECT count(*) FROM memory', ()) == [(2,)]
+
+
+def test_open_memory_drops_expired_keys(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / 'memory.sqlite3'
+    store = MemoryStore(path)
+    store.set('short', 1, ttl=-1)
+    store.set('long', 2)
+    store.close()
+    assert open_memory(path).backend.read('SELECT key FROM memory', ()) == [('long',)]
+
+
+def test_memory_digest_is_bounded() -> None:
+    digest = MemoryDigest(max_entries=2, max_value_chars=8)
+    for idx in range(10):
+        digest.update(f'key{idx}', 'x' * 100)
+    digest.update('key8', 'short')
+    assert digest.render().splitlines() == [
+        "key9: 'xxxxxxx...",
+        "key8: 'short'",
+        '(older keys are not shown, use get_from_persistent_memory)',
+    ]
+
+
+def test_persist_in_memory_renders_digest(context: AgentContext) -> None:
+    context_tools.persist_in_memory('city', 'Shanghai')
+    context_tools.persist_in_memory('population', 26_000_000)
+    assert context_tools.get_from_persistent_memory('city') == 'Shanghai'
+    step = context.agent.memory.steps[0]
+    assert isinstance(step, SummarizedStep)
+    assert step.summarized == "PERSISTENT MEMORY:\ncity: 'Shanghai'\npopulation: 26000000"
+    assert context_tools.get_context_size() == context.accounting.total
+
+
+def test_tools_need_a_bound_context() -> None:
+    with pytest.raises(LookupError, match='No agent context is bound'):
+        context_tools.list_steps()
+
+
+def test_sessions_in_threads_do_not_share_state() -> None:
+    store = MemoryStore()
+    barrier = threading.Barrier(2)
+    results = {}
+
+    def session(name: str) -> None:
+        context = create_context(make_agent(), store.session(name))
+        with bind_context(context):
+            context_tools.persist_in_memory('user', name)
+            context_tools.remove_step(1)
+            barrier.wait()
+            results[name] = (context_tools.get_from_persistent_memory('user'), len(context_tools.list_steps()))
+
+    threads = [threading.Thread(target=session, args=(name,)) for name in ('alice', 'bob')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {'alice': ('alice', 1), 'bob': ('bob', 1)}
+
+
+def test_sessions_in_asyncio_tasks_do_not_share_state() -> None:
+    store = MemoryStore()
+
+    async def session(name: str) -> tuple[str, str]:
+        with bind_context(create_context(make_agent(), store.session(name))):
+            context_tools.persist_in_memory('user', name)
+            await asyncio.sleep(0)
+            return context_tools.get_from_persistent_memory('user'), context_tools.get_step(0)[0]
+
+    async def main() -> list:
+        return await asyncio.gather(session('alice'), session('bob'))
+
+    (alice, alice_step), (bob, bob_step) = asyncio.run(main())
+    assert (alice, bob) == ('alice', 'bob')
+    assert "user: 'alice'" in alice_step
+    assert "user: 'bob'" in bob_step
@@ -1,8 +1,17 @@
+import hashlib
 import pathlib
 
 import pytest
 
-from tools.editor import get_file_contents, list_directory_contents, write_content_to_file
+from tools.editor import (
+    FileChangedError,
+    apply_patch,
+    get_file_contents,
+    get_file_info,
+    list_directory_contents,
+    write_content_to_file,
+)
+from tools.patch import PatchError
 
 
 @pytest.fixture()
@@ -63,3 +72,169 @@ def test_write_content_to_file_nonexistent_directory(tmp_path: pathlib.Path) ->
     file_path = nonexistent_dir / 'new_file.txt'
     with pytest.raises(FileNotFoundError):
         write_content_to_file(str(file_path), 'This is a new file')
+
+
+@pytest.fixture()
+def large_file(tmp_path: pathlib.Path) -> pathlib.Path:
+    path = tmp_path / 'large.log'
+    path.write_text(''.join(f'line {idx}\n' for idx in range(1, 100_001)))
+    return path
+
+
+def test_get_file_contents_large_file_returns_metadata(large_file: pathlib.Path) -> None:
+    content = get_file_contents(str(large_file))
+    assert 'too large' in content
+    assert '100000 lines' in content
+    assert 'utf-8' in content
+    assert get_file_info(str(large_file)) == {
+        'path': str(large_file),
+        'size': large_file.stat().st_size,
+        'lines': 100_000,
+        'encoding': 'utf-8',
+        'sha256': hashlib.sha256(large_file.read_bytes()).hexdigest(),
+    }
+    assert get_file_contents(str(large_file), full=True) == large_file.read_text()
+
+
+def test_get_file_contents_line_range(large_file: pathlib.Path) -> None:
+    content = get_file_contents(str(large_file), start_line=50_000, end_line=50_002)
+    assert content == 'line 50000\nline 50001\nline 50002\n'
+    assert get_file_contents(str(large_file), start_line=1, end_line=1) == 'line 1\n'
+    assert get_file_contents(str(large_file), start_line=99_999, end_line=200_000) == 'line 99999\nline 100000\n'
+    assert get_file_contents(str(large_file), start_line=200_000) == ''
+
+
+def test_get_file_contents_line_range_is_capped(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / 'wide.txt'
+    path.write_text('x' * 200_000 + '\nlast\n')
+    content = get_file_contents(str(path), start_line=1, end_line=2)
+    assert content.endswith('[truncated at 65536 bytes]')
+    assert len(content) < 70_000
+
+
+def test_get_file_contents_line_range_ending_at_the_cap(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / 'exact.txt'
+    first = 'x' * 65_535 + '\n'
+    path.write_text(first + 'next\n')
+    assert get_file_contents(str(path), start_line=1, end_line=1) == first
+    content = get_file_contents(str(path), start_line=1, end_line=2)
+    assert content == f'{first}\n... [truncated at 65536 bytes]'
+
+
+def test_get_file_contents_byte_range(test_directory: pathlib.Path) -> None:
+    file_path = test_directory / 'file1.txt'
+    assert get_file_contents(str(file_path), byte_offset=8, byte_length=4) == 'file'
+    assert get_file_contents(str(file_path), byte_offset=8) == 'file 1'
+
+
+def test_get_file_contents_preview(large_file: pathlib.Path) -> None:
+    content = get_file_contents(str(large_file), preview=True)
+    assert content.startswith('line 1\nline 2\n')
+    assert '[99960 lines omitted]' in content
+    assert content.endswith('line 99999\nline 100000\n')
+
+
+def test_get_file_contents_last_line_without_newline(test_directory: pathlib.Path) -> None:
+    file_path = test_directory / 'file1.txt'
+    assert get_file_info(str(file_path))['lines'] == 1
+    assert get_file_contents(str(file_path), start_line=1) == 'This is file 1'
+
+
+SOURCE = """def greet(name):
+    return f'hello {name}'
+
+
+def main():
+    print(greet('world'))
+"""
+
+
+@pytest.fixture()
+def source_file(tmp_path: pathlib.Path) -> pathlib.Path:
+    path = tmp_path / 'source.py'
+    path.write_text(SOURCE)
+    return path
+
+
+def test_apply_patch_search_replace(source_file: pathlib.Path) -> None:
+    patch = """<<<<<<< SEARCH
+    return f'hello {name}'
+=======
+    return f'hi {name}!'
+>>>>>>> REPLACE
+<<<<<<< SEARCH
+    print(greet('world'))
+=======
+    print(greet('there'))
+>>>>>>> REPLACE"""
+    summary = apply_patch(str(source_file), patch)
+    assert source_file.read_text() == SOURCE.replace('hello {name}', 'hi {name}!').replace('world', 'there')
+    assert summary.startswith(f'{source_file}: 2 hunk(s), +2 -2 lines')
+    assert f'sha256: {hashlib.sha256(source_file.read_bytes()).hexdigest()[:16]}' in summary
+
+
+def test_apply_patch_unified_diff_with_shifted_line_numbers(source_file: pathlib.Path) -> None:
+    patch = """--- a/source.py
++++ b/source.py
+@@ -10,3 +10,4 @@
+ def main():
+-    print(greet('world'))
++    for name in ('a', 'b'):
++        print(greet(name))
+"""
+    apply_patch(str(source_file), patch)
+    assert source_file.read_text().endswith("def main():\n    for name in ('a', 'b'):\n        print(greet(name))\n")
+
+
+def test_apply_patch_edits_lines_looking_like_file_headers(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / 'query.sql'
+    path.write_text('select 1;\n-- old comment\nselect 2;\n')
+    patch = """--- a/query.sql
++++ b/query.sql
+@@ -1,3 +1,3 @@
+ select 1;
+--- old comment
++++ new comment
+ select 2;
+"""
+    apply_patch(str(path), patch)
+    assert path.read_text() == 'select 1;\n++ new comment\nselect 2;\n'
+    with pytest.raises(PatchError, match='changes nothing'):
+        apply_patch(str(path), '@@ -1,2 +1,2 @@\n select 1;\n ++ new comment\n')
+
+
+def test_apply_patch_rejects_bad_hunks(source_file: pathlib.Path) -> None:
+    with pytest.raises(PatchError, match='not found'):
+        apply_patch(str(source_file), '<<<<<<< SEARCH\nmissing line\n=======\nx\n>>>>>>> REPLACE')
+    with pytest.raises(PatchError, match='matches 2 places'):
+        apply_patch(str(source_file), '<<<<<<< SEARCH\n\n=======\nx\n>>>>>>> REPLACE')
+    with pytest.raises(PatchError, match='no hunks'):
+        apply_patch(str(source_file), 'replace everything')
+    assert source_file.read_text() == SOURCE
+
+
+def test_apply_patch_detects_concurrent_modification(source_file: pathlib.Path) -> None:
+    sha256 = get_file_info(str(source_file))['sha256']
+    source_file.write_text(SOURCE + '# edited elsewhere\n')
+    with pytest.raises(FileChangedError):
+        apply_patch(str(source_file), '<<<<<<< SEARCH\ndef main():\n=======\ndef run():\n>>>>>>> REPLACE', sha256[:16])
+    assert 'def main():' in source_file.read_text()
+
+
+def test_apply_patch_keeps_line_endings_and_mode(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / 'script.sh'
+    path.write_bytes(b'#!/bin/sh\r\necho one\r\n')
+    path.chmod(0o755)
+    apply_patch(str(path), '<<<<<<< SEARCH\necho one\n=======\necho two\n>>>>>>> REPLACE')
+    assert path.read_bytes() == b'#!/bin/sh\r\necho two\r\n'
+    assert path.stat().st_mode & 0o777 == 0o755
+    assert [item.name for item in tmp_path.iterdir()] == ['script.sh']
+
+
+def test_apply_patch_only_touches_patched_lines(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / 'source.py'
+    path.write_bytes(b'a = 1\n\x0c\nb = 2\r\nc = "x\xe2\x80\xa8y"\nd = 4')
+    apply_patch(str(path), '<<<<<<< SEARCH\na = 1\n=======\na = 3\na2 = 3\n>>>>>>> REPLACE')
+    assert path.read_bytes() == b'a = 3\na2 = 3\n\x0c\nb = 2\r\nc = "x\xe2\x80\xa8y"\nd = 4'
+    apply_patch(str(path), '<<<<<<< SEARCH\nd = 4\n=======\nd = 5\ne = 6\n>>>>>>> REPLACE')
+    assert path.read_bytes().endswith(b'c = "x\xe2\x80\xa8y"\nd = 5\ne = 6')
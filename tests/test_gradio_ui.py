@@ -0,0 +1,80 @@
+import time
+from types import SimpleNamespace
+
+import gradio as gr
+import pytest
+from smolagents.agents import ActionStep
+
+from first_agent.Gradio_UI import GradioUI, MessageWindow
+from first_agent.models import StreamingOpenAIServerModel
+
+
+def chunk(content: str | None = None, usage: SimpleNamespace | None = None) -> SimpleNamespace:
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+@pytest.fixture()
+def model() -> StreamingOpenAIServerModel:
+    model = StreamingOpenAIServerModel(model_id='local', api_base='http://localhost:1/v1', api_key='key')
+    usage = SimpleNamespace(prompt_tokens=12, completion_tokens=3)
+
+    def create(**kwargs):
+        assert kwargs['stream']
+        return iter([chunk('Thought: '), chunk('done'), chunk(usage=usage)])
+
+    model.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return model
+
+
+def test_streaming_model_passes_tokens_to_listeners(model: StreamingOpenAIServerModel) -> None:
+    tokens = []
+    with model.streaming_to(tokens.append):
+        message = model([{'role': 'user', 'content': 'hi'}])
+    assert tokens == ['Thought: ', 'done']
+    assert message.content == 'Thought: done'
+    assert (model.last_input_token_count, model.last_output_token_count) == (12, 3)
+    assert message.raw.usage.prompt_tokens == 12
+    assert model.listeners == []
+
+
+def test_message_window_folds_old_messages() -> None:
+    window = MessageWindow(max_rendered=10, fold_batch=4)
+    for idx in range(12):
+        window.append(gr.ChatMessage(role='assistant', content=str(idx)))
+    rendered = window.rendered()
+    assert rendered[0].content.startswith('_4 earlier messages hidden')
+    assert [msg.content for msg in rendered[1:]] == [str(idx) for idx in range(4, 12)]
+    window.select(0)
+    assert [msg.content for msg in window.rendered()] == [str(idx) for idx in range(12)]
+
+
+def test_message_window_loads_long_logs_on_select() -> None:
+    window = MessageWindow(preview_chars=10)
+    log = 'x' * 25
+    window.append(gr.ChatMessage(role='assistant', content='code', metadata={'id': 'call_1'}))
+    window.append(gr.ChatMessage(role='assistant', content=log, metadata={'parent_id': 'call_1'}))
+    assert window.rendered()[1].content == 'x' * 10 + '\n\n_... 15 more characters, click to load_'
+    window.select(1)
+    assert window.rendered()[1].content == log
+
+
+def test_interact_with_agent_streams_tokens(model: StreamingOpenAIServerModel) -> None:
+    def run(task, stream, reset, additional_args):
+        output = model([{'role': 'user', 'content': task}])
+        # leave the UI time to render the streamed tokens before the step is logged
+        time.sleep(0.2)
+        yield ActionStep(step_number=1, model_output=output.content, duration=1.0)
+        yield 'the answer'
+
+    ui = GradioUI(SimpleNamespace(model=model, run=run))
+    window = MessageWindow()
+    updates = [[msg.content for msg in update] for update in ui.interact_with_agent('question', window)]
+    assert updates[0] == ['question']
+    assert any(update[-1].startswith('Thought: ') for update in updates[1:-1])
+    final = updates[-1]
+    assert final[0] == 'question'
+    assert 'Thought: done' in final
+    assert final[-1] == '**Final answer:**\nthe answer\n'
+    # the live message was replaced by the step's messages
+    assert not any(msg.metadata.get('title') == '✍️ Generating' for msg in window.messages)
@@ -0,0 +1,60 @@
+import huggingface_hub
+import pytest
+from huggingface_hub.errors import LocalEntryNotFoundError
+
+from first_agent.tools import hub
+
+TOOL_CODE = """
+from smolagents import Tool
+
+
+class ShoutTool(Tool):
+    name = 'shout'
+    description = 'Upper-cases the text'
+    inputs = {'text': {'type': 'string', 'description': 'text'}}
+    output_type = 'string'
+
+    def forward(self, text: str) -> str:
+        return text.upper()
+"""
+
+
+@pytest.fixture()
+def downloads(tmp_path, monkeypatch) -> list[bool]:
+    """Fake Hub that only has the tool locally after a first download"""
+    tool_file = tmp_path / 'tool.py'
+    calls = []
+
+    def hf_hub_download(repo_id, filename, repo_type=None, local_files_only=False):
+        calls.append(local_files_only)
+        if local_files_only and not tool_file.exists():
+            raise LocalEntryNotFoundError('not cached')
+        tool_file.write_text(TOOL_CODE)
+        return str(tool_file)
+
+    monkeypatch.setattr(huggingface_hub, 'hf_hub_download', hf_hub_download)
+    hub.load_hub_tool.cache_clear()
+    yield calls
+    hub.load_hub_tool.cache_clear()
+
+
+def test_load_hub_tool_prefers_local_cache(downloads):
+    assert hub.load_hub_tool('user/shout')('a') == 'A'
+    assert downloads == [True, False]
+    hub.load_hub_tool.cache_clear()
+    hub.load_hub_tool('user/shout')
+    assert downloads == [True, False, True]
+
+
+def test_lazy_hub_tool_loads_on_first_call(downloads):
+    tool = hub.LazyHubTool(
+        'user/shout',
+        name='shout',
+        description='Upper-cases the text',
+        inputs={'text': {'type': 'string', 'description': 'text'}},
+        output_type='string',
+    )
+    assert downloads == []
+    assert tool(text='hi') == 'HI'
+    assert tool(text='again') == 'AGAIN'
+    assert downloads == [True, False]
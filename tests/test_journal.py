@@ -0,0 +1,113 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from smolagents.memory import ActionStep, TaskStep, ToolCall
+
+from first_agent import context_tools
+from first_agent.context_tools import SummarizedStep
+from first_agent.journal import ContextJournal, journal_files, last_seq, read_records, render_context, replay
+from first_agent.memory_store import MemoryStore
+
+
+def action(number: int, size: int = 10) -> ActionStep:
+    return ActionStep(
+        step_number=number,
+        model_output=f'Thought: step {number}',
+        tool_calls=[ToolCall(name='python_interpreter', arguments='print(1)', id=f'call_{number}')],
+        observations='x' * size,
+    )
+
+
+@pytest.fixture()
+def journal_path(tmp_path):
+    return tmp_path / 'journal.jsonl'
+
+
+def test_records_hold_only_changes(journal_path):
+    journal = ContextJournal(journal_path)
+    steps = [TaskStep(task='task'), action(1)]
+    journal.record('default', steps)
+    steps.append(action(2))
+    journal.record('default', steps)
+    steps[1] = SummarizedStep(summarized='step 1 in short')
+    journal.record('default', steps)
+    journal.close()
+
+    records = list(read_records(journal_path))
+    assert [record['seq'] for record in records] == [1, 2, 3]
+    assert records[1]['ops'][0] == ['k', 2]
+    assert [op[0] for op in records[1]['ops']] == ['k', 'a']
+    assert [op[0] for op in records[2]['ops']] == ['k', 'd', 'a', 'k']
+
+    context = replay(journal_path)
+    assert [step['type'] for step in context] == ['TaskStep', 'SummarizedStep', 'ActionStep']
+    assert 'step 1 in short' in render_context(context)
+    assert [step['type'] for step in replay(journal_path, seq=1)] == ['TaskStep', 'ActionStep']
+
+
+def test_freed_steps_do_not_alias_new_ones(journal_path):
+    journal = ContextJournal(journal_path)
+    steps = [action(number) for number in range(50)]
+    journal.record('default', steps)
+    journal.record('default', [*steps, action(50)])
+    journal.flush()
+    # the recorded steps are freed, new steps may get their addresses
+    del steps
+    journal.record('default', [action(number, size=20) for number in range(50)])
+    journal.close()
+    assert [step['messages'][-1]['content'].count('x') for step in replay(journal_path)] == [20] * 50
+
+
+def test_rotation_keeps_every_file_replayable(journal_path):
+    journal = ContextJournal(journal_path, max_bytes=2000, backups=2, compress=True)
+    steps = [TaskStep(task='task')]
+    for number in range(1, 20):
+        steps.append(action(number, size=300))
+        journal.record('default', steps, step=number)
+    journal.close()
+
+    files = journal_files(journal_path)
+    assert [file.name for file in files] == ['journal.2.jsonl.gz', 'journal.1.jsonl.gz', 'journal.jsonl']
+    context = replay(journal_path)
+    assert len(context) == 20
+    assert [step['step'] for step in replay(journal_path, step=18)][-1] == 18
+    # older steps were rotated away with their files
+    assert replay(journal_path, step=1) == context
+    assert last_seq(journal_path) == list(read_records(journal_path))[-1]['seq']
+    ContextJournal(journal_path).close()
+
+
+def test_full_queue_drops_records_and_resyncs(journal_path):
+    journal = ContextJournal(journal_path, max_queue=1)
+    # stop the writer and fill the queue
+    journal._queue.put(None)
+    journal._thread.join()
+    journal._queue.put(('other', 0.0, [], {}))
+    steps = [TaskStep(task='task')]
+    journal.record('default', steps)
+    assert journal.dropped == 1
+    assert 'default' not in journal._last
+
+
+def test_sequence_continues_after_restart(journal_path):
+    for _ in range(2):
+        journal = ContextJournal(journal_path)
+        journal.record('default', [TaskStep(task='task')])
+        journal.close()
+    assert [json.loads(line)['seq'] for line in journal_path.read_text().splitlines()] == [1, 2]
+
+
+def test_log_global_memory_records_the_context(journal_path):
+    steps = [TaskStep(task='task'), action(1)]
+    agent = SimpleNamespace(memory=SimpleNamespace(steps=steps), step_callbacks=[])
+    journal = ContextJournal(journal_path)
+    context_tools.set_journal(journal)
+    try:
+        with context_tools.bind_context(context_tools.create_context(agent, MemoryStore(), name='default')):
+            context_tools.log_global_memory()
+        journal.flush()
+    finally:
+        context_tools.set_journal(None)
+        journal.close()
+    assert [step['type'] for step in replay(journal_path)] == ['TaskStep', 'ActionStep']
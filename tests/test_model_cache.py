@@ -0,0 +1,80 @@
+import pytest
+from smolagents import CodeAgent
+from smolagents.models import ChatMessage
+
+from first_agent.model_cache import CacheMiss, CachingModel, completion_key
+
+ANSWERS = [
+    'Thought: compute\nCode:\n```py\nx = 6 * 7\nprint(x)\n```<end_code>',
+    'Thought: done\nCode:\n```py\nfinal_answer(x)\n```<end_code>',
+]
+
+
+class CountingModel:
+    model_id = 'counting'
+
+    def __init__(self, answers: list[str] | None = None):
+        self.answers = list(answers or [])
+        self.calls = 0
+        self.kwargs = {'temperature': 0.5}
+        self.last_input_token_count = 0
+        self.last_output_token_count = 0
+
+    def __call__(self, messages, stop_sequences=None, grammar=None, tools_to_call_from=None, **kwargs):
+        self.calls += 1
+        self.last_input_token_count = 100
+        self.last_output_token_count = 7
+        return ChatMessage(role='assistant', content=self.answers.pop(0) if self.answers else f'answer {self.calls}')
+
+
+MESSAGES = [{'role': 'user', 'content': [{'type': 'text', 'text': 'hello'}]}]
+
+
+def test_readwrite_serves_identical_prompts_from_disk(tmp_path):
+    model = CountingModel()
+    cached = CachingModel(model, tmp_path)
+    first = cached(MESSAGES, stop_sequences=['<end_code>'])
+    second = CachingModel(model, tmp_path)(MESSAGES, stop_sequences=['<end_code>'])
+    assert second.content == first.content
+    assert model.calls == 1
+    assert cached.last_output_token_count == 7
+
+    cached(MESSAGES, stop_sequences=['Observation:'])
+    assert model.calls == 2
+
+
+def test_key_covers_model_and_parameters():
+    model = CountingModel()
+    key = completion_key(model, MESSAGES, stop_sequences=['a'])
+    assert key == completion_key(model, MESSAGES, stop_sequences=['a'], grammar=None)
+    assert key != completion_key(model, MESSAGES, stop_sequences=['b'])
+    model.kwargs = {'temperature': 0.0}
+    assert key != completion_key(model, MESSAGES, stop_sequences=['a'])
+
+
+def test_replay_mode_never_calls_the_model(tmp_path):
+    model = CountingModel()
+    CachingModel(model, tmp_path)(MESSAGES)
+    replay = CachingModel(model, tmp_path, mode='replay')
+    assert replay(MESSAGES).content == 'answer 1'
+    with pytest.raises(CacheMiss):
+        replay([{'role': 'user', 'content': [{'type': 'text', 'text': 'new prompt'}]}])
+    assert model.calls == 1
+    assert (replay.hits, replay.misses) == (1, 1)
+
+
+def test_agent_run_replays_offline(tmp_path):
+    recorded = CachingModel(CountingModel(ANSWERS), tmp_path)
+    assert CodeAgent(tools=[], model=recorded, verbosity_level=0).run('six times seven') == 42
+
+    offline = CountingModel()
+    replayed = CachingModel(offline, tmp_path, mode='replay')
+    agent = CodeAgent(tools=[], model=replayed, verbosity_level=0)
+    assert agent.run('six times seven') == 42
+    assert offline.calls == 0
+    assert agent.monitor.get_total_token_counts() == {'input': 200, 'output': 14}
+
+
+def test_unknown_mode(tmp_path):
+    with pytest.raises(ValueError, match='Unknown cache mode'):
+        CachingModel(CountingModel(), tmp_path, mode='write')
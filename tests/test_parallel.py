@@ -0,0 +1,60 @@
+import time
+
+from smolagents import tool
+
+from first_agent.tools.parallel import ParallelToolsTool, mark_side_effect_free
+
+EVENTS = []
+
+
+@tool
+def slow_read(name: str) -> str:
+    """Reads something slowly.
+    Args:
+        name: What to read.
+    """
+    time.sleep(0.2)
+    EVENTS.append(f'read {name}')
+    return f'content of {name}'
+
+
+@tool
+def write(name: str) -> str:
+    """Writes something.
+    Args:
+        name: What to write.
+    """
+    EVENTS.append(f'write {name}')
+    return f'wrote {name}'
+
+
+mark_side_effect_free(slow_read)
+
+
+def test_reads_run_concurrently() -> None:
+    parallel = ParallelToolsTool([slow_read, write])
+    started = time.monotonic()
+    results = parallel(calls=[{'tool': 'slow_read', 'args': {'name': str(idx)}} for idx in range(4)])
+    assert time.monotonic() - started < 0.6
+    assert results == [f'content of {idx}' for idx in range(4)]
+
+
+def test_writes_are_barriers() -> None:
+    EVENTS.clear()
+    parallel = ParallelToolsTool([slow_read, write])
+    results = parallel(
+        calls=[
+            {'tool': 'slow_read', 'args': {'name': 'a'}},
+            {'tool': 'write', 'args': {'name': 'b'}},
+            {'tool': 'slow_read', 'args': {'name': 'c'}},
+        ]
+    )
+    assert results == ['content of a', 'wrote b', 'content of c']
+    assert EVENTS == ['read a', 'write b', 'read c']
+
+
+def test_errors_are_reported_per_call() -> None:
+    parallel = ParallelToolsTool([slow_read])
+    results = parallel(calls=[{'tool': 'missing', 'args': {}}, {'tool': 'slow_read', 'args': {'wrong': 1}}])
+    assert results[0].startswith("Error: unknown tool 'missing'")
+    assert results[1].startswith('Error in slow_read: TypeError')
@@ -0,0 +1,124 @@
+import pytest
+from smolagents import tool
+from smolagents.agents import populate_template
+
+from first_agent.agent import CONTEXT_TOKEN_BUDGET, load_prompt_templates, prompt_compiler
+from first_agent.prompt_compiler import COMPACT, DEFAULT, FULL, Example, PromptCompiler, first_sentence
+from first_agent.prompting import PrefixStableCodeAgent
+from first_agent.tools.final_answer import FinalAnswerTool
+from tests.test_prompting import RecordingModel
+
+
+@tool
+def web_search(query: str) -> str:
+    """Performs a web search and returns the top results. Use it for recent facts.
+
+    Args:
+        query: the search query
+    """
+    return query
+
+
+@pytest.fixture()
+def template():
+    return load_prompt_templates()['system_prompt']
+
+
+@pytest.fixture()
+def tools():
+    return {'final_answer': FinalAnswerTool(), 'web_search': web_search}
+
+
+def test_first_sentence():
+    assert first_sentence('Searches the web. Use it often.\nMore') == 'Searches the web.'
+    assert first_sentence('No stop here\nsecond line') == 'No stop here'
+
+
+def test_prompt_states_the_compaction_budget(template, tools):
+    for profile in (FULL, DEFAULT, COMPACT):
+        text = PromptCompiler(template, profile=profile).compile(tools).text
+        assert f'under {CONTEXT_TOKEN_BUDGET} tokens' in text
+        assert 'context_token_budget' not in text
+    assert 'under 8000 tokens' in prompt_compiler(DEFAULT, 8000).compile(tools).text
+
+
+def test_example_tools_skip_builtins():
+    example = Example.parse('Task: "x"\n\nThought: t\nCode:\n```py\nprint(search(query="x"))\n```<end_code>')
+    assert example.task == 'Task: "x"'
+    assert example.tools == {'search'}
+
+
+def test_full_profile_renders_the_template(template, tools):
+    compiled = PromptCompiler(template, FULL).compile(tools, {}, "['re']")
+    assert compiled.text == populate_template(
+        template, {'tools': tools, 'managed_agents': {}, 'authorized_imports': "['re']"}
+    )
+
+
+def test_default_profile_keeps_examples_of_available_tools(template, tools):
+    compiler = PromptCompiler(template, DEFAULT)
+    selected = compiler.select_examples(set(tools), task='What is 5 + 3 + 1294.678?')
+    assert selected
+    assert all(example.tools <= set(tools) for example in selected)
+    compiled = compiler.compile(tools, {}, "['re']", task='What is 5 + 3 + 1294.678?')
+    assert 'document_qa' not in compiled.text
+    assert 'image_generator' not in compiled.text
+    assert 'notional tools' not in compiled.text.split('Here are the rules')[0].split('---')[-1]
+    assert 'web_search' in compiled.text
+    assert compiled.tokens < PromptCompiler(template, FULL).compile(tools, {}, "['re']").tokens
+
+
+def test_examples_ranked_by_task(template):
+    compiler = PromptCompiler(template, DEFAULT, max_examples=1)
+    tool_names = {
+        'search',
+        'web_search',
+        'wiki',
+        'document_qa',
+        'image_generator',
+        'translator',
+        'image_qa',
+        'final_answer',
+    }
+    [example] = compiler.select_examples(tool_names, task='Who is the pope, and how old is he?')
+    assert 'pope' in example.task
+
+
+def test_compile_is_cached(template, tools):
+    compiler = PromptCompiler(template, DEFAULT)
+    first = compiler.compile(tools, {}, "['re']")
+    assert compiler.compile(tools, {}, "['re']") is first
+    assert compiler.compile(tools, {}, "['json']") is not first
+
+
+def test_report_lists_sections(template, tools):
+    compiled = PromptCompiler(template, DEFAULT).compile(tools, {}, "['re']")
+    names = [name for name, _ in compiled.sections]
+    assert names[0] == 'intro'
+    assert names[-2:] == ['tools', 'rules']
+    report = compiled.report().splitlines()
+    assert report[-1].split() == [str(compiled.tokens), 'total']
+
+
+def test_compact_profile_fits_the_budget(template, tools):
+    compiled = PromptCompiler(template, COMPACT, token_budget=1200).compile(tools, {}, "['re']")
+    assert compiled.tokens <= 1200
+    assert '- web_search(query: string) -> string: Performs a web search and returns the top results.' in compiled.text
+    assert 'Use it for recent facts' not in compiled.text
+
+
+def test_compact_profile_drops_descriptions_over_budget(template, tools):
+    compiler = PromptCompiler(template, COMPACT, token_budget=1)
+    compiled = compiler.compile(tools, {}, "['re']")
+    assert '- web_search(query: string) -> string\n' in compiled.text
+    assert not [name for name, _ in compiled.sections if name.startswith('example')]
+
+
+def test_agent_uses_the_compiler(template):
+    model = RecordingModel(["Thought: done\nCode:\n```py\nfinal_answer('done')\n```<end_code>"])
+    compiler = PromptCompiler(template, COMPACT)
+    agent = PrefixStableCodeAgent(tools=[web_search], model=model, prompt_compiler=compiler, verbosity_level=0)
+    assert agent.run('Search the news') == 'done'
+    system = model.prompts[0][0]['content'][0]['text']
+    assert system.startswith(template.split('\n', 1)[0])
+    assert '- web_search(query: string) -> string: ' in system
@@ -0,0 +1,83 @@
+import logging
+from types import SimpleNamespace
+
+from smolagents.memory import TaskStep
+from smolagents.models import ChatMessage
+
+from first_agent.context_tools import bind_context, create_context, persist_in_memory
+from first_agent.memory_store import MemoryStore
+from first_agent.models import Usage
+from first_agent.prompting import PrefixStableCodeAgent, PrefixStats, PromptTail
+
+ANSWERS = [
+    "Thought: remember\nCode:\n```py\npersist_in_memory('city', 'Shanghai')\n```<end_code>",
+    "Thought: look\nCode:\n```py\nprint('population 26M')\n```<end_code>",
+    "Thought: done\nCode:\n```py\nfinal_answer('done')\n```<end_code>",
+]
+
+
+class RecordingModel:
+    model_id = 'recording'
+
+    def __init__(self, answers: list[str]):
+        self.answers = list(answers)
+        self.prompts: list[list[dict]] = []
+
+    def __call__(self, messages, **kwargs):
+        self.prompts.append(messages)
+        message = ChatMessage(role='assistant', content=self.answers.pop(0))
+        message.usage = Usage(100, 10, 60)
+        return message
+
+
+def text(message: dict) -> str:
+    return ''.join(item['text'] for item in message['content'])
+
+
+def test_prompt_tail_renders_sections_in_order():
+    tail = PromptTail()
+    tail.set('memory', 'a: 1')
+    tail.set('notes', 'n')
+    tail.set('memory', 'a: 2')
+    assert tail.render() == 'a: 2\n\nn'
+    tail.clear('notes')
+    assert tail.render() == 'a: 2'
+
+
+def test_prefix_stats():
+    stats = PrefixStats()
+    first = [{'role': 'system', 'content': 'sys'}, {'role': 'user', 'content': 'task'}]
+    assert stats.observe(first) == 0
+    assert stats.observe([*first, {'role': 'user', 'content': 'more'}]) == len('system\x00sys\x00user\x00task\x00')
+    # the common prefix goes into the first message that differs
+    assert stats.observe([first[0], {'role': 'user', 'content': 'tasks'}]) == len('system\x00sys\x00user\x00task')
+    assert 0 < stats.hit_ratio < 1
+
+
+def test_memory_goes_to_the_tail_and_prefix_stays_stable(caplog):
+    model = RecordingModel(ANSWERS)
+    agent = PrefixStableCodeAgent(tools=[persist_in_memory], model=model, verbosity_level=0)
+    context = create_context(agent, MemoryStore())
+    with bind_context(context), caplog.at_level(logging.INFO, logger='prompting'):
+        assert agent.run('Find the population') == 'done'
+    assert 'over 3 calls, server cache hit ratio 0.6' in caplog.text
+
+    first, second, third = model.prompts
+    # the task step is kept, the digest is the last message
+    assert 'Find the population' in text(second[1])
+    assert text(second[-1]) == "PERSISTENT MEMORY:\ncity: 'Shanghai'"
+    assert text(third[-1]) == text(second[-1])
+    # every prompt starts with the previous one, up to the tail
+    assert second[: len(first)] == first
+    assert third[: len(second) - 1] == second[:-1]
+    assert agent.prefix_stats.calls == 3
+    assert agent.prefix_stats.hit_ratio > 0.5
+    assert agent.prefix_stats.server_hit_ratio == 0.6
+
+
+def test_legacy_agent_still_rewrites_step_zero():
+    steps = [TaskStep(task='task'), TaskStep(task='more')]
+    agent = SimpleNamespace(memory=SimpleNamespace(steps=steps), step_callbacks=[])
+    with bind_context(create_context(agent, MemoryStore())):
+        persist_in_memory('key', 'value')
+    assert "key: 'value'" in steps[0].summarized
@@ -0,0 +1,111 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from smolagents.memory import ActionStep, AgentMemory, TaskStep, ToolCall
+
+from first_agent import context_tools
+from first_agent.compaction import ContextCompactor
+from first_agent.context_accounting import ContextAccounting
+from first_agent.context_tools import bind_context, create_context
+from first_agent.memory_store import MemoryStore
+from first_agent.retrieval import RetrievalIndex, chunk, terms
+
+
+def action(number: int, observations: str, start_time: float | None = None) -> ActionStep:
+    return ActionStep(
+        step_number=number,
+        start_time=start_time,
+        model_output=f'Thought: step {number}',
+        tool_calls=[ToolCall(name='python_interpreter', arguments='print(1)', id=f'call_{number}')],
+        observations=observations,
+    )
+
+
+@pytest.fixture()
+def index() -> RetrievalIndex:
+    index = RetrievalIndex()
+    index.add('shanghai', 'Shanghai has a population of 26 million people', source='step 1')
+    index.add('paris', 'Paris is the capital of France', source='step 2')
+    index.add('tokyo', 'Tokyo has a population of 37 million, the largest metropolitan population', source='step 3')
+    return index
+
+
+def test_terms_and_chunks():
+    assert terms('Hello, World! a 42') == ['hello', 'world', '42']
+    passages = chunk('line one\nline two\n' + 'x' * 25, max_chars=20)
+    assert passages == ['line one\nline two', 'x' * 20, 'x' * 5]
+
+
+def test_bm25_ranking(index):
+    hits = index.search('population of Shanghai', k=2)
+    assert [hit.doc_id for hit in hits] == ['shanghai', 'tokyo']
+    assert hits[0].score > hits[1].score > 0
+    assert [hit.doc_id for hit in index.search('capital')] == ['paris']
+    assert index.search('unknown words') == []
+
+
+def test_replace_and_remove(index):
+    assert not index.add('paris', 'Paris is in Texas', replace=False)
+    index.add('paris', 'Paris is in Texas')
+    assert index.search('capital') == []
+    index.remove('shanghai')
+    assert 'shanghai' not in index
+    assert [hit.doc_id for hit in index.search('population')] == ['tokyo']
+    # freed slots are reused
+    index.add('lima', 'Lima population 10 million')
+    assert len(index._ids) == 3
+
+
+def test_embeddings_find_passages_without_shared_words():
+    vectors = {'automobile': [1.0, 0.0], 'car': [0.9, 0.1], 'banana': [0.0, 1.0]}
+
+    def embedder(texts):
+        return np.array([vectors[text.split()[0]] for text in texts], dtype=np.float32)
+
+    index = RetrievalIndex(embedder=embedder)
+    index.add('vehicle', 'automobile repair shop')
+    index.add('fruit', 'banana bread recipe')
+    assert [hit.doc_id for hit in index.search('car', k=1)] == ['vehicle']
+
+
+def test_recall_finds_evicted_steps_and_memory():
+    steps = [TaskStep(task='Find populations'), action(1, 'Shanghai has 26 million inhabitants'), action(2, 'ok')]
+    agent = SimpleNamespace(memory=SimpleNamespace(steps=steps), step_callbacks=[])
+    store = MemoryStore()
+    store.set('capital', 'Paris')
+    with bind_context(create_context(agent, store)):
+        assert context_tools.recall('capital')[0]['source'] == 'memory capital'
+        context_tools.modify_step(1, 'searched Shanghai')
+        context_tools.remove_step(1)
+        context_tools.persist_in_memory('river', 'Huangpu')
+        [hit] = context_tools.recall('inhabitants', k=1)
+        assert hit['source'] == 'step 1'
+        assert 'Shanghai has 26 million inhabitants' in hit['text']
+        assert 'Huangpu' in context_tools.recall('river')[0]['text']
+
+
+def test_compacted_observations_stay_recallable():
+    steps = [TaskStep(task='Read pages'), *(action(idx, f'page {idx} ' + 'words ' * 400) for idx in range(1, 5))]
+    steps[1] = action(1, 'filler ' * 200 + '\nthe secret code is 1234\n' + 'filler ' * 200)
+    agent = SimpleNamespace(memory=SimpleNamespace(steps=steps), step_callbacks=[])
+    accounting = ContextAccounting()
+    with bind_context(create_context(agent, MemoryStore(), accounting)):
+        ContextCompactor(accounting, budget_tokens=200).compact(steps)
+        assert '1234' not in ''.join(str(step) for step in steps)
+        assert '1234' in context_tools.recall('secret code')[0]['text']
+
+
+def test_steps_of_every_run_are_recallable_until_reset():
+    agent = SimpleNamespace(memory=AgentMemory(''), step_callbacks=[])
+    store = MemoryStore()
+    store.set('capital', 'Paris')
+    with bind_context(create_context(agent, store)):
+        # step numbers start over with each run kept in memory
+        for run, text in enumerate(['lion code 1', 'zebra code 2']):
+            agent.memory.steps += [TaskStep(task=f'run {run}'), action(1, text, start_time=float(run))]
+            context_tools.remove_step(-1)
+        assert 'zebra code 2' in context_tools.recall('zebra code', k=1)[0]['text']
+        assert 'lion code 1' in context_tools.recall('lion code', k=1)[0]['text']
+        agent.memory.reset()
+        assert [hit['source'] for hit in context_tools.recall('capital code')] == ['memory capital']
@@ -0,0 +1,102 @@
+import os
+
+import pytest
+from smolagents import CodeAgent, tool
+from smolagents.local_python_executor import InterpreterError
+
+from first_agent.context_tools import bind_context, create_context, get_from_persistent_memory, persist_in_memory
+from first_agent.memory_store import MemoryStore
+from first_agent.sandbox import SandboxError, SandboxExecutor, SandboxLimits, SandboxPool, use_sandbox
+from tests.test_prompting import RecordingModel
+
+
+@tool
+def shout(text: str) -> str:
+    """Upper cases a text
+
+    Args:
+        text: the text
+    """
+    return text.upper()
+
+
+@tool
+def parent_pid() -> int:
+    """Process id of the agent"""
+    return os.getpid()
+
+
+@pytest.fixture()
+def pool():
+    pool = SandboxPool(1, limits=SandboxLimits(cpu_seconds=1, wall_seconds=3), max_runs=5, preload=['json'])
+    yield pool
+    pool.close()
+
+
+@pytest.fixture()
+def executor(pool):
+    return SandboxExecutor(pool, ['re', 'os'], {'shout': shout, 'parent_pid': parent_pid})
+
+
+def test_code_runs_in_a_worker_and_tools_in_the_parent(executor):
+    output, logs, is_final_answer = executor('import os\nprint(os.getpid() != parent_pid())\nshout("a")', {})
+    assert (output, logs, is_final_answer) == ('A', 'True\n', False)
+
+
+def test_variables_functions_and_modules_are_kept(executor):
+    executor('import re\nwords = ["a", "b"]\ndef double(x):\n    return x * 2', {})
+    output, _, _ = executor('double(re.sub("a", "c", "".join(words)))', {'extra': 1})
+    assert output == 'cbcb'
+    assert executor('extra', {})[0] == 1
+
+
+def test_final_answer_returns_the_tool_result_object(executor):
+    marker = object()
+    executor.tools['make'] = lambda: marker
+    output, _, is_final_answer = executor('final_answer(make())', {})
+    assert output is marker
+    assert is_final_answer
+
+
+def test_errors_keep_print_outputs(executor):
+    with pytest.raises(InterpreterError, match='ZeroDivisionError'):
+        executor('print("before")\n1 / 0', {})
+    assert executor.state['_print_outputs'] == 'before\n'
+
+
+def test_unpicklable_variables_are_reported(executor):
+    _, logs, _ = executor('items = lambda x: x', {})
+    assert 'items cannot be kept' in logs
+
+
+def test_cpu_limit_recycles_the_worker(pool, executor):
+    with pytest.raises(InterpreterError, match='CPU time limit exceeded'):
+        executor('while True:\n    pass', {})
+    assert pool.stats()['recycled'] == 1
+    assert executor('1 + 1', {})[0] == 2
+
+
+def test_wall_clock_limit_kills_the_worker(pool, executor):
+    with pytest.raises(SandboxError, match='took over 3'):
+        executor('import time\ntime.sleep(10)', {})
+    assert pool.stats()['failures'] == 1
+    assert executor('shout("ok")', {})[0] == 'OK'
+
+
+def test_workers_recycled_after_max_runs(pool, executor):
+    pids = {executor('import os\nos.getpid()', {})[0] for _ in range(pool.max_runs + 1)}
+    assert len(pids) == 2
+    assert pool.stats()['executions'] == pool.max_runs + 1
+
+
+def test_agent_uses_the_sandbox(pool):
+    model = RecordingModel(
+        [
+            "Thought: keep\nCode:\n```py\ncity = 'Shanghai'\npersist_in_memory('city', city)\n```<end_code>",
+            "Thought: done\nCode:\n```py\nfinal_answer(get_from_persistent_memory('city') + city)\n```<end_code>",
+        ]
+    )
+    agent = CodeAgent(tools=[persist_in_memory, get_from_persistent_memory], model=model, verbosity_level=0)
+    use_sandbox(agent, pool)
+    with bind_context(create_context(agent, MemoryStore())):
+        assert agent.run('Remember the city') == 'ShanghaiShanghai'
@@ -0,0 +1,58 @@
+import random
+import re
+
+import pytest
+
+from first_agent.sanitize import clean_code, clean_model_output, clean_observations
+
+
+def legacy_model_output(text: str) -> str:
+    text = text.strip()
+    text = re.sub(r'```\s*<end_code>', '```', text)
+    text = re.sub(r'<end_code>\s*```', '```', text)
+    text = re.sub(r'```\s*\n\s*<end_code>', '```', text)
+    return text.strip()
+
+
+def legacy_code(code: str) -> str:
+    code = re.sub(r'```.*?\n', '', code)
+    code = re.sub(r'\s*<end_code>\s*', '', code)
+    code = code.strip()
+    if not code.startswith('```python'):
+        code = f'```python\n{code}\n```'
+    return code
+
+
+def legacy_observations(text: str) -> str:
+    return re.sub(r'^Execution logs:\s*', '', text.strip())
+
+
+PIECES = ['```', '`', '<end_code>', '<end_', 'python', ' ', '\n', 'x = 1', 'Execution logs:', 'print(x)']
+
+
+def random_texts(count: int) -> list[str]:
+    rng = random.Random(0)
+    return [''.join(rng.choice(PIECES) for _ in range(rng.randint(0, 12))) for _ in range(count)]
+
+
+@pytest.mark.parametrize(
+    ('clean', 'legacy'),
+    [
+        (clean_model_output, legacy_model_output),
+        (clean_code, legacy_code),
+        (clean_observations, legacy_observations),
+    ],
+)
+def test_matches_legacy_cleanup(clean, legacy) -> None:
+    for text in random_texts(20_000):
+        assert clean(text) == legacy(text), repr(text)
+
+
+def test_examples() -> None:
+    assert (
+        clean_model_output('Thought: go\nCode:\n```py\nx = 1\n```<end_code>\n')
+        == 'Thought: go\nCode:\n```py\nx = 1\n```'
+    )
+    assert clean_code('```py\nx = 1\n```<end_code>') == '```python\nx = 1\n```\n```'
+    assert clean_code('x = 1') == '```python\nx = 1\n```'
+    assert clean_observations('Execution logs:\n42\n') == '42'
@@ -0,0 +1,103 @@
+import os
+import pathlib
+
+import pytest
+
+from tools.search import RepoIndex, is_ignored, list_files, parse_gitignore, required_literals, search_code
+
+
+@pytest.fixture()
+def repo(tmp_path: pathlib.Path) -> pathlib.Path:
+    root = tmp_path / 'repo'
+    (root / 'pkg' / 'sub').mkdir(parents=True)
+    (root / '.venv' / 'lib').mkdir(parents=True)
+    (root / 'build').mkdir()
+    (root / '.gitignore').write_text('build/\n*.log\n!keep.log\n')
+    (root / 'pkg' / '__init__.py').write_text('')
+    (root / 'pkg' / 'core.py').write_text('def handle_request(request):\n    return Response(request)\n')
+    (root / 'pkg' / 'sub' / 'util.py').write_text('HANDLE = 1\n')
+    (root / 'pkg' / 'sub' / '.gitignore').write_text('generated.py\n')
+    (root / 'pkg' / 'sub' / 'generated.py').write_text('def handle_request(): ...\n')
+    (root / 'README.md').write_text('# handle_request docs\n')
+    (root / 'debug.log').write_text('handle_request failed\n')
+    (root / 'keep.log').write_text('kept\n')
+    (root / 'build' / 'out.py').write_text('def handle_request(): ...\n')
+    (root / '.venv' / 'lib' / 'site.py').write_text('def handle_request(): ...\n')
+    return root
+
+
+def test_gitignore_rules() -> None:
+    rules = parse_gitignore('*.pyc\n/dist\ndocs/**/*.html\ntmp/\n!important.pyc\n')
+    assert is_ignored(rules, 'a/b.pyc', False)
+    assert not is_ignored(rules, 'a/important.pyc', False)
+    assert is_ignored(rules, 'dist', True)
+    assert not is_ignored(rules, 'a/dist', True)
+    assert is_ignored(rules, 'docs/x/y/z.html', False)
+    assert is_ignored(rules, 'a/tmp', True)
+    assert not is_ignored(rules, 'a/tmp', False)
+
+
+def test_required_literals() -> None:
+    assert required_literals(r'def \w+_request\(') == ['def ', '_request']
+    assert required_literals('handle_requests?') == ['handle_request']
+    assert required_literals('foo|bar') == []
+    assert required_literals('(abc)?def') == []
+    assert required_literals('foo(?!bar)baz') == []
+    assert required_literals('(?<!abc)def') == []
+    assert required_literals(r'call\(?x') == ['call']
+
+
+def test_list_files(repo: pathlib.Path) -> None:
+    result = list_files(str(repo))
+    assert result['entries'] == [
+        '.gitignore',
+        'README.md',
+        'keep.log',
+        'pkg/',
+        'pkg/__init__.py',
+        'pkg/core.py',
+        'pkg/sub/',
+        'pkg/sub/.gitignore',
+        'pkg/sub/util.py',
+    ]
+    assert result['next_offset'] is None
+    assert list_files(str(repo), max_depth=1)['entries'] == ['.gitignore', 'README.md', 'keep.log', 'pkg/']
+    assert list_files(str(repo), pattern='*.py')['entries'] == ['pkg/__init__.py', 'pkg/core.py', 'pkg/sub/util.py']
+    assert list_files(str(repo / 'pkg'), pattern='*.py')['entries'] == ['__init__.py', 'core.py', 'sub/util.py']
+
+    page = list_files(str(repo), offset=3, limit=3)
+    assert page == {'entries': ['pkg/', 'pkg/__init__.py', 'pkg/core.py'], 'total': 9, 'next_offset': 6}
+
+
+def test_search_code(repo: pathlib.Path) -> None:
+    result = search_code('handle_request', str(repo))
+    assert result == {
+        'matches': ['README.md:1: # handle_request docs', 'pkg/core.py:1: def handle_request(request):'],
+        'truncated': False,
+    }
+    assert search_code('HANDLE', str(repo), case_sensitive=True)['matches'] == ['pkg/sub/util.py:1: HANDLE = 1']
+    assert search_code(r'def \w+\(', str(repo), regex=True, pattern='*.py')['matches'] == [
+        'pkg/core.py:1: def handle_request(request):'
+    ]
+    assert search_code('return', str(repo / 'pkg'))['matches'] == ['core.py:2: return Response(request)']
+    assert search_code('e', str(repo), max_results=2)['truncated']
+    assert search_code(r'(?<!xx)handle_(?!xyz)request\(', str(repo), regex=True)['matches'] == [
+        'pkg/core.py:1: def handle_request(request):'
+    ]
+
+
+def test_index_refreshes_changed_files(repo: pathlib.Path) -> None:
+    index = RepoIndex(repo)
+    assert len(index.search('Response')[0]) == 1
+
+    core = repo / 'pkg' / 'core.py'
+    core.write_text('def handle(request):\n    return Reply(request)\n')
+    os.utime(core, ns=(core.stat().st_atime_ns, core.stat().st_mtime_ns + 1_000_000_000))
+    (repo / 'pkg' / 'sub' / 'util.py').unlink()
+    (repo / 'pkg' / 'new.py').write_text('x = Reply()\n')
+    index.refresh(force=True)
+
+    assert index.search('Response')[0] == []
+    assert index.search('Reply')[0] == ['pkg/core.py:2: return Reply(request)', 'pkg/new.py:1: x = Reply()']
+    assert index.search('HANDLE', case_sensitive=True)[0] == []
+    assert index.dead == 2
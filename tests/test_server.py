@@ -0,0 +1,210 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from collections.abc import Iterator
+from types import SimpleNamespace
+
+import pytest
+from smolagents.memory import ActionStep
+from smolagents.models import ChatMessage
+
+from first_agent import server as server_module
+from first_agent.context_tools import AgentContext, current_context
+from first_agent.memory_store import MemoryDigest, MemoryStore
+from first_agent.models import Usage
+from first_agent.server import AgentServer, Conflict, make_server
+from first_agent.usage import TokenBudget
+
+
+class FakeAgent:
+    def __init__(self, release: threading.Event):
+        self.memory = SimpleNamespace(steps=[])
+        self.step_callbacks = []
+        self.model = None
+        self.release = release
+
+    def run(self, task, stream=False, reset=True):
+        context = current_context()
+        context.memory.set('task', task)
+        step = ActionStep(
+            step_number=1,
+            model_output=f'Thought: working on {task}',
+            model_output_message=ChatMessage(role='assistant', content=f'Thought: working on {task}'),
+            observations=f'Execution logs:\nisolated {context.agent is self}',
+            duration=0.1,
+        )
+        step.model_output_message.usage = Usage(40, 10)
+        for callback in self.step_callbacks:
+            callback(step, agent=self)
+        yield step
+        self.release.wait(5)
+        yield f'answer to {task}'
+
+
+@pytest.fixture()
+def release() -> threading.Event:
+    event = threading.Event()
+    event.set()
+    return event
+
+
+@pytest.fixture()
+def server(tmp_path, release) -> Iterator[AgentServer]:
+    def factory(memory: MemoryStore):
+        agent = FakeAgent(release)
+        return agent, AgentContext(agent, None, memory, MemoryDigest())
+
+    agent_server = AgentServer(factory, MemoryStore(tmp_path / 'memory.db'), workers=1, max_queue=1)
+    httpd = make_server(agent_server, port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    host, port = httpd.server_address[:2]
+    agent_server.url = f'http://{host}:{port}'
+    yield agent_server
+    release.set()
+    httpd.shutdown()
+    httpd.server_close()
+    agent_server.pool.shutdown()
+
+
+def request(server: AgentServer, method: str, path: str, data: dict | None = None) -> tuple[int, bytes]:
+    body = json.dumps(data).encode() if data is not None else None
+    req = urllib.request.Request(server.url + path, data=body, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=10) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def new_session(server: AgentServer, user: str | None = None) -> str:
+    status, body = request(server, 'POST', '/sessions', {'user': user})
+    assert status == 201
+    return json.loads(body)['session_id']
+
+
+def test_run_streams_sse_events(server):
+    session_id = new_session(server)
+    status, body = request(server, 'POST', f'/sessions/{session_id}/runs', {'task': 'a'})
+    assert status == 200
+    events = [json.loads(line[len('data: ') :]) for line in body.decode().splitlines() if line.startswith('data: ')]
+    assert [event['type'] for event in events] == ['step', 'final_answer']
+    assert events[0]['model_output'] == 'Thought: working on a'
+    assert events[0]['observations'] == 'isolated True'
+    assert events[1]['answer'] == 'answer to a'
+
+
+def test_sessions_are_isolated(server):
+    first, second = new_session(server), new_session(server)
+    for session_id, task in ((first, 'one'), (second, 'two')):
+        status, body = request(server, 'POST', f'/sessions/{session_id}/runs', {'task': task, 'stream': False})
+        assert status == 200
+        assert json.loads(body)['answer'] == f'answer to {task}'
+    sessions = server.sessions.sessions
+    assert sessions[first].agent is not sessions[second].agent
+    assert sessions[first].context.memory.get('task') == 'one'
+    assert sessions[second].context.memory.get('task') == 'two'
+
+
+def test_user_memory_survives_sessions(server):
+    first = new_session(server, user='alice')
+    request(server, 'POST', f'/sessions/{first}/runs', {'task': 'remember', 'stream': False})
+    second = new_session(server, user='alice')
+    assert server.sessions.sessions[second].context.memory.get('task') == 'remember'
+
+
+def test_admission_control_and_metrics(server, release):
+    release.clear()
+    sessions = [new_session(server) for _ in range(4)]
+    threads = [
+        threading.Thread(target=request, args=(server, 'POST', f'/sessions/{sid}/runs', {'task': 'x', 'stream': False}))
+        for sid in sessions[:2]
+    ]
+    for thread in threads:
+        thread.start()
+    while server.pool.running + server.pool.queued < 2:
+        threading.Event().wait(0.01)
+
+    status, _ = request(server, 'POST', f'/sessions/{sessions[2]}/runs', {'task': 'x'})
+    assert status == 429
+    status, _ = request(server, 'POST', f'/sessions/{sessions[0]}/runs', {'task': 'x'})
+    assert status == 409
+
+    status, body = request(server, 'GET', '/metrics')
+    metrics = dict(line.split() for line in body.decode().splitlines() if not line.startswith('#'))
+    assert metrics['agent_server_runs_running'] == '1'
+    assert metrics['agent_server_runs_queued'] == '1'
+    assert metrics['agent_server_runs_rejected_total'] == '1'
+    assert metrics['agent_server_sessions'] == '4'
+
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert server.pool.completed == 2
+
+
+def test_concurrent_runs_of_a_session_conflict(server, release):
+    release.clear()
+    session = server.sessions.get(new_session(server))
+    barrier = threading.Barrier(8)
+    results = []
+
+    def start():
+        barrier.wait()
+        try:
+            results.append(server.start_run(session, 'x'))
+        except Conflict:
+            results.append(None)
+
+    threads = [threading.Thread(target=start) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len([run for run in results if run is not None]) == 1
+    assert len(results) == 8
+
+
+def test_unknown_session_and_delete(server):
+    status, _ = request(server, 'POST', '/sessions/missing/runs', {'task': 'x'})
+    assert status == 404
+    session_id = new_session(server)
+    status, _ = request(server, 'DELETE', f'/sessions/{session_id}')
+    assert status == 204
+    assert session_id not in server.sessions.sessions
+
+
+def test_usage_metrics_and_budget(server):
+    session_id = new_session(server, user='alice')
+    request(server, 'POST', f'/sessions/{session_id}/runs', {'task': 'a', 'stream': False})
+    _, body = request(server, 'GET', '/metrics')
+    metrics = dict(line.rsplit(' ', 1) for line in body.decode().splitlines() if not line.startswith('#'))
+    assert metrics['agent_user_tokens_total{user="alice",kind="input"}'] == '40'
+    assert metrics[f'agent_session_calls_total{{session="{session_id}"}}'] == '1'
+
+    server.sessions.budget = TokenBudget(max_session_tokens=60)
+    session_id = new_session(server, user='alice')
+    request(server, 'POST', f'/sessions/{session_id}/runs', {'task': 'a', 'stream': False})
+    _, body = request(server, 'POST', f'/sessions/{session_id}/runs', {'task': 'b', 'stream': False})
+    assert json.loads(body)['events'][-1]['type'] == 'budget_exceeded'
+    request(server, 'DELETE', f'/sessions/{session_id}')
+    _, body = request(server, 'GET', '/metrics')
+    assert session_id not in body.decode()
+    assert 'agent_user_runs_stopped_total{user="alice"} 1' in body.decode()
+
+
+def test_main_passes_the_token_budget(monkeypatch, tmp_path):
+    servers = []
+
+    def fake_make_server(agent_server, host, port):
+        servers.append(agent_server)
+        return SimpleNamespace(serve_forever=lambda: None)
+
+    monkeypatch.setattr(server_module, 'make_server', fake_make_server)
+    memory_db = tmp_path / 'memory.db'
+    args = ['--max-run-tokens', '1000', '--max-session-tokens', '5000', '--context-tokens', '8000']
+    server_module.main([*args, '--memory-db', str(memory_db)])
+    assert servers[0].sessions.factory.keywords['context_token_budget'] == 8000
+    assert servers[0].sessions.budget == TokenBudget(max_run_tokens=1000, max_session_tokens=5000)
+    assert servers[0].sessions.memory.backend.path == str(memory_db)
@@ -0,0 +1,33 @@
+import subprocess
+import sys
+
+from first_agent.startup import format_report, parse_importtime, top_level
+
+IMPORTTIME = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:       300 |        500 |     yaml.error
+import time:      1000 |       1500 |   yaml
+import time:       200 |       2200 | first_agent.agent
+import time:        50 |         50 | argparse
+"""
+
+
+def test_parse_importtime():
+    timings = parse_importtime(IMPORTTIME)
+    assert [(timing.module, timing.depth) for timing in timings] == [
+        ('_io', 1),
+        ('yaml.error', 2),
+        ('yaml', 1),
+        ('first_agent.agent', 0),
+        ('argparse', 0),
+    ]
+    assert top_level(timings) == {'first_agent': 2200, 'argparse': 50}
+    report = format_report(timings, limit=2)
+    assert 'Imported 5 modules in 2 ms' in report
+    assert '1.0 ms  yaml\n' in report
+
+
+def test_entry_point_imports_nothing_heavy():
+    code = 'import sys, first_agent.__main__; print(sorted({"smolagents", "gradio", "yaml"} & set(sys.modules)))'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
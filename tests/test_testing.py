@@ -0,0 +1,94 @@
+import os
+import pathlib
+from collections.abc import Iterator
+
+import pytest
+
+from tools.testing import ChangeTracker, IncrementalRunner
+
+
+def touch(path: pathlib.Path, content: str) -> None:
+    # mtime resolution can be coarse, make sure the edit is visible
+    stat = path.stat() if path.exists() else None
+    path.write_text(content)
+    if stat is not None:
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture()
+def project(tmp_path: pathlib.Path) -> pathlib.Path:
+    (tmp_path / 'pkg').mkdir()
+    (tmp_path / 'pkg' / '__init__.py').write_text('')
+    (tmp_path / 'pkg' / 'calc.py').write_text('def add(a, b):\n    return a + b\n')
+    (tmp_path / 'pkg' / 'text.py').write_text('def shout(s):\n    return s.upper()\n')
+    (tmp_path / 'tests').mkdir()
+    (tmp_path / 'tests' / 'test_calc.py').write_text(
+        'from pkg.calc import add\n\n\ndef test_add():\n    assert add(1, 2) == 3\n'
+    )
+    (tmp_path / 'tests' / 'test_text.py').write_text(
+        'from pkg import text\n\n\ndef test_shout():\n    assert text.shout("a") == "A"\n\n\n'
+        'def test_broken():\n    assert text.shout("b") == "b"\n'
+    )
+    return tmp_path
+
+
+@pytest.fixture()
+def runner(project: pathlib.Path) -> Iterator[IncrementalRunner]:
+    runner = IncrementalRunner(project, timeout=60)
+    yield runner
+    runner.close()
+
+
+def test_change_tracker_follows_imports(project: pathlib.Path) -> None:
+    tracker = ChangeTracker(project)
+    assert tracker.affected() is None
+    assert tracker.affected() == []
+    touch(project / 'pkg' / 'calc.py', 'def add(a, b):\n    return b + a\n')
+    assert tracker.affected() == ['tests/test_calc.py']
+    touch(project / 'pkg' / '__init__.py', '# package\n')
+    assert tracker.affected() == ['tests/test_calc.py', 'tests/test_text.py']
+    (project / 'tests' / 'conftest.py').write_text('')
+    assert tracker.affected() is None
+
+
+def test_runner_reports_and_reruns_affected(runner: IncrementalRunner, project: pathlib.Path) -> None:
+    report = runner.run()
+    assert report.selected is None
+    assert (report.passed, report.failed) == (2, 1)
+    assert report.failing == ['tests/test_text.py::test_broken']
+    assert 'AssertionError' in report.tracebacks['tests/test_text.py::test_broken']
+
+    # edited code is re-imported by the warm worker, the failing file is rerun until it passes
+    touch(project / 'pkg' / 'calc.py', 'def add(a, b):\n    return a - b\n')
+    report = runner.run()
+    assert report.selected == ['tests/test_calc.py', 'tests/test_text.py']
+    assert report.failing == ['tests/test_calc.py::test_add', 'tests/test_text.py::test_broken']
+
+    touch(project / 'tests' / 'test_text.py', 'def test_fixed():\n    pass\n')
+    touch(project / 'pkg' / 'calc.py', 'def add(a, b):\n    return a + b\n')
+    report = runner.run()
+    assert (report.passed, report.failed) == (2, 0)
+
+    report = runner.run()
+    assert report.selected == []
+    assert report.note
+
+
+def test_runner_full_and_single_file(runner: IncrementalRunner) -> None:
+    assert runner.run('tests/test_calc.py').passed == 1
+    runner.run()
+    assert runner.run(full=True).passed == 2
+
+
+def test_runner_keeps_third_party_modules_warm(runner: IncrementalRunner, project: pathlib.Path) -> None:
+    # a virtualenv under the project root, as uv and poetry create it
+    site_packages = project / '.venv' / 'lib' / 'python3' / 'site-packages'
+    site_packages.mkdir(parents=True)
+    (site_packages / 'thirdparty.py').write_text(
+        'import pathlib\n\npathlib.Path(__file__ + ".loads").open("a").write("x")\n'
+    )
+    (project / 'conftest.py').write_text(f'import sys\n\nsys.path.insert(0, {str(site_packages)!r})\n')
+    (project / 'tests' / 'test_dep.py').write_text('import thirdparty\n\n\ndef test_dep():\n    pass\n')
+    runner.run('tests/test_dep.py')
+    assert runner.run('tests/test_dep.py').passed == 1
+    assert (site_packages / 'thirdparty.py.loads').read_text() == 'x'
@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from smolagents import CodeAgent, tool
+from smolagents.models import ChatMessage
+
+from first_agent.models import Usage
+from first_agent.tracing import JsonlSink, OtlpSink, RingBufferSink, RunReport, Tracer, load_spans
+
+
+@tool
+def slow_echo(text: str) -> str:
+    """Echoes the text after a short pause.
+
+    Args:
+        text: The text to echo.
+    """
+    time.sleep(0.05)
+    return text
+
+
+class ScriptedModel:
+    """Streams the scripted answers token by token, like StreamingOpenAIServerModel"""
+
+    model_id = 'scripted'
+
+    def __init__(self, answers: list[str]):
+        self.answers = list(answers)
+        self.listeners = []
+
+    @contextmanager
+    def streaming_to(self, listener):
+        self.listeners.append(listener)
+        yield
+        self.listeners.remove(listener)
+
+    def __call__(self, messages, **kwargs):
+        answer = self.answers.pop(0)
+        time.sleep(0.02)
+        for listener in self.listeners:
+            listener(answer[:5])
+        time.sleep(0.02)
+        message = ChatMessage(role='assistant', content=answer)
+        message.usage = Usage(100 * len(messages), 10)
+        return message
+
+
+ANSWERS = [
+    "Thought: echo\nCode:\n```py\nprint(slow_echo(text='a'))\n```<end_code>",
+    "Thought: done\nCode:\n```py\nfinal_answer(slow_echo(text='b'))\n```<end_code>",
+]
+
+
+@pytest.fixture()
+def agent() -> CodeAgent:
+    return CodeAgent(tools=[slow_echo], model=ScriptedModel(ANSWERS), verbosity_level=0)
+
+
+def test_step_spans(agent, tmp_path):
+    ring = RingBufferSink()
+    tracer = Tracer(ring, JsonlSink(tmp_path / 'trace.jsonl'))
+    tracer.instrument(agent)
+    assert agent.run('echo twice') == 'b'
+    tracer.close()
+
+    spans = ring.spans(tracer.run_id)
+    assert [span.step for span in spans] == [1, 2]
+    for span in spans:
+        assert span.llm_calls == 1
+        assert 0.02 <= span.ttft < span.llm_time
+        assert span.tool_calls == 1
+        assert span.tool_time['slow_echo'] >= 0.05
+        assert span.code_time >= span.tool_time['slow_echo']
+        assert span.completion_tokens == 10
+    assert spans[1].context_tokens > spans[0].context_tokens
+
+    report = tracer.report()
+    assert report.steps == 2
+    assert report.completion_tokens == 20
+    assert report.max_context_tokens == spans[1].context_tokens
+    assert 'tool slow_echo' in report.format()
+
+    stored = load_spans(tmp_path / 'trace.jsonl')
+    assert RunReport.from_spans(stored) == report
+
+
+def test_agents_sharing_a_tracer_keep_their_own_runs(agent):
+    ring = RingBufferSink()
+    tracer = Tracer(ring)
+    agents = [agent, CodeAgent(tools=[slow_echo], model=ScriptedModel(ANSWERS), verbosity_level=0)]
+    for each in agents:
+        tracer.instrument(each)
+    threads = [threading.Thread(target=each.run, args=('echo twice',)) for each in agents]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(tracer.runs) == 2
+    for spans in tracer.runs.values():
+        assert [span.step for span in spans] == [1, 2]
+        assert [(span.llm_calls, span.tool_calls) for span in spans] == [(1, 1), (1, 1)]
+
+
+def test_shared_tools_are_wrapped_once(agent):
+    first, second = Tracer(RingBufferSink()), Tracer(RingBufferSink())
+    first.instrument(agent)
+    forward = slow_echo.forward
+    other = CodeAgent(tools=[slow_echo], model=ScriptedModel(ANSWERS), verbosity_level=0)
+    second.instrument(other)
+    assert slow_echo.forward is forward
+    # outside of a traced step the tool just runs
+    assert slow_echo('x') == 'x'
+
+
+def test_otlp_sink_exports_step_and_call_spans(agent):
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append((self.path, json.loads(self.rfile.read(int(self.headers['Content-Length'])))))
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        host, port = server.server_address[:2]
+        tracer = Tracer(OtlpSink(f'http://{host}:{port}/v1/traces'))
+        tracer.instrument(agent)
+        agent.run('echo twice')
+        tracer.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    spans = [
+        span
+        for _, payload in received
+        for resource in payload['resourceSpans']
+        for scope in resource['scopeSpans']
+        for span in scope['spans']
+    ]
+    assert received[0][0] == '/v1/traces'
+    names = [span['name'] for span in spans]
+    assert names.count('agent.step 1') == 1
+    assert 'tool slow_echo' in names
+    assert {span['traceId'] for span in spans} == {tracer.run_id}
+    step_ids = {span['spanId'] for span in spans if span['name'].startswith('agent.step')}
+    assert all(span['parentSpanId'] in step_ids for span in spans if 'parentSpanId' in span)
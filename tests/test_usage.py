@@ -0,0 +1,100 @@
+import pytest
+from smolagents import CodeAgent, tool
+from smolagents.memory import ActionStep, ToolCall
+from smolagents.models import ChatMessage
+
+from first_agent.Gradio_UI import stream_to_gradio
+from first_agent.models import Usage, message_usage
+from first_agent.usage import BudgetExceeded, TokenBudget, UsageLedger, UsageMeter, called_tools
+from tests.test_prompting import RecordingModel
+
+ANSWERS = [
+    "Thought: search\nCode:\n```py\nprint(lookup('a'))\n```<end_code>",
+    "Thought: again\nCode:\n```py\nprint(lookup('b'))\n```<end_code>",
+    "Thought: done\nCode:\n```py\nfinal_answer('done')\n```<end_code>",
+]
+
+
+@tool
+def lookup(query: str) -> str:
+    """Looks something up
+
+    Args:
+        query: what to look up
+    """
+    return f'found {query}'
+
+
+@pytest.fixture()
+def ledger() -> UsageLedger:
+    return UsageLedger()
+
+
+def make_agent(*callbacks) -> CodeAgent:
+    return CodeAgent(tools=[lookup], model=RecordingModel(ANSWERS), step_callbacks=list(callbacks), verbosity_level=0)
+
+
+def test_message_usage_from_raw_response():
+    message = ChatMessage(role='assistant', content='hi')
+    assert message_usage(message) is None
+    message.raw = type('Raw', (), {'usage': type('U', (), {'prompt_tokens': 5, 'completion_tokens': 2})()})()
+    assert message_usage(message) == Usage(5, 2, 0)
+
+
+def test_called_tools():
+    step = ActionStep(
+        step_number=1,
+        tool_calls=[ToolCall(name='python_interpreter', arguments='x = lookup("a")\nprint(lookup(x), len(x))', id='1')],
+    )
+    assert called_tools(step, ['lookup', 'other']) == ['lookup']
+
+
+def test_usage_is_stored_on_steps_and_aggregated(ledger):
+    agent = make_agent(UsageMeter(ledger, 's1', user='alice'))
+    assert agent.run('look things up') == 'done'
+    steps = [step for step in agent.memory.steps if isinstance(step, ActionStep)]
+    assert [step.usage for step in steps] == [Usage(100, 10, 60)] * 3
+    assert [(step.input_token_count, step.output_token_count) for step in steps] == [(100, 10)] * 3
+
+    session = ledger.session('s1')
+    assert (session.calls, session.input_tokens, session.output_tokens, session.cached_tokens) == (3, 300, 30, 180)
+    assert ledger.users['alice'].total_tokens == 330
+    assert ledger.tools['lookup'].steps == 2
+    assert ledger.tools['lookup'].input_tokens == 200
+    assert ledger.runs['alice'] == 1
+
+    metrics = ledger.metrics()
+    assert 'agent_session_tokens_total{session="s1",kind="input"} 300' in metrics
+    assert 'agent_user_tokens_total{user="alice",kind="output"} 30' in metrics
+    assert 'agent_tool_step_steps_total{tool="lookup"} 2' in metrics
+    assert 'agent_user_runs_total{user="alice"} 1' in metrics
+
+    ledger.drop_session('s1')
+    assert 'session="s1"' not in ledger.metrics()
+    assert ledger.users['alice'].total_tokens == 330
+
+
+def test_run_budget_stops_the_run(ledger):
+    agent = make_agent(UsageMeter(ledger, 's1', budget=TokenBudget(max_run_tokens=150)))
+    with pytest.raises(BudgetExceeded, match='run used 220 tokens'):
+        agent.run('look things up')
+    assert ledger.stopped['anonymous'] == 1
+
+
+def test_session_budget_counts_earlier_runs(ledger):
+    meter = UsageMeter(ledger, 's1', budget=TokenBudget(max_session_tokens=400))
+    make_agent(meter).run('first')
+    with pytest.raises(BudgetExceeded, match='session used 440 tokens'):
+        make_agent(meter).run('second')
+
+
+def test_stream_to_gradio_reads_usage_from_steps():
+    pytest.importorskip('gradio')
+    model = RecordingModel(ANSWERS)
+    # attributes of a model shared with other sessions are not read anymore
+    model.last_input_token_count = 999
+    model.last_output_token_count = 999
+    agent = CodeAgent(tools=[lookup], model=model, verbosity_level=0)
+    list(stream_to_gradio(agent, 'look things up'))
+    steps = [step for step in agent.memory.steps if isinstance(step, ActionStep)]
+    assert [step.input_token_count for step in steps] == [100, 100, 100]
@@ -0,0 +1,133 @@
+import pathlib
+import time
+
+from conftest import LocalServer, Route
+
+from first_agent.cache import DiskCache, LRUCache
+from first_agent.tools.fetch_cache import FetchCache
+from first_agent.tools.html_stream import StreamingMarkdownConverter
+from first_agent.tools.http import get_session
+from first_agent.tools.visit_webpage import VisitWebpagesTool, VisitWebpageTool
+
+PAGE = '<html><body><h1>Title</h1><p>Some text</p></body></html>'
+
+
+def test_lru_cache_evicts_least_recently_used() -> None:
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert len(cache) == 2
+
+
+def test_lru_cache_ttl() -> None:
+    cache = LRUCache(ttl=-1)
+    cache.set('a', 1)
+    assert cache.get('a', 'expired') == 'expired'
+
+
+def test_disk_cache_is_bounded(tmp_path: pathlib.Path) -> None:
+    cache = DiskCache(tmp_path, max_bytes=3000)
+    for idx in range(10):
+        cache.set(f'key{idx}', 'x' * 1000)
+    assert cache.size <= 3000
+    assert cache.get('key9') == 'x' * 1000
+    assert cache.get('key0') is None
+    assert DiskCache(tmp_path).size == cache.size
+
+
+def test_visit_webpage_serves_fresh_pages_from_cache(http_server: LocalServer) -> None:
+    http_server.routes['/page'] = Route(PAGE)
+    tool = VisitWebpageTool(cache=FetchCache(ttl=60))
+    first = tool.forward(http_server.url('/page'))
+    assert first.startswith('Title')
+    assert tool.forward(http_server.url('/page')) == first
+    assert http_server.hits('/page') == 1
+
+
+def test_visit_webpage_revalidates_stale_pages(http_server: LocalServer, tmp_path: pathlib.Path) -> None:
+    http_server.routes['/page'] = Route(PAGE, headers={'ETag': '"v1"'})
+    tool = VisitWebpageTool(cache=FetchCache(ttl=0, directory=tmp_path))
+    first = tool.forward(http_server.url('/page'))
+    second = VisitWebpageTool(cache=FetchCache(ttl=0, directory=tmp_path)).forward(http_server.url('/page'))
+    assert second == first
+    assert http_server.hits('/page') == 2
+    assert http_server.requests[-1][1]['If-None-Match'] == '"v1"'
+
+
+def test_visit_webpage_does_not_cache_errors(http_server: LocalServer) -> None:
+    http_server.routes['/missing'] = Route('gone', status=404)
+    tool = VisitWebpageTool()
+    assert tool.forward(http_server.url('/missing')).startswith('Error fetching the webpage')
+    tool.forward(http_server.url('/missing'))
+    assert http_server.hits('/missing') == 2
+
+
+def test_visit_webpages_fetches_concurrently(http_server: LocalServer) -> None:
+    for idx in range(4):
+        http_server.routes[f'/page{idx}'] = Route(f'<p>page {idx}</p>', delay=0.3)
+    tool = VisitWebpagesTool(VisitWebpageTool(), max_concurrency=4)
+    started = time.monotonic()
+    result = tool.forward([http_server.url(f'/page{idx}') for idx in range(4)])
+    assert time.monotonic() - started < 1.0
+    positions = [result.index(f'page {idx}') for idx in range(4)]
+    assert positions == sorted(positions)
+
+
+def test_visit_webpages_times_out_slow_pages(http_server: LocalServer) -> None:
+    http_server.routes['/fast'] = Route('<p>quick answer</p>')
+    http_server.routes['/slow'] = Route('<p>slow</p>', delay=1)
+    tool = VisitWebpagesTool(VisitWebpageTool(timeout=0.2))
+    result = tool.forward([http_server.url('/fast'), http_server.url('/slow')])
+    assert 'quick answer' in result
+    assert 'The request timed out' in result
+
+
+def test_visit_webpages_keeps_the_total_budget(http_server: LocalServer) -> None:
+    for idx in range(30):
+        http_server.routes[f'/page{idx}'] = Route(f'<p>page {idx} ' + 'word ' * 2000 + '</p>')
+    tool = VisitWebpagesTool(VisitWebpageTool(), max_concurrency=10, total_chars=10000)
+    result = tool.forward([http_server.url(f'/page{idx}') for idx in range(30)])
+    assert len(result) < 12000
+    assert 'page 4 ' in result
+    assert 'page 5 ' not in result
+    assert result.endswith(http_server.url('/page29'))
+    assert sum(http_server.hits(f'/page{idx}') for idx in range(30)) == 5
+
+
+def test_shared_session_is_pooled() -> None:
+    session = get_session()
+    assert session is get_session()
+    adapter = session.get_adapter('https://example.com')
+    assert adapter._pool_block
+
+
+def test_streaming_converter_skips_boilerplate() -> None:
+    html = (
+        '<html><head><style>p {}</style><script>var s = "<p>hidden</p>";</script></head><body>'
+        '<nav><a href="/">Home</a></nav><h1>Title</h1><p>Some <b>bold</b> and <a href="https://x.org">a link</a>.</p>'
+        '<ul><li>one</li><li>two</li></ul><footer>Copyright</footer></body></html>'
+    )
+    converter = StreamingMarkdownConverter(max_chars=1000)
+    for idx in range(0, len(html), 7):
+        converter.feed(html[idx : idx + 7])
+    converter.close()
+    assert converter.markdown() == '# Title\n\nSome **bold** and [a link](https://x.org).\n\n- one\n- two'
+
+
+def test_streaming_visit_stops_at_budget(http_server: LocalServer) -> None:
+    http_server.routes['/big'] = Route('<html><body>' + '<p>paragraph of text</p>' * 200_000 + '</body></html>')
+    tool = VisitWebpageTool(streaming=True)
+    result = tool.forward(http_server.url('/big'))
+    assert result.startswith('paragraph of text')
+    assert len(result) <= 10000
+
+
+def test_streaming_visit_respects_byte_cap(http_server: LocalServer) -> None:
+    http_server.routes['/big'] = Route('<html><script>' + 'x' * 100_000 + '</script><p>end</p></html>')
+    assert VisitWebpageTool(streaming=True).forward(http_server.url('/big')) == 'end'
+    tool = VisitWebpageTool(streaming=True, max_bytes=1024, cache=FetchCache(ttl=0))
+    assert tool.forward(http_server.url('/big')) == ''
@@ -0,0 +1,84 @@
+import pathlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from duckduckgo_search.exceptions import RatelimitException
+
+from first_agent.tools.web_search import DuckDuckGoSearchTool, normalize_query
+
+
+class StubDDGS:
+    def __init__(self, delay: float = 0.0, rate_limited: int = 0):
+        self.delay = delay
+        self.rate_limited = rate_limited
+        self.calls: list[str] = []
+        self._lock = threading.Lock()
+
+    def text(self, query: str, max_results: int) -> list[dict]:
+        with self._lock:
+            self.calls.append(query)
+            if self.rate_limited:
+                self.rate_limited -= 1
+                raise RatelimitException('202 Ratelimit')
+        time.sleep(self.delay)
+        return [{'title': f'About {query}', 'href': 'https://example.com', 'body': 'body'}]
+
+
+def make_tool(client: StubDDGS, **kwargs) -> DuckDuckGoSearchTool:
+    return DuckDuckGoSearchTool(client=client, min_interval=0, backoff=0.01, **kwargs)
+
+
+def test_normalize_query() -> None:
+    assert normalize_query('  Shanghai   Population ') == 'shanghai population'
+    assert normalize_query('"Shanghai  population"') == '"shanghai population"'
+    assert normalize_query('site:python.org  asyncio') == 'site:python.org asyncio'
+    assert len({normalize_query(query) for query in ('"a b"', 'a b', 'site:a.org b', 'site a org b')}) == 4
+
+
+def test_repeated_queries_are_cached() -> None:
+    client = StubDDGS()
+    tool = make_tool(client)
+    first = tool.forward('Shanghai population')
+    assert tool.forward('shanghai  population') == first
+    assert client.calls == ['Shanghai population']
+
+
+def test_persistent_tier(tmp_path: pathlib.Path) -> None:
+    client = StubDDGS()
+    make_tool(client, cache_dir=tmp_path).forward('python')
+    make_tool(client, cache_dir=tmp_path).forward('python')
+    assert len(client.calls) == 1
+
+
+def test_concurrent_identical_queries_are_coalesced() -> None:
+    client = StubDDGS(delay=0.2)
+    tool = make_tool(client)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(tool.forward, ['python'] * 4))
+    assert len(set(results)) == 1
+    assert client.calls == ['python']
+
+
+def test_rate_limit_is_retried_with_backoff() -> None:
+    client = StubDDGS(rate_limited=2)
+    tool = make_tool(client)
+    assert 'About python' in tool.forward('python')
+    assert len(client.calls) == 3
+
+
+def test_rate_limit_gives_up() -> None:
+    client = StubDDGS(rate_limited=10)
+    tool = make_tool(client, max_retries=1)
+    with pytest.raises(RatelimitException):
+        tool.forward('python')
+    assert len(client.calls) == 2
+
+
+def test_client_is_created_on_first_search() -> None:
+    tool = DuckDuckGoSearchTool()
+    assert tool.ddgs is None
+    tool.setup()
+    assert tool.ddgs is not None
+    assert tool.ratelimit_exception is RatelimitException
@@ -1,9 +1,153 @@
 # Import necessary modules
+import hashlib
+import itertools
+import mmap
+import os
+import re
+import shutil
+import tempfile
+from functools import lru_cache
 from pathlib import Path
 from typing import List
 
 from smolagents import tool
 
+from tools.patch import apply_hunks, diff_summary, parse_patch, split_lines
+
+# files over this size are described instead of returned, unless asked for explicitly
+MAX_INLINE_BYTES = 32 * 1024
+# cap for a single ranged read
+MAX_READ_BYTES = 64 * 1024
+PREVIEW_LINES = 20
+PREVIEW_LINE_CHARS = 300
+# every Nth line start is kept in the index, a read scans at most this many lines to reach its start
+INDEX_STRIDE = 256
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+_NEWLINE_RE = re.compile(b'\n')
+
+
+def _mmap(f) -> mmap.mmap:
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class LineIndex:
+    """Sparse index of line starts for a memory-mapped file"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.size = path.stat().st_size
+        self.checkpoints = [0]
+        self.lines = 0
+        if self.size == 0:
+            return
+        with path.open('rb') as f, _mmap(f) as mm:
+            newlines = _NEWLINE_RE.finditer(mm)
+            self.checkpoints.extend(m.end() for m in itertools.islice(newlines, INDEX_STRIDE - 1, None, INDEX_STRIDE))
+            for start in range(0, self.size, 1024 * 1024):
+                self.lines += mm[start : start + 1024 * 1024].count(b'\n')
+            if mm[-1:] != b'\n':
+                self.lines += 1
+
+    def read(self, start_line: int, end_line: int, max_bytes: int = MAX_READ_BYTES) -> tuple[bytes, bool]:
+        """Lines start_line..end_line (1-based, inclusive) and whether the result was cut at max_bytes"""
+        if self.size == 0 or start_line > self.lines or end_line < start_line:
+            return b'', False
+        start_line = max(start_line, 1)
+        block = min((start_line - 1) // INDEX_STRIDE, len(self.checkpoints) - 1)
+        with self.path.open('rb') as f, _mmap(f) as mm:
+            pos = self.checkpoints[block]
+            for _ in range(start_line - 1 - block * INDEX_STRIDE):
+                pos = mm.find(b'\n', pos) + 1
+            stop = pos
+            truncated = False
+            for _ in range(end_line - start_line + 1):
+                found = mm.find(b'\n', stop, pos + max_bytes)
+                if found < 0:
+                    # the line goes on past max_bytes unless the file ends first
+                    stop = min(self.size, pos + max_bytes)
+                    truncated = stop < self.size
+                    break
+                stop = found + 1
+            return mm[pos:stop], truncated
+
+
+@lru_cache(maxsize=32)
+def _cached_index(path: str, mtime_ns: int, size: int) -> LineIndex:
+    return LineIndex(Path(path))
+
+
+def line_index(path: Path) -> LineIndex:
+    """Index for the current version of the file, rebuilt when it changes"""
+    stat = path.stat()
+    return _cached_index(str(path.resolve()), stat.st_mtime_ns, stat.st_size)
+
+
+def detect_encoding(path: Path) -> str:
+    with path.open('rb') as f:
+        sample = f.read(ENCODING_SAMPLE_BYTES)
+    if sample.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    if sample.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return 'utf-16'
+    if b'\x00' in sample:
+        return 'binary'
+    try:
+        # the sample may end in the middle of a multi-byte character
+        sample.decode('utf-8')
+    except UnicodeDecodeError as e:
+        if e.start < len(sample) - 3:
+            return 'latin-1'
+    return 'utf-8'
+
+
+def _decode(data: bytes, encoding: str) -> str:
+    if encoding == 'binary':
+        encoding = 'latin-1'
+    return data.decode(encoding, errors='replace')
+
+
+def _file_info(path: Path) -> dict:
+    return {'size': path.stat().st_size, 'lines': line_index(path).lines, 'encoding': detect_encoding(path)}
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileChangedError(RuntimeError):
+    """The file is not the version the edit was based on"""
+
+
+def atomic_write(path: Path, data: bytes) -> None:
+    """Readers see either the old or the new content, never a partial write"""
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        if path.exists():
+            shutil.copymode(path, tmp_name)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def _preview(index: LineIndex, encoding: str) -> str:
+    def clip(text: str) -> str:
+        return '\n'.join(line[:PREVIEW_LINE_CHARS] for line in text.split('\n'))
+
+    if index.lines <= 2 * PREVIEW_LINES:
+        return clip(_decode(index.read(1, index.lines)[0], encoding))
+    head = _decode(index.read(1, PREVIEW_LINES)[0], encoding)
+    tail = _decode(index.read(index.lines - PREVIEW_LINES + 1, index.lines)[0], encoding)
+    omitted = index.lines - 2 * PREVIEW_LINES
+    return f'{clip(head)}... [{omitted} lines omitted] ...\n{clip(tail)}'
+
 
 @tool
 def list_directory_contents(directory: str) -> List[str]:
@@ -20,16 +164,70 @@ def list_directory_contents(directory: str) -> List[str]:
 
 
 @tool
-def get_file_contents(file_path: str) -> str:
-    """Tool that gets the contents of a file.
+def get_file_info(file_path: str) -> dict:
+    """Tool that describes a file without returning its content: size in bytes, number of lines, encoding and
+    the sha256 to pass to apply_patch.
     Args:
         file_path: The path to the file.
+    """
+    path = Path(file_path)
+    if not path.exists():
+        raise FileNotFoundError(f'File {file_path} does not exist.')
+    return {'path': file_path, **_file_info(path), 'sha256': file_sha256(path)}
+
+
+@tool
+def get_file_contents(
+    file_path: str,
+    start_line: int | None = None,
+    end_line: int | None = None,
+    byte_offset: int | None = None,
+    byte_length: int | None = None,
+    preview: bool = False,
+    full: bool = False,
+) -> str:
+    """Tool that gets the contents of a file. Large files are described instead (size, lines, encoding):
+    read them by line range, by byte range or as a preview of the first and last lines.
+    Args:
+        file_path: The path to the file.
+        start_line: (optional) First line to read, 1-based.
+        end_line: (optional) Last line to read, inclusive. Defaults to start_line + 100.
+        byte_offset: (optional) Read raw bytes starting at this offset.
+        byte_length: (optional) Number of bytes to read from byte_offset.
+        preview: (optional) Return only the first and last lines.
+        full: (optional) Return the whole file even if it is large.
     Returns:
-        str: The contents of the file.
+        str: The contents of the file, or of the requested part.
     """
     path = Path(file_path)
     if not path.exists():
         raise FileNotFoundError(f'File {file_path} does not exist.')
+
+    if start_line is not None or end_line is not None:
+        start_line = start_line or 1
+        end_line = end_line if end_line is not None else start_line + 100
+        data, truncated = line_index(path).read(start_line, end_line)
+        text = _decode(data, detect_encoding(path))
+        return f'{text}\n... [truncated at {MAX_READ_BYTES} bytes]' if truncated else text
+
+    if byte_offset is not None or byte_length is not None:
+        byte_offset = byte_offset or 0
+        length = min(byte_length if byte_length is not None else MAX_READ_BYTES, MAX_READ_BYTES)
+        with path.open('rb') as f:
+            f.seek(byte_offset)
+            data = f.read(length)
+        return _decode(data, detect_encoding(path))
+
+    if preview:
+        return _preview(line_index(path), detect_encoding(path))
+
+    if path.stat().st_size > MAX_INLINE_BYTES and not full:
+        info = _file_info(path)
+        return (
+            f'File {file_path} is too large to return in full: {info["size"]} bytes, {info["lines"]} lines, '
+            f'encoding {info["encoding"]}. Use start_line/end_line, byte_offset/byte_length, preview=True '
+            'or full=True.'
+        )
     return path.read_text()
 
 
@@ -40,5 +238,48 @@ def write_content_to_file(file_path: str, content: str) -> None:
         file_path: The path to the file.
         content: The content to write to the file.
     """
+    atomic_write(Path(file_path), content.encode())
+
+
+@tool
+def apply_patch(file_path: str, patch: str, expected_sha256: str | None = None) -> str:
+    """Tool that edits a file with a patch instead of rewriting it. The patch is either a unified diff
+    (@@ -12,3 +12,4 @@ hunks) or one or more blocks like:
+    <<<<<<< SEARCH
+    exact lines to replace
+    =======
+    new lines
+    >>>>>>> REPLACE
+    Args:
+        file_path: The path to the file.
+        patch: The unified diff or SEARCH/REPLACE blocks.
+        expected_sha256: (optional) sha256 (or its prefix) of the file the patch was made for, from get_file_info
+            or a previous apply_patch. The edit is refused if the file has changed since.
+    Returns:
+        str: Summary of the applied change with a short diff and the new sha256.
+    """
     path = Path(file_path)
-    path.write_text(content)
+    if not path.exists():
+        raise FileNotFoundError(f'File {file_path} does not exist.')
+    data = path.read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    if expected_sha256 and not digest.startswith(expected_sha256.lower()):
+        raise FileChangedError(f'{file_path} has changed (sha256 {digest[:16]}), read it again before editing.')
+
+    text = data.decode()
+    before, endings = split_lines(text)
+    # untouched lines keep their own ending, new ones get the most common one
+    newline = '\r\n' if endings.count('\r\n') > endings.count('\n') else '\n'
+    last_ending = endings[-1] if endings else newline
+    after = apply_hunks(before, parse_patch(patch), endings, newline)
+    if after:
+        endings[:-1] = [ending or newline for ending in endings[:-1]]
+        endings[-1] = last_ending
+    new_data = ''.join(line + ending for line, ending in zip(after, endings)).encode()
+
+    # someone else may have written the file while the patch was applied
+    if file_sha256(path) != digest:
+        raise FileChangedError(f'{file_path} was modified during the edit, read it again before editing.')
+    atomic_write(path, new_data)
+    new_digest = hashlib.sha256(new_data).hexdigest()
+    return f'{diff_summary(file_path, before, after)}\nsha256: {new_digest[:16]}'
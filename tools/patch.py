@@ -0,0 +1,150 @@
+import difflib
+import re
+from dataclasses import dataclass
+
+MAX_DIFF_LINES = 40
+
+_HUNK_HEADER_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+\d+(?:,(\d+))? @@')
+_SEARCH_REPLACE_RE = re.compile(r'^<{5,} SEARCH\n(.*?)^={5,}\n(.*?)^>{5,} REPLACE$', re.MULTILINE | re.DOTALL)
+
+
+class PatchError(ValueError):
+    pass
+
+
+@dataclass
+class Hunk:
+    old: list[str]
+    new: list[str]
+    # 1-based line of the hunk in the original file, None for search/replace blocks
+    old_start: int | None = None
+
+
+def split_lines(text: str) -> tuple[list[str], list[str]]:
+    """Lines of a text and their endings ('\n', '\r\n' or '' for a last line without one).
+
+    Only '\n' ends a line: `str.splitlines` also breaks on form feeds and Unicode separators, which belong to the line.
+    """
+    *parts, last = text.split('\n')
+    lines = [part.removesuffix('\r') for part in parts]
+    endings = ['\r\n' if part.endswith('\r') else '\n' for part in parts]
+    if last:
+        lines.append(last)
+        endings.append('')
+    return lines, endings
+
+
+def parse_unified_diff(patch: str) -> list[Hunk]:
+    hunks: list[Hunk] = []
+    current = None
+    # lines of the hunk header counts not seen yet
+    old_left = new_left = 0
+    lines, _ = split_lines(patch)
+    for idx, line in enumerate(lines):
+        header = _HUNK_HEADER_RE.match(line)
+        following = lines[idx + 1] if idx + 1 < len(lines) else ''
+        if header:
+            current = Hunk([], [], int(header.group(1)))
+            hunks.append(current)
+            old_left, new_left = (int(count) if count is not None else 1 for count in header.group(2, 3))
+        elif current is None or line.startswith('\\'):
+            continue
+        elif old_left <= 0 and new_left <= 0 and line.startswith('--- ') and following.startswith('+++ '):
+            # file header of the next file, only a single file is patched; inside a hunk these lines are edits
+            # of lines starting with '--' and '++'
+            current = None
+        elif line.startswith('-'):
+            current.old.append(line[1:])
+            old_left -= 1
+        elif line.startswith('+'):
+            current.new.append(line[1:])
+            new_left -= 1
+        else:
+            # context line, editors and models often strip the leading space of blank ones
+            line = line.removeprefix(' ')
+            current.old.append(line)
+            current.new.append(line)
+            old_left -= 1
+            new_left -= 1
+    return hunks
+
+
+def parse_search_replace(patch: str) -> list[Hunk]:
+    return [
+        Hunk(split_lines(search)[0], split_lines(replace)[0]) for search, replace in _SEARCH_REPLACE_RE.findall(patch)
+    ]
+
+
+def parse_patch(patch: str) -> list[Hunk]:
+    """Hunks of a unified diff or of SEARCH/REPLACE blocks"""
+    hunks = parse_search_replace(patch)
+    if not hunks:
+        hunks = parse_unified_diff(patch)
+    if not hunks:
+        raise PatchError('Patch has no hunks: expected a unified diff or <<<<<<< SEARCH/=======/>>>>>>> REPLACE blocks')
+    return hunks
+
+
+def _find(lines: list[str], block: list[str], start: int = 0) -> list[int]:
+    """Positions where `block` occurs, falling back to ignoring trailing whitespace"""
+    size = len(block)
+    for normalize in (lambda line: line, str.rstrip):
+        wanted = [normalize(line) for line in block]
+        found = [
+            idx
+            for idx in range(start, len(lines) - size + 1)
+            if normalize(lines[idx]) == wanted[0] and [normalize(line) for line in lines[idx : idx + size]] == wanted
+        ]
+        if found:
+            return found
+    return []
+
+
+def apply_hunks(
+    lines: list[str], hunks: list[Hunk], endings: list[str] | None = None, newline: str = '\n'
+) -> list[str]:
+    """Apply hunks in order to lines without line endings.
+
+    `endings` of the lines are updated in place: replaced lines keep theirs, added ones get `newline`.
+    """
+    result = list(lines)
+    # unified diff line numbers refer to the original file, edits so far shift them
+    shift = 0
+    cursor = 0
+    for number, hunk in enumerate(hunks, 1):
+        if hunk.old == hunk.new:
+            raise PatchError(f'Hunk {number} changes nothing: it has no added or removed lines')
+        if hunk.old_start is None:
+            if not hunk.old:
+                raise PatchError(f'Hunk {number}: SEARCH block is empty')
+            found = _find(result, hunk.old)
+            if len(found) > 1:
+                raise PatchError(f'Hunk {number}: SEARCH block matches {len(found)} places, add surrounding lines')
+        elif not hunk.old:
+            # pure insertion after old_start
+            found = [min(max(hunk.old_start + shift, 0), len(result))]
+        else:
+            expected = hunk.old_start - 1 + shift
+            found = sorted(_find(result, hunk.old, cursor), key=lambda idx: abs(idx - expected))
+        if not found:
+            preview = '\n'.join(hunk.old[:3])
+            raise PatchError(f'Hunk {number}: lines to replace not found in the file:\n{preview}')
+        idx = found[0]
+        result[idx : idx + len(hunk.old)] = hunk.new
+        if endings is not None:
+            replaced = endings[idx : idx + len(hunk.old)] or [newline]
+            body = (replaced[:-1] + [newline] * len(hunk.new))[: max(len(hunk.new) - 1, 0)]
+            endings[idx : idx + len(hunk.old)] = [*body, replaced[-1]] if hunk.new else []
+        shift += len(hunk.new) - len(hunk.old)
+        cursor = idx + len(hunk.new)
+    return result
+
+
+def diff_summary(path: str, before: list[str], after: list[str], max_lines: int = MAX_DIFF_LINES) -> str:
+    diff = list(difflib.unified_diff(before, after, n=1, lineterm=''))[2:]
+    added = sum(1 for line in diff if line.startswith('+'))
+    removed = sum(1 for line in diff if line.startswith('-'))
+    hunks = sum(1 for line in diff if line.startswith('@@'))
+    if len(diff) > max_lines:
+        diff = [*diff[:max_lines], f'... [{len(diff) - max_lines} more diff lines]']
+    return '\n'.join([f'{path}: {hunks} hunk(s), +{added} -{removed} lines', *diff])
@@ -0,0 +1,354 @@
+import fnmatch
+import os
+import re
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+
+from smolagents import tool
+
+ALWAYS_IGNORED = {'.git', '.venv', 'venv', '__pycache__', 'node_modules', '.mypy_cache', '.pytest_cache', '.ruff_cache'}
+# larger files are listed but not searched
+MAX_INDEX_BYTES = 1024 * 1024
+# a walk is reused for this long, so a burst of calls does not stat the whole tree each time
+STALE_AFTER = 1.0
+MAX_LINE_CHARS = 200
+
+
+def _glob_to_regex(pattern: str) -> str:
+    out = []
+    idx = 0
+    while idx < len(pattern):
+        char = pattern[idx]
+        if pattern.startswith('**/', idx):
+            out.append('(?:.*/)?')
+            idx += 3
+            continue
+        if pattern.startswith('**', idx):
+            out.append('.*')
+            idx += 2
+            continue
+        if char == '*':
+            out.append('[^/]*')
+        elif char == '?':
+            out.append('[^/]')
+        elif char == '[':
+            end = pattern.find(']', idx + 1)
+            if end < 0:
+                out.append(re.escape(char))
+            else:
+                out.append(pattern[idx : end + 1].replace('[!', '[^', 1))
+                idx = end
+        else:
+            out.append(re.escape(char))
+        idx += 1
+    return ''.join(out)
+
+
+@dataclass
+class IgnoreRule:
+    base: str
+    regex: re.Pattern
+    negate: bool
+    dir_only: bool
+
+
+def parse_gitignore(text: str, base: str = '') -> list[IgnoreRule]:
+    """Rules of one .gitignore, `base` is its directory relative to the indexed root"""
+    rules = []
+    for line in text.splitlines():
+        line = line.rstrip()
+        if not line or line.startswith('#'):
+            continue
+        negate = line.startswith('!')
+        line = line.removeprefix('!')
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        # a pattern with a slash is relative to the .gitignore, otherwise it matches a name at any depth
+        anchored = '/' in line
+        regex = _glob_to_regex(line.lstrip('/'))
+        if not anchored:
+            regex = f'(?:.*/)?{regex}'
+        rules.append(IgnoreRule(base, re.compile(f'{regex}$'), negate, dir_only))
+    return rules
+
+
+def is_ignored(rules: list[IgnoreRule], rel_path: str, is_dir: bool) -> bool:
+    ignored = False
+    for rule in rules:
+        if rule.dir_only and not is_dir:
+            continue
+        if rule.base:
+            if not rel_path.startswith(rule.base + '/'):
+                continue
+            path = rel_path[len(rule.base) + 1 :]
+        else:
+            path = rel_path
+        if rule.regex.match(path):
+            ignored = not rule.negate
+    return ignored
+
+
+_WORD_RE = re.compile(rb'\w{3,}')
+
+
+def _trigrams(data: bytes) -> set[bytes]:
+    """Trigrams inside identifier-like runs; distinct words are few, so this is much cheaper than every trigram"""
+    return {word[idx : idx + 3] for word in set(_WORD_RE.findall(data)) for idx in range(len(word) - 2)}
+
+
+def required_literals(pattern: str) -> list[str]:
+    """Literal fragments every match of the regex has to contain, empty when that is not easy to tell"""
+    if '|' in pattern or re.search(r'\)[?*{]', pattern):
+        return []
+    pattern = re.sub(r'\\.', '\0', pattern)
+    if '(?' in pattern:
+        # lookarounds, flags and named groups: their text is not a literal of the match
+        return []
+    pattern = re.sub(r'\[[^\]]*\]', '\0', pattern)
+    literals = []
+    for match in re.finditer(r'[^\0.^$*+?{}()]+', pattern):
+        literal = match.group()
+        if pattern[match.end() : match.end() + 1] in ('?', '*', '{'):
+            literal = literal[:-1]
+        if len(literal) >= 3:
+            literals.append(literal)
+    return literals
+
+
+@dataclass
+class FileEntry:
+    mtime_ns: int
+    size: int
+    # id in the trigram postings, None until the content is indexed
+    file_id: int | None = None
+
+
+class RepoIndex:
+    """File list and trigram index of a directory tree, refreshed by mtime.
+
+    Postings map a lowercased trigram to the ids of files containing it. A changed file gets a new id,
+    ids of old versions are filtered out on lookup and dropped when they pile up.
+    """
+
+    def __init__(self, root: Path | str):
+        self.root = Path(root).resolve()
+        self.files: dict[str, FileEntry] = {}
+        self.dirs: set[str] = set()
+        self.postings: dict[bytes, array] = {}
+        self.paths: list[str | None] = []
+        self.dead = 0
+        self.refreshed_at = 0.0
+        self._lock = threading.RLock()
+
+    def walk(self) -> tuple[dict[str, os.stat_result], set[str]]:
+        files, dirs = {}, set()
+        stack: list[tuple[Path, list[IgnoreRule]]] = [(self.root, [])]
+        while stack:
+            directory, rules = stack.pop()
+            rel_dir = directory.relative_to(self.root).as_posix()
+            rel_dir = '' if rel_dir == '.' else rel_dir
+            gitignore = directory / '.gitignore'
+            if gitignore.is_file():
+                rules = rules + parse_gitignore(gitignore.read_text(errors='replace'), rel_dir)
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                rel = f'{rel_dir}/{entry.name}' if rel_dir else entry.name
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if entry.name in ALWAYS_IGNORED or is_ignored(rules, rel, is_dir):
+                    continue
+                if is_dir:
+                    dirs.add(rel)
+                    stack.append((Path(entry.path), rules))
+                elif entry.is_file():
+                    files[rel] = entry.stat()
+        return files, dirs
+
+    def refresh(self, force: bool = False) -> None:
+        with self._lock:
+            if not force and time.monotonic() - self.refreshed_at < STALE_AFTER:
+                return
+            found, self.dirs = self.walk()
+            for rel in self.files.keys() - found.keys():
+                self._forget(self.files.pop(rel))
+            for rel, stat in found.items():
+                entry = self.files.get(rel)
+                if entry is None or entry.mtime_ns != stat.st_mtime_ns or entry.size != stat.st_size:
+                    if entry is not None:
+                        self._forget(entry)
+                    self.files[rel] = FileEntry(stat.st_mtime_ns, stat.st_size)
+            self.refreshed_at = time.monotonic()
+
+    def _forget(self, entry: FileEntry) -> None:
+        if entry.file_id is not None:
+            self.paths[entry.file_id] = None
+            self.dead += 1
+
+    def _index_content(self, rel: str, entry: FileEntry) -> None:
+        try:
+            data = (self.root / rel).read_bytes()
+        except OSError:
+            data = b''
+        file_id = len(self.paths)
+        self.paths.append(rel)
+        entry.file_id = file_id
+        if b'\0' in data[:8192]:
+            return
+        for gram in _trigrams(data.lower()):
+            postings = self.postings.get(gram)
+            if postings is None:
+                postings = self.postings[gram] = array('I')
+            postings.append(file_id)
+
+    def _compact(self) -> None:
+        alive = {file_id for file_id, path in enumerate(self.paths) if path is not None}
+        for gram, postings in list(self.postings.items()):
+            kept = array('I', (file_id for file_id in postings if file_id in alive))
+            if kept:
+                self.postings[gram] = kept
+            else:
+                del self.postings[gram]
+        self.dead = 0
+
+    def update_content(self) -> None:
+        """Index the content of new and changed files"""
+        with self._lock:
+            for rel, entry in self.files.items():
+                if entry.file_id is None and entry.size <= MAX_INDEX_BYTES:
+                    self._index_content(rel, entry)
+            if self.dead > len(self.files):
+                self._compact()
+
+    def candidates(self, literals: list[str]) -> list[str]:
+        """Indexed files that may contain all literals"""
+        # the index lowercases ASCII only, other literals can't narrow the search down
+        grams = {gram for literal in literals if literal.isascii() for gram in _trigrams(literal.lower().encode())}
+        with self._lock:
+            if not grams:
+                return [rel for rel, entry in self.files.items() if entry.file_id is not None]
+            postings = sorted((self.postings.get(gram, array('I')) for gram in grams), key=len)
+            ids = set(postings[0])
+            for other in postings[1:]:
+                if not ids:
+                    break
+                ids.intersection_update(other)
+            return [self.paths[file_id] for file_id in ids if self.paths[file_id] is not None]
+
+    def entries(self, prefix: str = '') -> list[str]:
+        """Files and directories (with a trailing slash) under `prefix`, sorted"""
+        with self._lock:
+            names = [*self.files, *(f'{rel}/' for rel in self.dirs)]
+        if prefix:
+            names = [name[len(prefix) + 1 :] for name in names if name.startswith(prefix + '/')]
+        return sorted(name for name in names if name)
+
+    def search(
+        self,
+        query: str,
+        prefix: str = '',
+        pattern: str | None = None,
+        regex: bool = False,
+        case_sensitive: bool = False,
+        max_results: int = 50,
+    ) -> tuple[list[str], bool]:
+        self.refresh()
+        self.update_content()
+        flags = 0 if case_sensitive else re.IGNORECASE
+        matcher = re.compile(query if regex else re.escape(query), flags)
+        literals = required_literals(query) if regex else [query]
+        matches = []
+        for rel in sorted(self.candidates(literals)):
+            if prefix and not rel.startswith(prefix + '/'):
+                continue
+            shown = rel[len(prefix) + 1 :] if prefix else rel
+            if pattern and not fnmatch.fnmatch(shown, pattern):
+                continue
+            try:
+                text = (self.root / rel).read_text(errors='replace')
+            except OSError:
+                continue
+            for lineno, line in enumerate(text.splitlines(), 1):
+                if matcher.search(line):
+                    if len(matches) == max_results:
+                        return matches, True
+                    matches.append(f'{shown}:{lineno}: {line.strip()[:MAX_LINE_CHARS]}')
+        return matches, False
+
+
+_indexes: dict[Path, RepoIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(directory: Path | str) -> tuple[RepoIndex, str]:
+    """Index covering `directory` and the directory's path inside it; indexes of parent directories are reused"""
+    path = Path(directory).resolve()
+    if not path.is_dir():
+        raise ValueError(f'Directory {directory} does not exist.')
+    with _indexes_lock:
+        for root, index in _indexes.items():
+            if path == root or root in path.parents:
+                prefix = path.relative_to(root).as_posix()
+                return index, '' if prefix == '.' else prefix
+        index = _indexes[path] = RepoIndex(path)
+        return index, ''
+
+
+@tool
+def list_files(
+    directory: str = '.',
+    pattern: str | None = None,
+    max_depth: int | None = None,
+    offset: int = 0,
+    limit: int = 200,
+) -> dict:
+    """Tool that lists files recursively, skipping what .gitignore ignores and .git/.venv/__pycache__.
+    Args:
+        directory: The directory to list.
+        pattern: (optional) fnmatch-style filter on the relative path, e.g. '*.py' or 'tests/*'. Directories are
+            only listed when there is no pattern.
+        max_depth: (optional) How deep to go, 1 lists only the direct children.
+        offset: (optional) Skip this many entries, for pagination.
+        limit: (optional) Return at most this many entries.
+    Returns:
+        dict: 'entries' (directories end with '/'), 'total' number of entries and 'next_offset' if there are more
+    """
+    index, prefix = get_index(directory)
+    index.refresh()
+    entries = index.entries(prefix)
+    if pattern:
+        entries = [entry for entry in entries if not entry.endswith('/') and fnmatch.fnmatch(entry, pattern)]
+    if max_depth is not None:
+        entries = [entry for entry in entries if entry.rstrip('/').count('/') < max_depth]
+    page = entries[offset : offset + limit]
+    next_offset = offset + limit if offset + limit < len(entries) else None
+    return {'entries': page, 'total': len(entries), 'next_offset': next_offset}
+
+
+@tool
+def search_code(
+    query: str,
+    directory: str = '.',
+    pattern: str | None = None,
+    regex: bool = False,
+    case_sensitive: bool = False,
+    max_results: int = 50,
+) -> dict:
+    """Tool that searches file contents under a directory, like grep -rn, using an index kept between calls.
+    Args:
+        query: The text to look for, or a regular expression if regex is True.
+        directory: (optional) The directory to search in.
+        pattern: (optional) fnmatch-style filter on the relative path, e.g. '*.py'.
+        regex: (optional) Treat query as a regular expression.
+        case_sensitive: (optional) Match case.
+        max_results: (optional) Maximum number of matching lines to return.
+    Returns:
+        dict: 'matches' as 'path:line: text' strings and 'truncated' if there were more
+    """
+    index, prefix = get_index(directory)
+    matches, truncated = index.search(query, prefix, pattern, regex, case_sensitive, max_results)
+    return {'matches': matches, 'truncated': truncated}
@@ -1,21 +1,331 @@
-import subprocess
+import ast
+import atexit
+import io
+import logging
+import multiprocessing
+import os
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+from contextlib import redirect_stderr, redirect_stdout
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
 
 from smolagents import tool
 
+log = logging.getLogger('testing')
+
+DEFAULT_TIMEOUT = 300
+MAX_TRACEBACKS = 10
+MAX_TRACEBACK_CHARS = 2000
+# interrupted, internal error, usage error: the run itself did not work
+PYTEST_BROKEN_EXIT_CODES = {2, 3, 4}
+SKIP_DIRS = {'__pycache__', 'node_modules', 'venv'}
+# a change in any of these can affect every test
+CONFIG_FILES = {'conftest.py', 'pyproject.toml', 'setup.cfg', 'pytest.ini', 'tox.ini'}
+
+
+@dataclass
+class RunReport:
+    passed: int = 0
+    failed: int = 0
+    errors: int = 0
+    skipped: int = 0
+    duration: float = 0.0
+    # test files that were run, None for the full suite
+    selected: list[str] | None = None
+    failing: list[str] = field(default_factory=list)
+    tracebacks: dict[str, str] = field(default_factory=dict)
+    exit_code: int | None = None
+    note: str = ''
+
+
+def _truncate(text: str, limit: int = MAX_TRACEBACK_CHARS) -> str:
+    # the end of a traceback is the useful part
+    if len(text) <= limit:
+        return text
+    return '...\n' + text[-limit:]
+
+
+class _Collector:
+    """pytest plugin that gathers results instead of printing them"""
+
+    def __init__(self):
+        self.counts: Counter[str] = Counter()
+        self.failing: list[str] = []
+        self.tracebacks: dict[str, str] = {}
+
+    def _fail(self, nodeid: str, kind: str, longrepr: str) -> None:
+        self.counts[kind] += 1
+        self.failing.append(nodeid)
+        if len(self.tracebacks) < MAX_TRACEBACKS:
+            self.tracebacks[nodeid] = _truncate(longrepr)
+
+    def pytest_runtest_logreport(self, report):
+        if report.failed:
+            self._fail(report.nodeid, 'failed' if report.when == 'call' else 'errors', report.longreprtext)
+        elif report.skipped:
+            self.counts['skipped'] += 1
+        elif report.when == 'call':
+            self.counts['passed'] += 1
+
+    def pytest_collectreport(self, report):
+        if report.failed:
+            self._fail(report.nodeid, 'errors', report.longreprtext)
+
+
+def _installed_prefixes() -> tuple[str, ...]:
+    paths = sysconfig.get_paths()
+    # a virtualenv of the project lives under its root
+    prefixes = {paths['purelib'], paths['platlib'], sys.prefix, sys.base_prefix, sys.exec_prefix}
+    return tuple(os.path.join(prefix, '') for prefix in prefixes)
+
+
+def _is_installed(path: str) -> bool:
+    parts = Path(path).parts
+    return path.startswith(_installed_prefixes()) or 'site-packages' in parts or 'dist-packages' in parts
+
+
+def _purge_modules(root: Path) -> None:
+    """Forget project modules so the next run imports the edited code, third-party imports stay warm"""
+    prefix = str(root) + os.sep
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None)
+        if path and path.startswith(prefix) and name != __name__ and not _is_installed(path):
+            del sys.modules[name]
+
+
+def _worker_main(conn, root: str) -> None:
+    os.chdir(root)
+    sys.path.insert(0, root)
+    import pytest
+
+    while True:
+        try:
+            args = conn.recv()
+        except EOFError:
+            return
+        if args is None:
+            return
+        _purge_modules(Path(root))
+        collector = _Collector()
+        output = io.StringIO()
+        started = time.monotonic()
+        note = ''
+        try:
+            # the terminal report is dropped, results come from the collector
+            with redirect_stdout(output), redirect_stderr(output):
+                exit_code = int(pytest.main([*args, '--rootdir', root, '--capture=fd', '-q'], plugins=[collector]))
+            if exit_code in PYTEST_BROKEN_EXIT_CODES:
+                note = _truncate(output.getvalue())
+        except Exception as e:
+            exit_code, note = None, f'{type(e).__name__}: {e}'
+        conn.send(
+            {
+                **collector.counts,
+                'failing': collector.failing,
+                'tracebacks': collector.tracebacks,
+                'exit_code': exit_code,
+                'duration': round(time.monotonic() - started, 3),
+                'note': note,
+            }
+        )
+
+
+class PytestWorker:
+    """Long-lived pytest process: interpreter startup and third-party imports are paid once"""
+
+    def __init__(self, root: Path | str = '.', timeout: float = DEFAULT_TIMEOUT):
+        self.root = Path(root).resolve()
+        self.timeout = timeout
+        self._ctx = multiprocessing.get_context('spawn')
+        self._process = None
+        self._conn = None
+
+    def start(self) -> None:
+        self._conn, child_conn = self._ctx.Pipe()
+        # not a daemon: tests may start processes of their own
+        self._process = self._ctx.Process(target=_worker_main, args=(child_conn, str(self.root)), name='pytest-worker')
+        self._process.start()
+        child_conn.close()
+
+    def run(self, args: list[str]) -> dict:
+        if self._process is None or not self._process.is_alive():
+            self.start()
+        try:
+            self._conn.send(args)
+            if self._conn.poll(self.timeout):
+                return self._conn.recv()
+            note = f'Tests did not finish in {self.timeout}s, worker restarted'
+        except (EOFError, OSError) as e:
+            note = f'Test worker died: {type(e).__name__}: {e}'
+        self.close()
+        return {'errors': 1, 'exit_code': None, 'note': note}
+
+    def close(self) -> None:
+        if self._process is None:
+            return
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self._process.join(1)
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        self._conn.close()
+        self._process = self._conn = None
+
+
+def _module_name(root: Path, path: Path) -> str:
+    parts = list(path.relative_to(root).with_suffix('').parts)
+    if parts[-1] == '__init__':
+        parts.pop()
+    return '.'.join(parts)
+
+
+def _is_test_file(path: Path) -> bool:
+    return path.name.startswith('test_') or path.name.endswith('_test.py')
+
+
+class ChangeTracker:
+    """Picks the test files affected by edits since the previous run, following imports inside the project"""
+
+    def __init__(self, root: Path | str = '.'):
+        self.root = Path(root).resolve()
+        self.snapshot: dict[Path, int] | None = None
+        self._imports: dict[Path, tuple[int, list[str]]] = {}
+
+    def scan(self) -> dict[Path, int]:
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [name for name in dirnames if not name.startswith('.') and name not in SKIP_DIRS]
+            for name in filenames:
+                if name.endswith('.py') or name in CONFIG_FILES:
+                    path = Path(dirpath) / name
+                    files[path] = path.stat().st_mtime_ns
+        return files
+
+    def imports(self, path: Path, mtime: int) -> list[str]:
+        """Candidate module names imported by `path`, parsed once per mtime"""
+        cached = self._imports.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            tree = ast.parse(path.read_bytes(), str(path))
+        except (SyntaxError, ValueError, OSError):
+            tree = ast.Module(body=[], type_ignores=[])
+        package = _module_name(self.root, path).split('.')
+        if path.name != '__init__.py':
+            package.pop()
+        names = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                base = package[: len(package) - node.level + 1] if node.level else []
+                module = '.'.join([*base, *(node.module.split('.') if node.module else [])])
+                names.append(module)
+                names.extend(f'{module}.{alias.name}' for alias in node.names)
+        self._imports[path] = (mtime, names)
+        return names
+
+    def _dependencies(self, path: Path, files: dict[Path, int], modules: dict[str, Path]) -> set[Path]:
+        known = set(modules.values())
+        seen = {path}
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            if current not in files:
+                continue
+            for name in self.imports(current, files[current]):
+                parts = name.split('.')
+                # `import a.b` executes a/__init__.py too, modules next to the file cover `from conftest import ...`
+                candidates = [modules.get('.'.join(parts[:idx])) for idx in range(1, len(parts) + 1)]
+                sibling = current.parent.joinpath(*parts).with_suffix('.py')
+                candidates.append(sibling if sibling in known else None)
+                for dep in candidates:
+                    if dep is not None and dep not in seen:
+                        seen.add(dep)
+                        stack.append(dep)
+        return seen
+
+    def affected(self, also: set[str] | None = None) -> list[str] | None:
+        """Test files to rerun, None when the whole suite has to run. Updates the snapshot"""
+        files = self.scan()
+        previous, self.snapshot = self.snapshot, files
+        if previous is None:
+            return None
+        changed = {path for path in files.keys() | previous.keys() if files.get(path) != previous.get(path)}
+        if any(path.name in CONFIG_FILES for path in changed):
+            return None
+        modules = {
+            _module_name(self.root, path): path for path in files.keys() | previous.keys() if path.suffix == '.py'
+        }
+        selected = []
+        for path in sorted(files):
+            if not _is_test_file(path):
+                continue
+            rel = str(path.relative_to(self.root))
+            if rel in (also or ()) or changed & self._dependencies(path, files, modules):
+                selected.append(rel)
+        return selected
+
+
+class IncrementalRunner:
+    """Runs only what changed, on a warm worker"""
+
+    def __init__(self, root: Path | str = '.', timeout: float = DEFAULT_TIMEOUT):
+        self.worker = PytestWorker(root, timeout=timeout)
+        self.tracker = ChangeTracker(root)
+        self.failed_files: set[str] = set()
+        self._lock = threading.Lock()
+
+    def run(self, test_file: str | None = None, full: bool = False) -> RunReport:
+        with self._lock:
+            if test_file:
+                return self._run([test_file], [test_file])
+            selected = self.tracker.affected(also=self.failed_files)
+            if full:
+                selected = None
+            if selected == []:
+                return RunReport(selected=[], exit_code=0, note='No tests affected by changes since the last run')
+            report = self._run(selected or [], selected)
+            failed = {nodeid.split('::')[0] for nodeid in report.failing}
+            self.failed_files = failed if selected is None else (self.failed_files - set(selected)) | failed
+            return report
+
+    def _run(self, args: list[str], selected: list[str] | None) -> RunReport:
+        result = self.worker.run(args)
+        return RunReport(selected=selected, **result)
+
+    def close(self) -> None:
+        with self._lock:
+            self.worker.close()
+
+
+_runner: IncrementalRunner | None = None
+
+
+def get_runner() -> IncrementalRunner:
+    global _runner
+    if _runner is None:
+        _runner = IncrementalRunner()
+        atexit.register(_runner.close)
+    return _runner
+
 
 @tool
-def run_tests(test_file: str | None) -> str:
-    """Run tests using pytest
+def run_tests(test_file: str | None = None, full: bool = False) -> dict:
+    """Run tests using pytest. Without arguments only the tests affected by files changed since the previous call
+    (and the ones that failed last time) are run.
 
     Args:
        test_file: (optional) The test file to run.
+       full: (optional) Run the whole test suite.
+    Returns:
+        dict: counts of passed/failed/errors/skipped, failing test ids and their (truncated) tracebacks
     """
-
-    # run and capture stdout and stderr
-    cmd = 'uv run pytest'
-    if test_file:
-        cmd += f' {test_file}'
-
-    result = subprocess.run(cmd, shell=True, capture_output=True)
-    result_string = f'Out: {result.stdout.decode()}\nErr: {result.stderr.decode()}'
-    return result_string
+    return asdict(get_runner().run(test_file, full=full))